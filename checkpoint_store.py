@@ -0,0 +1,89 @@
+import threading
+from datetime import date, timedelta
+
+from query_planner import TAMANHO_PAGINA, planejar_unidades, dias_do_periodo
+
+# Dias mais recentes que são consultados de novo mesmo já concluídos, para pegar XMLs que chegam com atraso
+DIAS_ATRASO = 2
+
+
+class CheckpointStore:
+    """Progresso persistente das consultas por CNPJ, tipo de documento e data.
+
+    Para cada data guarda as páginas lidas, a quantidade de XMLs, o último skip
+    e se a data foi concluída. O planejamento pula as datas concluídas fora da
+    janela de atraso e retoma as demais a partir do último skip conhecido.
+
+    Uma página só entra no progresso depois que todos os seus XMLs foram gravados
+    e registrados, e o progresso avança apenas sobre páginas contínuas desde o
+    início da sequência: se uma página do meio falhar, as seguintes não contam e
+    a data volta a ser consultada a partir dela.
+    """
+
+    def __init__(self, db, dias_atraso=DIAS_ATRASO):
+        self.db = db
+        self.dias_atraso = dias_atraso
+        self._lock = threading.Lock()
+        # Por sequência de páginas: skip inicial, skips processados e a última página (skip, quantidade)
+        self._sequencias = {}
+
+    @staticmethod
+    def _sequencia(unidade):
+        return unidade.cnpj, unidade.data_inicio, unidade.data_fim, unidade.xml_type
+
+    def planejar(self, cnpj, data_inicio, data_fim, xml_types, hoje=None):
+        """Planeja as unidades de trabalho do período levando em conta os checkpoints."""
+        hoje = hoje or date.today()
+        inicio_reconsulta = (hoje - timedelta(days=self.dias_atraso)).isoformat()
+        checkpoints = {xml_type: self.db.obter_checkpoints(cnpj, xml_type, data_inicio, data_fim)
+                       for xml_type in xml_types}
+        unidades = planejar_unidades(cnpj, data_inicio, data_fim, xml_types, checkpoints, inicio_reconsulta)
+        self.acompanhar(unidades)
+        return unidades
+
+    def acompanhar(self, unidades):
+        """Registra o skip inicial das sequências destas unidades (ex.: unidades retomadas da jornada)."""
+        with self._lock:
+            for unidade in unidades:
+                sequencia = self._sequencias.get(self._sequencia(unidade))
+                if sequencia is None:
+                    self._sequencias[self._sequencia(unidade)] = {"base": unidade.skip, "processadas": set(),
+                                                                   "final": None, "gravado": None}
+                else:
+                    sequencia["base"] = min(sequencia["base"], unidade.skip)
+
+    def pagina_concluida(self, unidade, quantidade):
+        """Registra uma página cujos XMLs já foram todos gravados e registrados.
+
+        Não deve ser chamada para páginas cheias de períodos de vários dias, que são divididos.
+        """
+        with self._lock:
+            sequencia = self._sequencias.setdefault(self._sequencia(unidade),
+                                                    {"base": 0, "processadas": set(), "final": None, "gravado": None})
+            sequencia["processadas"].add(unidade.skip)
+            if quantidade < TAMANHO_PAGINA:
+                sequencia["final"] = (unidade.skip, quantidade)
+
+            base = sequencia["base"]
+            if base not in sequencia["processadas"]:
+                return
+            ultimo = base
+            while ultimo + TAMANHO_PAGINA in sequencia["processadas"]:
+                ultimo += TAMANHO_PAGINA
+
+            final = sequencia["final"]
+            if final is not None and final[0] <= ultimo:
+                ultimo_skip, itens, concluido = final[0], final[0] + final[1], True
+            else:
+                ultimo_skip, itens, concluido = ultimo, ultimo + TAMANHO_PAGINA, False
+
+            datas = dias_do_periodo(unidade.data_inicio, unidade.data_fim)
+            if len(datas) > 1:
+                # A quantidade de cada data só é conhecida em consultas de um único dia
+                itens = None
+            progresso = (ultimo_skip // TAMANHO_PAGINA + 1, itens, ultimo_skip, concluido)
+            if sequencia["gravado"] == progresso:
+                return
+            sequencia["gravado"] = progresso
+
+        self.db.registrar_checkpoints(unidade.cnpj, unidade.xml_type, datas, *progresso)
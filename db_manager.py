@@ -2,64 +2,245 @@ import sqlite3
 import os
 import logging
 import datetime
+import threading
+from contextlib import contextmanager
+
+from metrics import metricas
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Consultas usadas com frequência. O sqlite3 mantém um cache de statements
+# preparados por texto SQL, então cada uma é compilada só uma vez por conexão.
+SQL_VERIFICAR_CHAVE = "SELECT 1 FROM xml_hashes WHERE chave = ?"
+SQL_VERIFICAR_HASH = "SELECT 1 FROM xml_hashes WHERE hash = ?"
+SQL_VERIFICAR_NOTA = "SELECT 1 FROM xml_hashes WHERE cnpj = ? AND numero_nota = ?"
+SQL_REGISTRAR_XML = "INSERT INTO xml_hashes (chave, hash, cnpj, numero_nota) VALUES (?, ?, ?, ?)"
+SQL_REGISTRAR_XML_LOTE = "INSERT OR IGNORE INTO xml_hashes (chave, hash, cnpj, numero_nota) VALUES (?, ?, ?, ?)"
+SQL_REGISTRAR_CHECKPOINT = """
+    INSERT INTO checkpoints (cnpj, xml_type, data, paginas, itens, ultimo_skip, concluido, atualizado_em)
+    VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (cnpj, xml_type, data) DO UPDATE SET
+        paginas = excluded.paginas, itens = excluded.itens, ultimo_skip = excluded.ultimo_skip,
+        concluido = excluded.concluido, atualizado_em = excluded.atualizado_em
+"""
+SQL_REGISTRAR_UNIDADE = """
+    INSERT INTO unidades_trabalho (execucao, origem, cnpj, data_inicio, data_fim, xml_type, skip, estado,
+                                   tentativas, erro, atualizado_em)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (execucao, cnpj, data_inicio, data_fim, xml_type, skip) DO UPDATE SET
+        estado = excluded.estado, tentativas = tentativas + excluded.tentativas,
+        erro = excluded.erro, atualizado_em = excluded.atualizado_em
+"""
+
+# Quantidade máxima de parâmetros por consulta em lote (o SQLite limita a 999 em versões antigas)
+TAMANHO_LOTE_CONSULTA = 500
+
+def _colunas(cursor, tabela):
+    return {linha[1] for linha in cursor.execute(f"PRAGMA table_info({tabela})")}
+
+def _migracao_tabela_inicial(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS xml_hashes (
+            hash TEXT PRIMARY KEY,
+            cnpj TEXT,
+            numero_nota TEXT,
+            data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def _migracao_numero_nota(cursor):
+    # Bancos criados pela versão antiga (Robos/db_manager.py) não têm a coluna numero_nota
+    if "numero_nota" not in _colunas(cursor, "xml_hashes"):
+        cursor.execute("ALTER TABLE xml_hashes ADD COLUMN numero_nota TEXT")
+
+def _migracao_indices(cursor):
+    # Consultas por CNPJ + número da nota e limpeza por data de processamento
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_xml_hashes_cnpj_nota ON xml_hashes (cnpj, numero_nota)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_xml_hashes_data ON xml_hashes (data_processamento)")
+
+def _migracao_chave_acesso(cursor):
+    # A identidade passa a ser a chave de acesso (ou o digest do conteúdo).
+    # Os hashes antigos vinham do hash() do Python, que muda a cada execução;
+    # os registros antigos são mantidos apenas para a verificação por CNPJ + número.
+    cursor.execute("""
+        CREATE TABLE xml_hashes_nova (
+            chave TEXT PRIMARY KEY,
+            hash TEXT,
+            cnpj TEXT,
+            numero_nota TEXT,
+            data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        INSERT INTO xml_hashes_nova (chave, hash, cnpj, numero_nota, data_processamento)
+        SELECT 'legado:' || hash, NULL, cnpj, numero_nota, data_processamento FROM xml_hashes
+    """)
+    cursor.execute("DROP TABLE xml_hashes")
+    cursor.execute("ALTER TABLE xml_hashes_nova RENAME TO xml_hashes")
+    _migracao_indices(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_xml_hashes_hash ON xml_hashes (hash)")
+
+def _migracao_checkpoints(cursor):
+    # Progresso das consultas por CNPJ, tipo de documento e data de emissão
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            cnpj TEXT NOT NULL,
+            xml_type INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            paginas INTEGER NOT NULL,
+            itens INTEGER,
+            ultimo_skip INTEGER NOT NULL,
+            concluido INTEGER NOT NULL,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (cnpj, xml_type, data)
+        )
+    """)
+
+def _migracao_jornada(cursor):
+    # Jornada das unidades de trabalho de cada execução, para retomar após uma interrupção
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS unidades_trabalho (
+            execucao TEXT NOT NULL,
+            origem TEXT NOT NULL,
+            cnpj TEXT NOT NULL,
+            data_inicio TEXT NOT NULL,
+            data_fim TEXT NOT NULL,
+            xml_type INTEGER NOT NULL,
+            skip INTEGER NOT NULL,
+            estado TEXT NOT NULL,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            erro TEXT,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (execucao, cnpj, data_inicio, data_fim, xml_type, skip)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_unidades_trabalho_origem ON unidades_trabalho (origem, execucao)")
+
+# Migrações do esquema, em ordem: (versão, descrição, função)
+# A versão aplicada fica registrada em PRAGMA user_version.
+MIGRACOES = [
+    (1, "tabela xml_hashes", _migracao_tabela_inicial),
+    (2, "coluna numero_nota", _migracao_numero_nota),
+    (3, "índices de CNPJ/número e data de processamento", _migracao_indices),
+    (4, "chave de acesso como chave primária e digest estável", _migracao_chave_acesso),
+    (5, "checkpoints das consultas por CNPJ, tipo e data", _migracao_checkpoints),
+    (6, "jornada das unidades de trabalho", _migracao_jornada),
+]
+
 class DatabaseManager:
+    """Gerencia o banco SQLite de XMLs baixados.
+
+    Mantém uma única conexão aberta (modo WAL, synchronous=NORMAL) compartilhada
+    entre threads. Todo acesso passa por uma trava, de modo que os workers usam
+    o banco através de um único escritor serializado; `transacao()` agrupa várias
+    operações em um único commit.
+    """
+
     def __init__(self, db_name='xml_database.db'):
         self.db_name = db_name
+        self._lock = threading.RLock()
+        self._profundidade_transacao = 0
         logging.info(f"🔄 Inicializando gerenciador de banco de dados: {db_name}")
+        self.conn = self._conectar()
         self.init_database()
 
+    def _conectar(self):
+        """Abre a conexão persistente e ajusta o SQLite para gravações frequentes."""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                               isolation_level=None, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def transacao(self):
+        """Agrupa as operações do bloco em uma única transação (um commit ao final).
+
+        Transações aninhadas são incorporadas à mais externa. A conexão fica
+        reservada para a thread atual até o fim do bloco.
+        """
+        with self._lock:
+            if self._profundidade_transacao == 0:
+                self.conn.execute("BEGIN")
+            self._profundidade_transacao += 1
+            try:
+                yield self
+            except BaseException:
+                self._profundidade_transacao -= 1
+                if self._profundidade_transacao == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._profundidade_transacao -= 1
+            if self._profundidade_transacao == 0:
+                self.conn.execute("COMMIT")
+
+    def fechar(self):
+        """Fecha a conexão persistente."""
+        with self._lock:
+            self.conn.close()
+
     def init_database(self):
-        """Initialize the database and create necessary tables if they don't exist."""
+        """Initialize the database and apply pending schema migrations."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS xml_hashes (
-                        hash TEXT PRIMARY KEY,
-                        cnpj TEXT,
-                        numero_nota TEXT,
-                        data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                conn.commit()
-                logging.info(f"✅ Banco de dados inicializado com sucesso: {self.db_name}")
-                # Verificar se a tabela já tem registros
-                cursor.execute("SELECT COUNT(*) FROM xml_hashes")
-                count = cursor.fetchone()[0]
-                logging.info(f"📊 Total de registros no banco: {count}")
-                return True
+            with self.transacao():
+                cursor = self.conn.cursor()
+                versao_atual = cursor.execute("PRAGMA user_version").fetchone()[0]
+                for versao, descricao, migracao in MIGRACOES:
+                    if versao <= versao_atual:
+                        continue
+                    logging.info(f"🔧 Aplicando migração {versao} do banco de dados: {descricao}")
+                    migracao(cursor)
+                    # PRAGMA não aceita parâmetros; a versão vem da lista de migrações
+                    cursor.execute(f"PRAGMA user_version = {int(versao)}")
+                    versao_atual = versao
+
+            logging.info(f"✅ Banco de dados inicializado com sucesso: {self.db_name} (versão do esquema: {versao_atual})")
+            # Verificar se a tabela já tem registros
+            with self._lock:
+                count = self.conn.execute("SELECT COUNT(*) FROM xml_hashes").fetchone()[0]
+            logging.info(f"📊 Total de registros no banco: {count}")
+            return True
         except sqlite3.Error as e:
             logging.error(f"❌ Erro ao inicializar banco de dados: {e}")
             print(f"❌ Erro ao inicializar banco de dados: {e}")
             return False
 
+    @metricas.cronometrar("banco")
+    def verificar_documento_existente(self, chave):
+        """Verifica se um documento já foi baixado anteriormente pela chave de acesso."""
+        try:
+            with self._lock:
+                cursor = self.conn.execute(SQL_VERIFICAR_CHAVE, (chave,))
+                return cursor.fetchone() is not None
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao verificar documento existente: {e}")
+            print(f"❌ Erro ao verificar documento existente: {e}")
+            return False
+
+    @metricas.cronometrar("banco")
     def verificar_xml_existente(self, xml_hash):
-        """Verifica se um XML já foi baixado anteriormente pelo hash."""
+        """Verifica se um XML já foi baixado anteriormente pelo digest do conteúdo."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT hash FROM xml_hashes WHERE hash = ?", (str(xml_hash),))
+            with self._lock:
+                cursor = self.conn.execute(SQL_VERIFICAR_HASH, (str(xml_hash),))
                 resultado = cursor.fetchone() is not None
                 return resultado
         except sqlite3.Error as e:
             logging.error(f"❌ Erro ao verificar XML existente: {e}")
             print(f"❌ Erro ao verificar XML existente: {e}")
             return False
-            
+
+    @metricas.cronometrar("banco")
     def verificar_nota_existente(self, cnpj, numero_nota):
         """Verifica se uma nota com o mesmo CNPJ e número já foi baixada anteriormente."""
         if not numero_nota:  # Se o número da nota for None ou vazio
             logging.info(f"⚠️ Verificação ignorada: número da nota não fornecido para CNPJ {cnpj}")
             return False
-        
-        try:    
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT hash FROM xml_hashes WHERE cnpj = ? AND numero_nota = ?", (cnpj, numero_nota))
+
+        try:
+            with self._lock:
+                cursor = self.conn.execute(SQL_VERIFICAR_NOTA, (cnpj, numero_nota))
                 resultado = cursor.fetchone() is not None
                 return resultado
         except sqlite3.Error as e:
@@ -67,16 +248,13 @@ class DatabaseManager:
             print(f"❌ Erro ao verificar nota existente: {e}")
             return False
 
-    def registrar_xml(self, xml_hash, cnpj, numero_nota=None):
-        """Registra um novo XML no banco de dados."""
+    @metricas.cronometrar("banco")
+    def registrar_xml(self, xml_hash, cnpj, numero_nota=None, chave=None):
+        """Registra um novo XML no banco de dados pela chave de acesso (ou pelo digest)."""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO xml_hashes (hash, cnpj, numero_nota) VALUES (?, ?, ?)",
-                    (str(xml_hash), cnpj, numero_nota)
-                )
-                conn.commit()
+            # Fora de uma transação, o modo autocommit grava o registro imediatamente
+            with self._lock:
+                self.conn.execute(SQL_REGISTRAR_XML, (chave or str(xml_hash), str(xml_hash), cnpj, numero_nota))
                 logging.info(f"✅ XML registrado com sucesso: CNPJ {cnpj}, Nota {numero_nota or 'N/A'}")
                 return True
         except sqlite3.IntegrityError:
@@ -87,41 +265,202 @@ class DatabaseManager:
             print(f"❌ Erro ao registrar XML no banco de dados: {e}")
             return False
 
+    def _filtrar_existentes(self, consulta, valores, parametros_fixos=()):
+        """Executa a consulta com `IN (...)` em blocos e retorna os valores encontrados."""
+        valores = list(dict.fromkeys(v for v in valores if v))
+        encontrados = set()
+        with self._lock:
+            for inicio in range(0, len(valores), TAMANHO_LOTE_CONSULTA):
+                bloco = valores[inicio:inicio + TAMANHO_LOTE_CONSULTA]
+                marcadores = ", ".join("?" * len(bloco))
+                cursor = self.conn.execute(consulta.format(marcadores=marcadores), (*parametros_fixos, *bloco))
+                encontrados.update(linha[0] for linha in cursor)
+        return encontrados
+
+    @metricas.cronometrar("banco")
+    def filtrar_documentos_existentes(self, chaves):
+        """Retorna o subconjunto das chaves de acesso que já foram baixadas, em uma única consulta."""
+        try:
+            return self._filtrar_existentes(
+                "SELECT chave FROM xml_hashes WHERE chave IN ({marcadores})", chaves)
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao verificar documentos existentes: {e}")
+            print(f"❌ Erro ao verificar documentos existentes: {e}")
+            return set()
+
+    @metricas.cronometrar("banco")
+    def filtrar_notas_existentes(self, cnpj, numeros_nota):
+        """Retorna o subconjunto dos números de nota do CNPJ que já foram baixados, em uma única consulta."""
+        try:
+            return self._filtrar_existentes(
+                "SELECT numero_nota FROM xml_hashes WHERE cnpj = ? AND numero_nota IN ({marcadores})",
+                numeros_nota, (cnpj,))
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao verificar notas existentes: {e}")
+            print(f"❌ Erro ao verificar notas existentes: {e}")
+            return set()
+
+    @metricas.cronometrar("banco")
+    def registrar_xmls(self, registros):
+        """Registra vários XMLs em uma única transação.
+
+        `registros` é uma lista de tuplas (hash, cnpj, numero_nota, chave). Registros
+        já existentes são ignorados. Retorna a quantidade de XMLs registrados.
+        """
+        if not registros:
+            return 0
+        try:
+            with self.transacao():
+                antes = self.conn.total_changes
+                self.conn.executemany(SQL_REGISTRAR_XML_LOTE, [
+                    (chave or str(xml_hash), str(xml_hash), cnpj, numero_nota)
+                    for xml_hash, cnpj, numero_nota, chave in registros
+                ])
+                registrados = self.conn.total_changes - antes
+            logging.info(f"✅ {registrados} XMLs registrados com sucesso ({len(registros) - registrados} já existentes)")
+            return registrados
+        except Exception as e:
+            logging.error(f"❌ Erro ao registrar XMLs no banco de dados: {e}")
+            print(f"❌ Erro ao registrar XMLs no banco de dados: {e}")
+            return 0
+
+    @metricas.cronometrar("banco")
+    def contar_registros(self):
+        """Retorna a quantidade de XMLs registrados no banco."""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM xml_hashes").fetchone()[0]
+
+    @metricas.cronometrar("banco")
+    def listar_chaves(self, desde=None):
+        """Retorna (chave, data_processamento) dos registros, opcionalmente a partir de uma data."""
+        with self._lock:
+            if desde is None:
+                cursor = self.conn.execute("SELECT chave, data_processamento FROM xml_hashes")
+            else:
+                cursor = self.conn.execute(
+                    "SELECT chave, data_processamento FROM xml_hashes WHERE data_processamento >= ?", (desde,))
+            return cursor.fetchall()
+
+    @metricas.cronometrar("banco")
+    def obter_checkpoints(self, cnpj, xml_type, data_inicio, data_fim):
+        """Retorna {data: (paginas, itens, ultimo_skip, concluido)} do CNPJ e tipo no período."""
+        try:
+            with self._lock:
+                cursor = self.conn.execute("""
+                    SELECT data, paginas, itens, ultimo_skip, concluido FROM checkpoints
+                    WHERE cnpj = ? AND xml_type = ? AND data BETWEEN ? AND ?
+                """, (cnpj, xml_type, data_inicio, data_fim))
+                return {data: (paginas, itens, ultimo_skip, bool(concluido))
+                        for data, paginas, itens, ultimo_skip, concluido in cursor}
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao consultar checkpoints: {e}")
+            print(f"❌ Erro ao consultar checkpoints: {e}")
+            return {}
+
+    @metricas.cronometrar("banco")
+    def registrar_checkpoints(self, cnpj, xml_type, datas, paginas, itens, ultimo_skip, concluido):
+        """Grava o mesmo progresso para cada data informada, em uma única transação."""
+        try:
+            with self.transacao():
+                self.conn.executemany(SQL_REGISTRAR_CHECKPOINT, [
+                    (cnpj, xml_type, data, paginas, itens, ultimo_skip, int(concluido)) for data in datas
+                ])
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao registrar checkpoints: {e}")
+            print(f"❌ Erro ao registrar checkpoints: {e}")
+            return False
+
+    @metricas.cronometrar("banco")
+    def ultima_execucao(self, origem):
+        """Retorna o identificador da execução mais recente da origem, ou None."""
+        with self._lock:
+            linha = self.conn.execute(
+                "SELECT MAX(execucao) FROM unidades_trabalho WHERE origem = ?", (origem,)).fetchone()
+        return linha[0]
+
+    @metricas.cronometrar("banco")
+    def registrar_unidades(self, execucao, origem, unidades, estado, erro=None, tentativa=False):
+        """Grava o estado de várias unidades de trabalho da execução, em uma única transação.
+
+        `unidades` são tuplas (cnpj, data_inicio, data_fim, xml_type, skip). Com
+        `tentativa=True`, soma uma tentativa às unidades.
+        """
+        try:
+            with self.transacao():
+                self.conn.executemany(SQL_REGISTRAR_UNIDADE, [
+                    (execucao, origem, *unidade, estado, int(tentativa), erro) for unidade in unidades
+                ])
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"❌ Erro ao registrar unidades de trabalho: {e}")
+            print(f"❌ Erro ao registrar unidades de trabalho: {e}")
+            return False
+
+    @metricas.cronometrar("banco")
+    def remover_unidade(self, execucao, unidade):
+        """Remove da jornada uma unidade que deixou de ser necessária."""
+        with self._lock:
+            self.conn.execute("""
+                DELETE FROM unidades_trabalho
+                WHERE execucao = ? AND cnpj = ? AND data_inicio = ? AND data_fim = ? AND xml_type = ? AND skip = ?
+            """, (execucao, *unidade))
+
+    @metricas.cronometrar("banco")
+    def listar_unidades(self, execucao, estados=None):
+        """Retorna [(cnpj, data_inicio, data_fim, xml_type, skip, estado)] da execução, opcionalmente filtrando os estados."""
+        consulta = ("SELECT cnpj, data_inicio, data_fim, xml_type, skip, estado FROM unidades_trabalho "
+                    "WHERE execucao = ?")
+        parametros = [execucao]
+        if estados:
+            consulta += f" AND estado IN ({', '.join('?' * len(estados))})"
+            parametros.extend(estados)
+        with self._lock:
+            return self.conn.execute(consulta + " ORDER BY rowid", parametros).fetchall()
+
+    @metricas.cronometrar("banco")
     def limpar_registros_antigos(self, dias=90):
         """Remove registros mais antigos que o número especificado de dias."""
         try:
             data_limite = datetime.datetime.now() - datetime.timedelta(days=dias)
             data_formatada = data_limite.strftime("%Y-%m-%d")
-            
-            with sqlite3.connect(self.db_name) as conn:
+
+            with self.transacao():
                 # Primeiro, contar quantos registros serão afetados
-                cursor = conn.cursor()
+                cursor = self.conn.cursor()
                 cursor.execute("""
-                    SELECT COUNT(*) FROM xml_hashes 
+                    SELECT COUNT(*) FROM xml_hashes
                     WHERE data_processamento < datetime('now', '-' || ? || ' days')
                 """, (dias,))
                 total_registros = cursor.fetchone()[0]
-                
+
                 # Agora executar a exclusão
                 cursor.execute("""
-                    DELETE FROM xml_hashes 
+                    DELETE FROM xml_hashes
                     WHERE data_processamento < datetime('now', '-' || ? || ' days')
                 """, (dias,))
                 registros_removidos = cursor.rowcount
-                conn.commit()
-                
-                mensagem = f"✅ {registros_removidos} registros anteriores a {data_formatada} foram removidos do banco de dados."
-                logging.info(mensagem)
-                print(mensagem)
-                
-                # Contar quantos registros restaram
-                cursor.execute("SELECT COUNT(*) FROM xml_hashes")
+
+                # Checkpoints de datas antigas não são mais consultados
+                cursor.execute("DELETE FROM checkpoints WHERE data < ?", (data_formatada,))
+                cursor.execute("""
+                    DELETE FROM unidades_trabalho
+                    WHERE atualizado_em < datetime('now', '-' || ? || ' days')
+                """, (dias,))
+
+            mensagem = f"✅ {registros_removidos} registros anteriores a {data_formatada} foram removidos do banco de dados."
+            logging.info(mensagem)
+            print(mensagem)
+
+            # Contar quantos registros restaram
+            with self._lock:
+                cursor = self.conn.execute("SELECT COUNT(*) FROM xml_hashes")
                 registros_restantes = cursor.fetchone()[0]
-                logging.info(f"📊 Total de registros restantes no banco: {registros_restantes}")
-                
-                return registros_removidos
+            logging.info(f"📊 Total de registros restantes no banco: {registros_restantes}")
+
+            return registros_removidos
         except Exception as e:
             erro_msg = f"❌ Erro ao limpar registros antigos: {e}"
             logging.error(erro_msg)
             print(erro_msg)
-            return 0
\ No newline at end of file
+            return 0
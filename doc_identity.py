@@ -0,0 +1,32 @@
+import hashlib
+import re
+from collections import namedtuple
+
+# Chave de acesso de 44 dígitos no atributo Id de infNFe/infCte (ex.: Id="NFe3519...")
+_CHAVE_ID = re.compile(rb'\bId\s*=\s*["\'](?:NFe|CTe)(\d{44})["\']')
+# Chave no protocolo de autorização, para XMLs sem o atributo Id
+_CHAVE_PROTOCOLO = re.compile(rb'<(?:\w+:)?ch(?:NFe|CTe)>(\d{44})</')
+
+# Identidade estável de um documento: chave de acesso (ou o digest, se não houver chave)
+# e o digest BLAKE2b do conteúdo decodificado
+IdentidadeDocumento = namedtuple("IdentidadeDocumento", ["chave", "digest"])
+
+
+def calcular_digest(conteudo):
+    """Digest BLAKE2b (256 bits, em hexadecimal) dos bytes do XML."""
+    return hashlib.blake2b(conteudo, digest_size=32).hexdigest()
+
+
+def extrair_chave(conteudo):
+    """Retorna a chave de acesso de 44 dígitos do XML, ou None se não encontrada."""
+    encontrado = _CHAVE_ID.search(conteudo) or _CHAVE_PROTOCOLO.search(conteudo)
+    return encontrado.group(1).decode("ascii") if encontrado else None
+
+
+def identificar_documento(conteudo):
+    """Calcula a identidade do documento a partir dos bytes decodificados do XML.
+
+    Diferente do `hash()` do Python, o resultado é o mesmo em qualquer execução.
+    """
+    digest = calcular_digest(conteudo)
+    return IdentidadeDocumento(extrair_chave(conteudo) or digest, digest)
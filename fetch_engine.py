@@ -0,0 +1,192 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from query_planner import TAMANHO_PAGINA, proximas_unidades, descrever_periodo
+from retry_policy import CircuitoAberto, PRAZO_ADIAMENTO
+from job_journal import EM_ANDAMENTO, FALHOU, PENDENTE
+
+# Páginas seguintes buscadas antecipadamente quando uma página vem cheia
+PAGINAS_ANTECIPADAS = 2
+
+
+class FetchEngine:
+    """Distribui as unidades de trabalho entre requisições simultâneas à API.
+
+    `buscar(unidade)` faz a requisição (bloqueante) e devolve a lista de XMLs da
+    página, ou None em caso de falha.
+    `processar(unidade, xmls)` trata os XMLs da página. O processamento é
+    serializado para manter a deduplicação e o salvamento com a mesma semântica
+    do fluxo sequencial.
+
+    Quando uma página de um único dia vem cheia, as próximas `paginas_antecipadas`
+    páginas são buscadas em paralelo enquanto a atual é processada; ao encontrar
+    uma página incompleta, as buscas além dela são canceladas e descartadas.
+
+    Se `buscar` levantar `CircuitoAberto`, a unidade é adiada e recolocada na
+    fila quando a API voltar a ser testada, sem contar como falha. Depois de
+    `prazo_adiamento` segundos adiada, a unidade é dada como falha, para que a
+    execução termine mesmo com a API fora do ar.
+
+    Com uma `jornada` (`JobJournal`), as unidades descobertas durante a execução
+    são gravadas como pendentes, marcadas em andamento quando a busca começa e
+    removidas se forem descartadas; unidades já concluídas na mesma execução não
+    são agendadas de novo. A conclusão fica com `processar`, que sabe quando os
+    XMLs da página foram gravados.
+    """
+
+    def __init__(self, buscar, processar, max_concorrencia=4, paginas_antecipadas=PAGINAS_ANTECIPADAS,
+                 jornada=None, prazo_adiamento=PRAZO_ADIAMENTO):
+        self.buscar = buscar
+        self.processar = processar
+        self.jornada = jornada
+        self.max_concorrencia = max_concorrencia
+        self.paginas_antecipadas = paginas_antecipadas
+        self.prazo_adiamento = prazo_adiamento
+        self.paginas_processadas = 0
+        self.paginas_descartadas = 0
+        self.unidades_adiadas = 0
+        self.falhas = 0
+
+    def executar(self, unidades):
+        """Executa todas as unidades de trabalho e suas páginas seguintes."""
+        return asyncio.run(self._executar(unidades))
+
+    async def _executar(self, unidades):
+        self._preparar()
+        try:
+            for unidade in unidades:
+                self._agendar(unidade)
+
+            # Novas páginas podem ser agendadas enquanto aguardamos as atuais
+            await self._aguardar_tarefas()
+        finally:
+            self._executor.shutdown(wait=True)
+
+        return self.paginas_processadas
+
+    def _preparar(self):
+        self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+        self._trava_processamento = asyncio.Lock()
+        self._tarefas = set()
+        # Por sequência de páginas: tarefas por skip e skip da última página existente
+        self._tarefas_sequencia = {}
+        self._ultimo_skip = {}
+        self._em_processamento = set()
+        # Uma thread a mais para o processamento das respostas
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concorrencia + 1)
+
+    async def _aguardar_tarefas(self):
+        while self._tarefas:
+            await asyncio.gather(*list(self._tarefas), return_exceptions=True)
+
+    @staticmethod
+    def _sequencia(unidade):
+        return unidade.cnpj, unidade.data_inicio, unidade.data_fim, unidade.xml_type
+
+    def _agendar(self, unidade, nova=False):
+        tarefas = self._tarefas_sequencia.setdefault(self._sequencia(unidade), {})
+        if unidade.skip in tarefas:
+            return
+        if self.jornada is not None:
+            if self.jornada.ja_concluida(unidade):
+                return
+            if nova:
+                self.jornada.registrar(unidade, PENDENTE)
+
+        tarefa = asyncio.create_task(self._executar_unidade(unidade))
+        tarefas[unidade.skip] = tarefa
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        tarefa.add_done_callback(lambda tarefa: self._ao_terminar(tarefa, unidade))
+
+    def _ao_terminar(self, tarefa, unidade):
+        # Uma tarefa cancelada antes de começar nunca executa o próprio código,
+        # por isso o descarte de uma busca cancelada é feito aqui
+        if tarefa.cancelled():
+            self._descartar(unidade)
+
+    def _alem_do_fim(self, unidade):
+        ultimo_skip = self._ultimo_skip.get(self._sequencia(unidade))
+        return ultimo_skip is not None and unidade.skip > ultimo_skip
+
+    def _encerrar_sequencia(self, unidade):
+        """Marca a última página da sequência e cancela as buscas antecipadas além dela."""
+        sequencia = self._sequencia(unidade)
+        ultimo_skip = self._ultimo_skip.get(sequencia)
+        if ultimo_skip is not None and ultimo_skip <= unidade.skip:
+            return
+        self._ultimo_skip[sequencia] = unidade.skip
+
+        # Páginas já em processamento terminam normalmente
+        for skip, tarefa in self._tarefas_sequencia[sequencia].items():
+            if skip > unidade.skip and not tarefa.done() and (sequencia, skip) not in self._em_processamento:
+                tarefa.cancel()
+
+    def _agendar_seguintes(self, unidade, quantidade):
+        proximas = proximas_unidades(unidade, quantidade)
+        if not proximas:
+            self._encerrar_sequencia(unidade)
+            return
+
+        for proxima in proximas:
+            self._agendar(proxima, nova=True)
+            # Mesma sequência de páginas: antecipa as páginas seguintes
+            if self._sequencia(proxima) == self._sequencia(unidade):
+                for n in range(1, self.paginas_antecipadas):
+                    self._agendar(proxima._replace(skip=proxima.skip + n * TAMANHO_PAGINA), nova=True)
+
+    def _descartar(self, unidade):
+        self.paginas_descartadas += 1
+        if self.jornada is not None:
+            self.jornada.descartar(unidade)
+
+    async def _executar_unidade(self, unidade):
+        loop = asyncio.get_running_loop()
+        try:
+            adiada_desde = None
+            iniciada = False
+            while True:
+                try:
+                    async with self._semaforo:
+                        if self._alem_do_fim(unidade):
+                            self._descartar(unidade)
+                            return
+                        if self.jornada is not None and not iniciada:
+                            iniciada = True
+                            self.jornada.registrar(unidade, EM_ANDAMENTO)
+                        xmls = await loop.run_in_executor(self._executor, self.buscar, unidade)
+                    break
+                except CircuitoAberto as e:
+                    # API fora do ar: aguarda a próxima sonda e recoloca a unidade na fila
+                    if adiada_desde is None:
+                        adiada_desde = time.monotonic()
+                        self.unidades_adiadas += 1
+                    if time.monotonic() - adiada_desde + e.espera > self.prazo_adiamento:
+                        # A API continua fora do ar: a unidade falha e fica para --reprocessar-falhas
+                        raise RuntimeError(f"API indisponível por mais de {self.prazo_adiamento / 60:.0f} minutos") from e
+                    await asyncio.sleep(e.espera)
+
+            # A sequência pode ter terminado enquanto esta página era buscada
+            if self._alem_do_fim(unidade):
+                self._descartar(unidade)
+                return
+
+            # Agenda as próximas buscas antes de processar, sobrepondo rede e disco
+            quantidade = len(xmls) if xmls else 0
+            self._agendar_seguintes(unidade, quantidade)
+
+            async with self._trava_processamento:
+                self._em_processamento.add((self._sequencia(unidade), unidade.skip))
+                try:
+                    await loop.run_in_executor(self._executor, self.processar, unidade, xmls)
+                finally:
+                    self._em_processamento.discard((self._sequencia(unidade), unidade.skip))
+        except Exception as e:
+            self.falhas += 1
+            if self.jornada is not None:
+                self.jornada.registrar(unidade, FALHOU, str(e))
+            print(f"❌ Erro ao processar CNPJ {unidade.cnpj} {descrever_periodo(unidade.data_inicio, unidade.data_fim)} (Skip: {unidade.skip}): {e}")
+            return
+
+        self.paginas_processadas += 1
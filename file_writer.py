@@ -0,0 +1,308 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+from doc_identity import calcular_digest
+from metrics import metricas
+
+# Gravações aguardando uma thread livre; quem envia espera quando a fila está cheia
+TAMANHO_FILA = 256
+# Gravações simultâneas no compartilhamento de rede
+THREADS_GRAVACAO = 8
+
+
+class EscritorArquivos:
+    """Grava os XMLs em segundo plano, fora do caminho das requisições à API.
+
+    No compartilhamento de rede cada `makedirs`, `exists` e `open`/`write`/`close`
+    é uma ida e volta ao servidor. As gravações entram em uma fila limitada e são
+    feitas por um conjunto de threads; cada arquivo é escrito em um temporário no
+    próprio diretório e renomeado para o nome final, de modo que nunca fica um XML
+    pela metade no lugar do definitivo. Ao terminar, a gravação chama
+    `ao_concluir(caminho, erro)` na thread de gravação.
+
+    Cada diretório é criado e listado (`os.scandir`) uma única vez; a partir daí
+    os nomes ocupados ficam em um índice em memória, atualizado a cada gravação,
+    e a escolha do nome não toca no sistema de arquivos. Arquivos criados no
+    mesmo diretório por outro programa durante a execução não são vistos pela
+    escolha do nome, mas nunca são substituídos: com `numerar=True` o arquivo só
+    é movido para um nome que ainda não exista, e uma colisão leva ao próximo sufixo.
+
+    Com `numerar=True`, antes de criar uma cópia `_N` o conteúdo é comparado com
+    o dos arquivos de mesmo número (primeiro o tamanho, depois o digest); se um
+    deles for idêntico, nada é gravado e `ao_concluir` recebe o caminho dele.
+    """
+
+    # Etapa em que o tempo de cada gravação é registrado nas métricas
+    etapa_metricas = "gravacao"
+
+    def __init__(self, threads=THREADS_GRAVACAO, tamanho_fila=TAMANHO_FILA):
+        self.quantidade_threads = threads
+        self._fila = queue.Queue(maxsize=tamanho_fila)
+        self._threads = []
+        self._lock = threading.Lock()
+        # Uma trava por diretório para a escolha do nome final
+        self._travas_diretorio = {}
+        # Arquivos existentes em cada diretório já usado: nome (normalizado com os.path.normcase)
+        # -> (tamanho, digest), com None no que ainda não foi lido
+        self._indice = {}
+        self.gravados = 0
+        self.duplicados = 0
+        self.falhas = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._threads:
+                return
+            for numero in range(self.quantidade_threads):
+                thread = threading.Thread(target=self._trabalhar, name=f"gravacao-{numero}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def enviar(self, diretorio, nome, conteudo, numerar=False, ao_concluir=None):
+        """Coloca a gravação de `conteudo` em `diretorio/nome` na fila.
+
+        Com `numerar=True`, se o nome já existir o arquivo recebe um sufixo `_1`, `_2`...;
+        caso contrário, o arquivo existente é substituído.
+        """
+        self._iniciar()
+        self._fila.put((diretorio, nome, conteudo, numerar, ao_concluir))
+
+    def _trabalhar(self):
+        while True:
+            item = self._fila.get()
+            if item is None:
+                self._fila.task_done()
+                return
+            try:
+                self._processar(item)
+            finally:
+                self._fila.task_done()
+
+    def _processar(self, item):
+        """Faz uma gravação da fila."""
+        diretorio, nome, conteudo, numerar, ao_concluir = item
+        caminho, erro = None, None
+        duplicado = False
+        inicio = time.perf_counter()
+        try:
+            caminho, duplicado = self._gravar(diretorio, nome, conteudo, numerar)
+        except Exception as e:
+            erro = e
+        metricas.registrar(self.etapa_metricas, time.perf_counter() - inicio,
+                           tamanho=len(conteudo), erro=erro is not None)
+        self._concluir(nome, ao_concluir, caminho, erro, duplicado)
+
+    def _concluir(self, nome, ao_concluir, caminho, erro, duplicado):
+        """Atualiza os contadores e chama `ao_concluir` de uma gravação terminada."""
+        with self._lock:
+            if erro is not None:
+                self.falhas += 1
+            elif duplicado:
+                self.duplicados += 1
+            else:
+                self.gravados += 1
+
+        if ao_concluir is not None:
+            try:
+                ao_concluir(caminho, erro)
+            except Exception as e:
+                print(f"❌ Erro ao concluir gravação de {nome}: {e}")
+
+    def _trava(self, diretorio):
+        with self._lock:
+            trava = self._travas_diretorio.get(diretorio)
+            if trava is None:
+                trava = self._travas_diretorio[diretorio] = threading.Lock()
+            return trava
+
+    def _arquivos_existentes(self, diretorio):
+        """Índice de arquivos do diretório, criado e listado na primeira vez. Chamar com a trava do diretório."""
+        arquivos = self._indice.get(diretorio)
+        if arquivos is None:
+            os.makedirs(diretorio, exist_ok=True)
+            with os.scandir(diretorio) as entradas:
+                arquivos = {os.path.normcase(entrada.name): (None, None) for entrada in entradas}
+            self._indice[diretorio] = arquivos
+        return arquivos
+
+    def _gravar(self, diretorio, nome, conteudo, numerar):
+        """Grava o arquivo e retorna (caminho, duplicado)."""
+        trava = self._trava(diretorio)
+        with trava:
+            arquivos = self._arquivos_existentes(diretorio)
+            if numerar:
+                existente = self._copia_identica(diretorio, arquivos, nome, conteudo)
+                if existente is not None:
+                    return existente, True
+
+        temporario = os.path.join(diretorio, f".{nome}.{uuid.uuid4().hex}.tmp")
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(conteudo)
+
+        try:
+            # O nome final é escolhido e ocupado sem que outra thread use o mesmo
+            with trava:
+                if not numerar:
+                    caminho = os.path.join(diretorio, nome)
+                    os.replace(temporario, caminho)
+                    arquivos[os.path.normcase(nome)] = (len(conteudo), None)
+                    return caminho, False
+
+                while True:
+                    # Outra thread pode ter gravado o mesmo conteúdo enquanto este arquivo era escrito
+                    existente = self._copia_identica(diretorio, arquivos, nome, conteudo)
+                    if existente is not None:
+                        os.remove(temporario)
+                        return existente, True
+                    nome_final = self._nome_livre(arquivos, nome)
+                    caminho = os.path.join(diretorio, nome_final)
+                    try:
+                        _mover_sem_substituir(temporario, caminho)
+                        break
+                    except FileExistsError:
+                        # Criado por outro programa depois da listagem: o nome passa a constar no índice,
+                        # com o conteúdo a comparar, e a escolha recomeça
+                        arquivos[os.path.normcase(nome_final)] = (None, None)
+                arquivos[os.path.normcase(nome_final)] = (len(conteudo), calcular_digest(conteudo))
+        except BaseException:
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+            raise
+        return caminho, False
+
+    @staticmethod
+    def _nomes_numerados(nome):
+        """Gera o nome original e as cópias `_1`, `_2`..."""
+        base, extensao = os.path.splitext(nome)
+        yield nome
+        contador = 1
+        while True:
+            yield f"{base}_{contador}{extensao}"
+            contador += 1
+
+    def _copia_identica(self, diretorio, arquivos, nome, conteudo):
+        """Caminho de um arquivo de mesmo número e conteúdo idêntico, ou None. Chamar com a trava do diretório."""
+        digest = None
+        for candidato in self._nomes_numerados(nome):
+            chave = os.path.normcase(candidato)
+            if chave not in arquivos:
+                return None
+            caminho = os.path.join(diretorio, candidato)
+            tamanho, digest_existente = arquivos[chave]
+            try:
+                if tamanho is None:
+                    tamanho = os.stat(caminho).st_size
+                    arquivos[chave] = (tamanho, None)
+                if tamanho != len(conteudo):
+                    continue
+                if digest_existente is None:
+                    with open(caminho, "rb") as arquivo:
+                        digest_existente = calcular_digest(arquivo.read())
+                    arquivos[chave] = (tamanho, digest_existente)
+            except OSError:
+                # Removido ou inacessível: o nome continua ocupado, mas não é comparado
+                continue
+            if digest is None:
+                digest = calcular_digest(conteudo)
+            if digest == digest_existente:
+                return caminho
+
+    def _nome_livre(self, arquivos, nome):
+        # Enquanto existir um arquivo com o mesmo nome, adiciona um contador
+        for candidato in self._nomes_numerados(nome):
+            if os.path.normcase(candidato) not in arquivos:
+                return candidato
+
+    def ler(self, caminho):
+        """Lê de volta um documento gravado, pelo caminho informado em `ao_concluir`."""
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
+
+    def digests_gravados(self, caminhos):
+        """Digest do conteúdo gravado em cada caminho, para conferir um lote de uma vez.
+
+        Retorna {caminho: digest}, com a exceção no lugar do digest se a leitura falhar.
+        """
+        digests = {}
+        for caminho in caminhos:
+            try:
+                digests[caminho] = calcular_digest(self.ler(caminho))
+            except Exception as e:
+                digests[caminho] = e
+        return digests
+
+    def aguardar(self):
+        """Bloqueia até que todas as gravações enviadas terminem."""
+        self._fila.join()
+
+    def fechar(self):
+        """Conclui as gravações pendentes e encerra as threads."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._fila.put(None)
+        for thread in threads:
+            thread.join()
+
+
+def _mover_sem_substituir(origem, destino):
+    """Move o arquivo para `destino` sem substituir um existente (FileExistsError se o nome estiver ocupado)."""
+    if os.name == "nt":
+        # No Windows, inclusive em compartilhamentos de rede, os.rename falha se o destino existir
+        os.rename(origem, destino)
+    else:
+        os.link(origem, destino)
+        os.remove(origem)
+
+
+class LoteGravacao:
+    """Acompanha as gravações de uma página.
+
+    Cada gravação usa `lote.ao_concluir(dados)` como callback. Depois de
+    `fechar()`, quando a última gravação termina, `ao_terminar(resultados)` é
+    chamado com a lista de `(dados, caminho, erro)`, na ordem de conclusão.
+    """
+
+    def __init__(self, ao_terminar=None):
+        self.ao_terminar = ao_terminar
+        self.resultados = []
+        # Conta um a mais até o fechamento, para não terminar antes de todas serem enviadas
+        self._pendentes = 1
+        self._lock = threading.Lock()
+        self._terminado = threading.Event()
+
+    def ao_concluir(self, dados):
+        with self._lock:
+            self._pendentes += 1
+
+        def concluir(caminho, erro):
+            with self._lock:
+                self.resultados.append((dados, caminho, erro))
+            self._concluir_um()
+
+        return concluir
+
+    def fechar(self):
+        """Indica que todas as gravações da página já foram enviadas."""
+        self._concluir_um()
+
+    def _concluir_um(self):
+        with self._lock:
+            self._pendentes -= 1
+            terminou = self._pendentes == 0
+        if terminou:
+            try:
+                if self.ao_terminar is not None:
+                    self.ao_terminar(self.resultados)
+            finally:
+                self._terminado.set()
+
+    def aguardar(self):
+        """Bloqueia até que todas as gravações da página terminem."""
+        self._terminado.wait()
+        return self.resultados
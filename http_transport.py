@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configurações de conexão com a API
+TIMEOUT_CONEXAO = 10  # segundos
+TIMEOUT_LEITURA = 120  # segundos
+TAMANHO_POOL = 10  # conexões mantidas abertas por host
+
+
+class SiegTransport:
+    """Transporte HTTP compartilhado para as chamadas à API do SIEG.
+
+    Mantém uma única `requests.Session` com pool de conexões keep-alive,
+    pede respostas compactadas com gzip, aplica timeouts de conexão e de
+    leitura e registra a latência de cada requisição.
+    """
+
+    def __init__(self, timeout_conexao=TIMEOUT_CONEXAO, timeout_leitura=TIMEOUT_LEITURA,
+                 tamanho_pool=TAMANHO_POOL, historico_latencias=1000):
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho_pool, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive"
+        })
+        self.latencias = deque(maxlen=historico_latencias)
+        self.total_requisicoes = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, payload, **kwargs):
+        """Envia o payload em JSON e retorna a resposta com o atributo `latencia` (segundos).
+
+        Com `stream=True` a latência vai até o recebimento dos cabeçalhos, e o corpo
+        é lido depois por quem chamou.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        inicio = time.perf_counter()
+        try:
+            response = self.session.post(url, json=payload, **kwargs)
+        finally:
+            latencia = time.perf_counter() - inicio
+            with self._lock:
+                self.latencias.append(latencia)
+                self.total_requisicoes += 1
+        response.latencia = latencia
+        return response
+
+    def estatisticas(self):
+        """Resumo das latências registradas: total, média, p95 e máxima (segundos)."""
+        with self._lock:
+            amostras = sorted(self.latencias)
+            total = self.total_requisicoes
+        if not amostras:
+            return {"requisicoes": total, "media": 0.0, "p95": 0.0, "maxima": 0.0}
+        return {
+            "requisicoes": total,
+            "media": sum(amostras) / len(amostras),
+            "p95": amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))],
+            "maxima": amostras[-1]
+        }
+
+    def fechar(self):
+        self.session.close()
+
+
+# Transporte global usado por todas as chamadas à API
+transporte = SiegTransport()
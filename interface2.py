@@ -2,22 +2,55 @@ import sys
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLabel, QLineEdit, QPushButton,
-                             QTextEdit, QDateEdit, QMessageBox, QScrollArea,
-                             QFileDialog)
-from PyQt5.QtCore import Qt, QDate
-from datetime import datetime, timedelta
-import requests
-import json
-import base64
-import xml.etree.ElementTree as ET
+                             QTextEdit, QDateEdit, QMessageBox, QPlainTextEdit,
+                             QFileDialog, QSpinBox, QProgressBar, QComboBox)
+from PyQt5.QtCore import Qt, QDate, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+import threading
 import time
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+import requests
 import pandas as pd
 from db_manager import DatabaseManager
+from rate_limiter import limitador, tempo_retry_after
+from http_transport import transporte
+from retry_policy import politica_retry, obter_circuito, CircuitoAberto, PRAZO_ADIAMENTO
+from stream_reader import receber_documentos
+from known_snapshot import KnownSnapshot
+from file_writer import LoteGravacao
+from packed_storage import MODOS_ARMAZENAMENTO
+from spool_sync import EscritorSpool, SincronizadorSpool
+from query_planner import (TAMANHO_PAGINA, planejar_unidades, proximas_unidades,
+                           deve_dividir, descrever_periodo)
+from job_journal import JobJournal, PENDENTE, EM_ANDAMENTO, CONCLUIDA, FALHOU
+from metrics import metricas
 
 # Configurações da API
 API_KEY = ""
 URL = f"https://api.sieg.com/BaixarXmlsV2?api_key=7dJmT%2f0uVPbX8mEdBrZSdw%3d%3d"
 DEFAULT_XML_BASE_DIR = rf"\\192.168.1.240\Fiscal\Nota fiscal Eletronica\SIEG"
+MODO_ARMAZENAMENTO = "arquivos"  # "arquivos" (XMLs soltos) ou "compactado" (um .zip por mês e CNPJ)
+USAR_SPOOL = True  # Grava primeiro em disco local e envia ao servidor de arquivos em lotes
+
+# Configurações do processamento em segundo plano
+WORKERS_PADRAO = 3  # CNPJs processados ao mesmo tempo
+MAX_WORKERS = 8
+
+# Configurações do log
+ARQUIVO_LOG = "interface.log"  # Log completo, ao lado do banco de dados
+TAMANHO_ARQUIVO_LOG = 10 * 1024 * 1024  # bytes por arquivo antes da rotação
+ARQUIVOS_LOG = 5  # arquivos antigos mantidos
+INTERVALO_LOG = 200  # ms entre as atualizações do log na tela
+MAX_LINHAS_LOG = 5000  # linhas mantidas na tela; as mais antigas são descartadas
+
+# Níveis do filtro do log na tela
+NIVEIS_LOG = {
+    "Detalhado": logging.DEBUG,
+    "Normal": logging.INFO,
+    "Avisos": logging.WARNING,
+    "Erros": logging.ERROR
+}
 
 # Dicionário de meses para organização das pastas
 MESES = {
@@ -28,27 +61,450 @@ MESES = {
 
 # Configurações dos tipos de documentos
 DOC_TYPES = {
-    1: {"name": "NFE", "number_tag": "nNF", "type_tag": "tpNF"},
-    2: {"name": "CTE", "number_tag": "nCT", "type_tag": "tpCTe"}
+    1: {"name": "NFE", "namespace": "http://www.portalfiscal.inf.br/nfe", "number_tag": "nNF", "type_tag": "tpNF"},
+    2: {"name": "CTE", "namespace": "http://www.portalfiscal.inf.br/cte", "number_tag": "nCT", "type_tag": "tpCTe"}
+}
+
+# Configuração de extração dos metadados, por tipo de documento
+CONFIG_EXTRACAO = {
+    xml_type: (config["namespace"], config["number_tag"], config["type_tag"])
+    for xml_type, config in DOC_TYPES.items()
 }
 
+class ManipuladorTela(logging.Handler):
+    """Acumula as mensagens do log para a tela.
+
+    Os workers só colocam a mensagem em uma fila; a interface as retira em
+    lotes pelo QTimer e as escreve de uma vez. A fila guarda no máximo
+    `MAX_LINHAS_LOG` mensagens, o mesmo que a tela mostra.
+    """
+
+    def __init__(self, tamanho=MAX_LINHAS_LOG):
+        super().__init__()
+        self._fila = deque(maxlen=tamanho)
+        self.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(self, record):
+        try:
+            self._fila.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def retirar(self):
+        """Retira todas as mensagens acumuladas."""
+        mensagens = []
+        while True:
+            try:
+                mensagens.append(self._fila.popleft())
+            except IndexError:
+                return mensagens
+
+
+# Log: tudo vai para o arquivo rotativo; a tela recebe em lotes o que passar pelo filtro de nível
+logger = logging.getLogger("interface")
+logger.setLevel(logging.DEBUG)
+logger.propagate = False
+manipulador_arquivo = RotatingFileHandler(ARQUIVO_LOG, maxBytes=TAMANHO_ARQUIVO_LOG,
+                                          backupCount=ARQUIVOS_LOG, encoding="utf-8")
+manipulador_arquivo.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(threadName)s - %(message)s"))
+logger.addHandler(manipulador_arquivo)
+# As mensagens do banco de dados também vão para o arquivo
+logging.getLogger().addHandler(manipulador_arquivo)
+manipulador_tela = ManipuladorTela()
+manipulador_tela.setLevel(NIVEIS_LOG["Normal"])
+logger.addHandler(manipulador_tela)
+
+
+def registrar_log(message, nivel=None):
+    """Registra a mensagem no log; sem nível, ele é deduzido do emoji inicial."""
+    if nivel is None:
+        inicio = message.lstrip()
+        if inicio.startswith("❌"):
+            nivel = logging.ERROR
+        elif inicio.startswith("⚠️"):
+            nivel = logging.WARNING
+        else:
+            nivel = logging.INFO
+    logger.log(nivel, message)
+
+
+# Gravação dos XMLs em segundo plano. Com o spool, os XMLs são gravados em disco local
+# e o sincronizador os envia ao servidor de arquivos
+if USAR_SPOOL:
+    escritor = EscritorSpool()
+    sincronizador = SincronizadorSpool(MODOS_ARMAZENAMENTO[MODO_ARMAZENAMENTO]())
+else:
+    escritor = MODOS_ARMAZENAMENTO[MODO_ARMAZENAMENTO]()
+    sincronizador = None
+
 # Inicializa o banco de dados
 try:
     db = DatabaseManager()
+    # Snapshot dos documentos já baixados, para deduplicação sem consultas ao banco
+    snapshot = KnownSnapshot(db)
+    snapshot.carregar()
+    # Jornada das consultas, para retomar um processamento interrompido
+    jornada = JobJournal(db, "interface")
     print("✅ Banco de dados inicializado com sucesso")
 except Exception as e:
     print(f"❌ Erro ao inicializar banco de dados: {e}")
 
+
+class ProcessamentoCancelado(Exception):
+    """O processamento foi cancelado pelo usuário."""
+
+
+class ControleExecucao:
+    """Pausa e cancelamento compartilhados pelos workers de um processamento.
+
+    Os workers chamam `verificar()` antes de cada consulta: com o processamento
+    pausado ela bloqueia e, se ele foi cancelado, levanta `ProcessamentoCancelado`.
+    As esperas (retentativas, API indisponível) usam `esperar()`, que é
+    interrompida pelo cancelamento. Uma consulta já iniciada termina antes da
+    pausa; as que não começaram continuam pendentes na jornada.
+    """
+
+    def __init__(self):
+        self._liberado = threading.Event()
+        self._liberado.set()
+        self._cancelado = threading.Event()
+
+    @property
+    def pausado(self):
+        return not self._liberado.is_set()
+
+    @property
+    def cancelado(self):
+        return self._cancelado.is_set()
+
+    def pausar(self):
+        self._liberado.clear()
+
+    def continuar(self):
+        self._liberado.set()
+
+    def cancelar(self):
+        self._cancelado.set()
+        # Libera os workers pausados para que vejam o cancelamento
+        self._liberado.set()
+
+    def verificar(self):
+        self._liberado.wait()
+        if self._cancelado.is_set():
+            raise ProcessamentoCancelado()
+
+    def esperar(self, segundos):
+        if self._cancelado.wait(segundos):
+            raise ProcessamentoCancelado()
+
+
+class SinaisWorker(QObject):
+    concluido = pyqtSignal(str)
+
+
+class WorkerCNPJ(QRunnable):
+    """Processa as consultas de um CNPJ em uma thread do QThreadPool.
+
+    O worker não toca nos widgets: as mensagens vão para o log, que a interface
+    lê em lotes, e o fim do processamento chega pelo sinal `self.sinais.concluido`,
+    entregue na thread principal.
+    """
+
+    def __init__(self, cnpj, unidades, xml_base_dir, controle):
+        super().__init__()
+        self.cnpj = cnpj
+        self.unidades = unidades
+        self.xml_base_dir = xml_base_dir
+        self.controle = controle
+        self.db = db
+        self.snapshot = snapshot
+        self.sinais = SinaisWorker()
+
+    def log_message(self, message, nivel=None):
+        registrar_log(message, nivel)
+
+    def run(self):
+        try:
+            self.log_message(f"\n🔄 Processando CNPJ: {self.cnpj}")
+            # As consultas de cada tipo de documento são feitas em sequência
+            grupos = {}
+            for unidade in self.unidades:
+                grupos.setdefault(unidade.xml_type, []).append(unidade)
+            for pendentes in grupos.values():
+                self.process_xml_type(pendentes)
+        except ProcessamentoCancelado:
+            self.log_message(f"⏹️ Processamento do CNPJ {self.cnpj} cancelado.")
+        except Exception as e:
+            self.log_message(f"\n❌ Erro durante o processamento do CNPJ {self.cnpj}: {str(e)}")
+        finally:
+            self.sinais.concluido.emit(self.cnpj)
+
+    def process_xml_type(self, pendentes):
+        primeira = pendentes[0]
+        self.log_message(f"📅 Buscando {DOC_TYPES[primeira.xml_type]['name']} para CNPJ {primeira.cnpj} "
+                         f"{descrever_periodo(primeira.data_inicio, pendentes[-1].data_fim)}")
+
+        while pendentes:
+            # Entre uma consulta e outra, respeita a pausa e o cancelamento
+            self.controle.verificar()
+            unidade = pendentes.pop(0)
+            if jornada.ja_concluida(unidade):
+                continue
+
+            jornada.registrar(unidade, EM_ANDAMENTO)
+            adiada_desde = None
+            indisponivel = False
+            while True:
+                try:
+                    # Chamadas adiadas pelo circuit breaker não entram nas métricas
+                    with metricas.medir("api", cnpj=unidade.cnpj, tipo=DOC_TYPES[unidade.xml_type]['name'],
+                                        ignorar=CircuitoAberto) as medicao:
+                        response = self.fazer_requisicao_api(unidade.cnpj, unidade.data_inicio, unidade.data_fim,
+                                                             unidade.skip, unidade.xml_type, stream=True)
+                        medicao.erro = response is None
+                    break
+                except CircuitoAberto as e:
+                    # API fora do ar: aguarda a próxima sonda e repete a consulta
+                    if adiada_desde is None:
+                        adiada_desde = time.monotonic()
+                    if time.monotonic() - adiada_desde + e.espera > PRAZO_ADIAMENTO:
+                        indisponivel = True
+                        break
+                    self.log_message(f"⏸️ API indisponível. Nova tentativa em {e.espera:.0f} segundos...")
+                    self.controle.esperar(e.espera)
+            if indisponivel:
+                # A API continua fora do ar: a consulta falha e fica para "Reprocessar Falhas"
+                self.log_message(f"❌ API indisponível por mais de {PRAZO_ADIAMENTO / 60:.0f} minutos. "
+                                 f"Consulta do CNPJ {unidade.cnpj} {descrever_periodo(unidade.data_inicio, unidade.data_fim)} "
+                                 f"(Skip: {unidade.skip}) marcada como falha.")
+                jornada.registrar(unidade, FALHOU, "API indisponível")
+                continue
+            quantidade = self.process_page(unidade, response)
+
+            # Páginas cheias geram a próxima página ou as metades do período
+            novas = proximas_unidades(unidade, quantidade)
+            for nova in novas:
+                jornada.registrar(nova, PENDENTE)
+            pendentes.extend(novas)
+
+    def process_page(self, unidade, response):
+        cnpj, xml_type, skip = unidade.cnpj, unidade.xml_type, unidade.skip
+        periodo = descrever_periodo(unidade.data_inicio, unidade.data_fim)
+
+        if response is None:
+            jornada.registrar(unidade, FALHOU, "todas as tentativas falharam")
+            return 0
+
+        # A resposta é lida em streaming; os bytes dos documentos que o banco confirma como já baixados
+        # são descartados durante a leitura
+        with response:
+            # 404 só chega aqui com a mensagem "Nenhum arquivo XML localizado": o período está vazio
+            if response.status_code == 404:
+                self.log_message(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} {periodo}.")
+                jornada.registrar(unidade, CONCLUIDA)
+                return 0
+
+            if response.status_code != 200:
+                self.log_message(f"❌ Erro na requisição: {response.status_code} - {response.text}")
+                jornada.registrar(unidade, FALHOU, f"código {response.status_code}")
+                return 0
+
+            try:
+                # A leitura do corpo entra nas métricas como "download" e a análise dos XMLs como "extracao"
+                documentos = receber_documentos(response, CONFIG_EXTRACAO[xml_type], self.snapshot,
+                                                cnpj=cnpj, tipo=DOC_TYPES[xml_type]['name'])
+            except (ValueError, requests.exceptions.RequestException) as e:
+                self.log_message(f"❌ Erro ao decodificar a resposta JSON: {e}")
+                jornada.registrar(unidade, FALHOU, str(e))
+                return 0
+
+        if not documentos:
+            self.log_message(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} {periodo}.")
+            jornada.registrar(unidade, CONCLUIDA)
+            return 0
+
+        # Página cheia em um período de vários dias: o período será dividido e consultado de novo
+        if deve_dividir(unidade, len(documentos)):
+            self.log_message(f"🔀 Muitos XMLs para CNPJ {cnpj} {periodo}. Dividindo o período...")
+            jornada.registrar(unidade, CONCLUIDA)
+            return len(documentos)
+
+        self.log_message(f"🔹 Processando resposta para CNPJ {cnpj} {periodo} (Skip: {skip})")
+
+        candidatos = []
+        chaves_vistas = set()
+        for i, xml_bytes, identidade, metadados, erro, conhecido in documentos:
+            if conhecido:
+                self.log_message(f"⚠️ XML {i} (chave {identidade.chave}) já foi baixado anteriormente. Pulando...", logging.DEBUG)
+                continue
+            # Evita processar duas vezes o mesmo documento repetido na página
+            if identidade.chave in chaves_vistas:
+                continue
+            chaves_vistas.add(identidade.chave)
+
+            if metadados is None:
+                self.log_message(f"❌ Erro ao extrair dados do XML: {erro}")
+                continue
+            candidatos.append((i, xml_bytes, self.montar_dados_xml(metadados, xml_type), identidade))
+
+        # Verificar de uma vez quais notas do CNPJ já existem no banco de dados
+        notas_conhecidas = self.db.filtrar_notas_existentes(cnpj, [dados_xml["numero_nota"] for _, _, dados_xml, _ in candidatos])
+
+        # Os arquivos da página são gravados em paralelo; o registro no banco espera todos terminarem
+        lote = LoteGravacao()
+        for i, xml_bytes, dados_xml, identidade in candidatos:
+            numero_nota = dados_xml["numero_nota"]
+            if numero_nota and numero_nota in notas_conhecidas:
+                self.log_message(f"⚠️ XML {i} com número {numero_nota} já foi baixado anteriormente para o CNPJ {cnpj}. Pulando...", logging.DEBUG)
+                continue
+            if numero_nota:
+                notas_conhecidas.add(numero_nota)
+
+            self.salvar_xml(xml_bytes, dados_xml, i, xml_type, lote.ao_concluir((i, numero_nota, identidade)))
+        lote.fechar()
+
+        registros = []
+        falhas = 0
+        for (i, numero_nota, identidade), file_name, erro in sorted(lote.aguardar(), key=lambda r: r[0][0]):
+            if erro is None:
+                registros.append((identidade.digest, cnpj, numero_nota, identidade.chave))
+                self.log_message(f"✅ XML {i} salvo em: {file_name}", logging.DEBUG)
+            else:
+                self.log_message(f"❌ Erro ao salvar XML {i}: {erro}")
+                falhas += 1
+
+        self.log_message(f"🔄 Registrando {len(registros)} XMLs no banco de dados...")
+        novos_arquivos = self.db.registrar_xmls(registros)
+        self.snapshot.adicionar([chave for _, _, _, chave in registros])
+        if novos_arquivos < len(registros):
+            self.log_message(f"⚠️ {len(registros) - novos_arquivos} XMLs salvos em arquivo, mas houve um problema ao registrar no banco de dados")
+
+        if novos_arquivos == 0:
+            self.log_message(f"⚠️ Nenhum novo XML encontrado para CNPJ {cnpj} {periodo}.")
+
+        # A consulta só é dada como concluída quando todos os XMLs da página foram gravados
+        if falhas:
+            jornada.registrar(unidade, FALHOU, f"{falhas} XMLs não foram gravados")
+        else:
+            jornada.registrar(unidade, CONCLUIDA)
+        return len(documentos)
+
+    def fazer_requisicao_api(self, cnpj, data_inicio, data_fim, skip=0, xml_type=1, politica=politica_retry, stream=False):
+        payload = {
+            "XmlType": xml_type,
+            "Take": TAMANHO_PAGINA,
+            "Skip": skip,
+            "DataEmissaoInicio": data_inicio,
+            "DataEmissaoFim": data_fim,
+            "CnpjEmit": cnpj,
+            "Downloadevent": False
+        }
+        circuito = obter_circuito(URL)
+
+        def aguardar(segundos):
+            self.log_message(f"🔄 Aguardando {segundos:.1f} segundos antes de tentar novamente...")
+
+        for attempt in politica.tentativas(ao_aguardar=aguardar, esperar=self.controle.esperar,
+                                              ja_aguardando=limitador.pausa_restante):
+            # Com a API fora do ar, a chamada é adiada sem gastar tentativas
+            circuito.verificar()
+            try:
+                # Aguarda a liberação do limitador de taxa global
+                limitador.adquirir()
+                response = transporte.post(URL, payload, stream=stream)
+            except requests.exceptions.RequestException as e:
+                self.log_message(f"⚠️ Erro de conexão na tentativa {attempt + 1} de {politica.max_tentativas}: {str(e)}")
+                if circuito.registrar_falha():
+                    self.log_message(f"🚫 API indisponível. Suspendendo as chamadas por {circuito.tempo_recuperacao:.0f} segundos...")
+                continue
+
+            # Erros 5xx indicam instabilidade da API; qualquer outra resposta mostra que ela está no ar
+            if response.status_code >= 500:
+                if circuito.registrar_falha():
+                    self.log_message(f"🚫 API indisponível. Suspendendo as chamadas por {circuito.tempo_recuperacao:.0f} segundos...")
+            elif circuito.registrar_sucesso():
+                self.log_message("✅ API disponível novamente. Retomando as chamadas...")
+
+            if response.status_code == 404:
+                try:
+                    error_message = response.json()
+                    if isinstance(error_message, list) and len(error_message) > 0 and "Nenhum arquivo XML localizado" in error_message[0]:
+                        return response
+                except:
+                    pass
+
+            if response.status_code == 200:
+                return response
+
+            # Se a API sinalizar excesso de requisições, pausa o limitador pelo tempo pedido
+            espera = tempo_retry_after(response)
+            if response.status_code == 429 or espera is not None:
+                espera = espera if espera is not None else politica.atraso(attempt)
+                self.log_message(f"⏳ Limite da API atingido (código {response.status_code}). Pausando requisições por {espera:.0f} segundos...")
+                limitador.pausar(espera)
+                response.close()
+                continue
+
+            self.log_message(f"⚠️ Tentativa {attempt + 1} de {politica.max_tentativas} falhou. Código: {response.status_code}")
+            response.close()
+
+        self.log_message(f"❌ Todas as tentativas falharam para CNPJ {cnpj} {descrever_periodo(data_inicio, data_fim)}. Continuando com o próximo...")
+        return None
+
+    def montar_dados_xml(self, metadados, xml_type):
+        return {
+            "ano": metadados.ano,
+            "mes": metadados.mes,
+            "cnpj_emit": metadados.cnpj_emit,
+            "numero_nota": metadados.numero,
+            "tipo_nota": "entrada" if metadados.tipo == "0" else "saida",
+            "doc_type": DOC_TYPES[xml_type]['name']
+        }
+
+    def salvar_xml(self, xml_bytes, dados_xml, i, xml_type, ao_concluir=None):
+        mes_nome = MESES.get(dados_xml["mes"], dados_xml["mes"])
+
+        # Define o caminho base dependendo do tipo de nota
+        if dados_xml["tipo_nota"] == "entrada":
+            # Para notas de entrada, salva direto na pasta do mês
+            dir_path = os.path.join(self.xml_base_dir, dados_xml["doc_type"], 
+                                  dados_xml["tipo_nota"], dados_xml["ano"], mes_nome)
+        else:
+            # Para notas de saída, mantém a estrutura original com pasta do CNPJ
+            dir_path = os.path.join(self.xml_base_dir, dados_xml["doc_type"], 
+                                  dados_xml["tipo_nota"], dados_xml["ano"], 
+                                  mes_nome, dados_xml["cnpj_emit"])
+
+        numero_nota = dados_xml["numero_nota"] or f"{i}"
+
+        # O tempo até o arquivo estar gravado, incluindo a espera na fila, entra nas métricas
+        ao_concluir = metricas.ao_concluir("salvar", ao_concluir, dados_xml["cnpj_emit"], dados_xml["doc_type"],
+                                           len(xml_bytes))
+
+        # Para notas de entrada, um arquivo com o mesmo número recebe um contador no nome
+        escritor.enviar(dir_path, f"{numero_nota}.xml", xml_bytes,
+                        numerar=dados_xml["tipo_nota"] == "entrada", ao_concluir=ao_concluir)
+
+
 class XMLProcessorGUI(QMainWindow):
     def __init__(self):
         super().__init__()
         self.db = db  # Assign the module-level db to self.db
+        self.snapshot = snapshot
         self.xml_base_dir = DEFAULT_XML_BASE_DIR
+        # Workers do processamento, fora da thread da interface
+        self.pool = QThreadPool()
+        self.controle = None
+        self.workers = {}
         self.initUI()
         self.log_message("🔄 Inicializando interface do processador de XMLs")
         registros_removidos = self.db.limpar_registros_antigos(90)
         self.log_message(f"🧹 Limpeza de registros antigos: {registros_removidos} registros removidos")
+        if registros_removidos:
+            # O snapshot é reconstruído sem os documentos removidos do banco
+            self.snapshot.carregar()
         self.log_message(f"📁 Diretório base para XMLs: {self.xml_base_dir}")
+        self.log_message(f"📝 Log completo em: {os.path.abspath(ARQUIVO_LOG)}")
 
     def initUI(self):
         self.setWindowTitle('Processador de XMLs SIEG')
@@ -137,27 +593,100 @@ class XMLProcessorGUI(QMainWindow):
         self.process_button.clicked.connect(self.process_cnpjs)
         layout.addWidget(self.process_button)
 
+        # Quantidade de CNPJs processados ao mesmo tempo
+        workers_widget = QWidget()
+        workers_layout = QHBoxLayout(workers_widget)
+
+        workers_label = QLabel('CNPJs simultâneos:')
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(1, MAX_WORKERS)
+        self.workers_input.setValue(WORKERS_PADRAO)
+
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.workers_input)
+        workers_layout.addStretch()
+        layout.addWidget(workers_widget)
+
+        # Pausa e cancelamento do processamento em andamento
+        control_widget = QWidget()
+        control_layout = QHBoxLayout(control_widget)
+
+        self.pause_button = QPushButton('Pausar')
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.pause_button.setEnabled(False)
+        self.cancel_button = QPushButton('Cancelar')
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        self.cancel_button.setEnabled(False)
+
+        control_layout.addWidget(self.pause_button)
+        control_layout.addWidget(self.cancel_button)
+        layout.addWidget(control_widget)
+
+        # Progresso por CNPJ
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat('%v de %m CNPJs')
+        self.progress_bar.setValue(0)
+        layout.addWidget(self.progress_bar)
+
+        # Botões para continuar o último processamento
+        resume_widget = QWidget()
+        resume_layout = QHBoxLayout(resume_widget)
+
+        self.resume_button = QPushButton('Retomar Processamento')
+        self.resume_button.clicked.connect(self.resume_processing)
+        self.retry_failed_button = QPushButton('Reprocessar Falhas')
+        self.retry_failed_button.clicked.connect(self.retry_failed)
+
+        resume_layout.addWidget(self.resume_button)
+        resume_layout.addWidget(self.retry_failed_button)
+        layout.addWidget(resume_widget)
+
         # Área de log
         log_label = QLabel('Log de Processamento:')
         layout.addWidget(log_label)
 
-        # Criar uma área de rolagem para o log
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll_content = QWidget()
-        self.log_layout = QVBoxLayout(scroll_content)
-        self.log_text = QTextEdit()
+        # Filtro de nível do log na tela; o arquivo de log recebe tudo
+        level_widget = QWidget()
+        level_layout = QHBoxLayout(level_widget)
+
+        level_label = QLabel('Nível do log:')
+        self.level_input = QComboBox()
+        self.level_input.addItems(NIVEIS_LOG.keys())
+        self.level_input.setCurrentText('Normal')
+        self.level_input.currentTextChanged.connect(self.update_log_level)
+
+        level_layout.addWidget(level_label)
+        level_layout.addWidget(self.level_input)
+        level_layout.addStretch()
+        layout.addWidget(level_widget)
+
+        # O log rola sozinho e guarda apenas as últimas linhas
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
-        self.log_layout.addWidget(self.log_text)
-        scroll.setWidget(scroll_content)
-        layout.addWidget(scroll)
+        self.log_text.setMaximumBlockCount(MAX_LINHAS_LOG)
+        layout.addWidget(self.log_text)
+
+        # As mensagens acumuladas são escritas na tela em lotes
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(INTERVALO_LOG)
+
+    def log_message(self, message, nivel=None):
+        registrar_log(message, nivel)
+
+    def flush_log(self):
+        mensagens = manipulador_tela.retirar()
+        if not mensagens:
+            return
+        # Só acompanha o fim do log se o usuário não tiver rolado para cima
+        barra = self.log_text.verticalScrollBar()
+        no_fim = barra.value() == barra.maximum()
+        self.log_text.appendPlainText("\n".join(mensagens))
+        if no_fim:
+            barra.setValue(barra.maximum())
 
-    def log_message(self, message):
-        self.log_text.append(message)
-        self.log_text.verticalScrollBar().setValue(
-            self.log_text.verticalScrollBar().maximum()
-        )
-        QApplication.processEvents()
+    def update_log_level(self, nome):
+        manipulador_tela.setLevel(NIVEIS_LOG[nome])
 
     def validate_cnpj(self, cnpj):
         # Remove caracteres não numéricos
@@ -195,227 +724,129 @@ class XMLProcessorGUI(QMainWindow):
             QMessageBox.warning(self, 'Erro', 'A data inicial deve ser anterior ou igual à data final.')
             return
 
-        # Desabilitar botão durante o processamento
-        self.process_button.setEnabled(False)
-
-        try:
-            self.log_message(f"📋 Processando {len(valid_cnpjs)} CNPJs...")
-
-            for cnpj in valid_cnpjs:
-                self.log_message(f"\n🔄 Processando CNPJ: {cnpj}")
-                self.process_single_cnpj(cnpj, start_date, end_date)
-
-            self.log_message("\n✅ Processamento concluído!")
+        data_inicio = start_date.strftime("%Y-%m-%d")
+        data_fim = end_date.strftime("%Y-%m-%d")
 
-        except Exception as e:
-            self.log_message(f"\n❌ Erro durante o processamento: {str(e)}")
+        # Processar os tipos de documento selecionados
+        xml_types = []
+        if self.nfe_checkbox.isChecked():
+            xml_types.append(1)  # NFe
+        if self.cte_checkbox.isChecked():
+            xml_types.append(2)  # CTE
 
-        finally:
-            # Reabilitar botão após o processamento
-            self.process_button.setEnabled(True)
-
-    def process_single_cnpj(self, cnpj, start_date, end_date):
-        current_date = start_date
-        while current_date <= end_date:
-            data_str = current_date.strftime("%Y-%m-%d")
-            
-            # Processar os tipos de documento selecionados
-            if self.nfe_checkbox.isChecked():
-                self.process_xml_type(cnpj, data_str, 1)  # NFe
-            if self.cte_checkbox.isChecked():
-                self.process_xml_type(cnpj, data_str, 2)  # CTE
+        # Todas as consultas são gravadas na jornada antes de começar
+        unidades = []
+        for cnpj in valid_cnpjs:
+            unidades.extend(planejar_unidades(cnpj, data_inicio, data_fim, xml_types))
+        jornada.nova_execucao(unidades)
 
-            current_date = current_date + timedelta(days=1)
-
-    def process_xml_type(self, cnpj, data_str, xml_type):
-        self.log_message(f"📅 Buscando {DOC_TYPES[xml_type]['name']} para CNPJ {cnpj} na data {data_str}")
-        skip = 0
-        tem_mais_xmls = True
-
-        while tem_mais_xmls:
-            response = self.fazer_requisicao_api(cnpj, data_str, skip, xml_type)
-
-            if response is None:
-                tem_mais_xmls = False
-                continue
-
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    self.log_message(f"🔹 Processando resposta para CNPJ {cnpj} do dia {data_str} (Skip: {skip})")
-
-                    if "xmls" in data and isinstance(data["xmls"], list) and len(data["xmls"]) > 0:
-                        novos_arquivos = 0
-                        for i, xml_base64 in enumerate(data["xmls"], 1):
-                            xml_hash = hash(xml_base64)
-                            self.log_message(f"🔍 Verificando XML {i} no banco de dados...")
-                            if self.db.verificar_xml_existente(xml_hash):
-                                self.log_message(f"⚠️ XML {i} já foi baixado anteriormente (hash encontrado). Pulando...")
-                                continue
-
-                            xml_content = base64.b64decode(xml_base64).decode("utf-8")
-                            dados_xml = self.extrair_dados_xml(xml_content, xml_type)
-
-                            if dados_xml:
-                                # Verificar se a nota já existe no banco de dados pelo CNPJ e número da nota
-                                numero_nota = dados_xml["numero_nota"]
-                                self.log_message(f"🔍 Verificando nota {numero_nota or 'sem número'} para CNPJ {cnpj}...")
-                                if numero_nota and self.db.verificar_nota_existente(cnpj, numero_nota):
-                                    self.log_message(f"⚠️ XML {i} com número {numero_nota} já foi baixado anteriormente para o CNPJ {cnpj}. Pulando...")
-                                    continue
-                                else:
-                                    self.log_message(f"✅ Nota {numero_nota or 'sem número'} para CNPJ {cnpj} não encontrada no banco. Processando...")
-                                    
-                                file_name = self.salvar_xml(xml_content, dados_xml, i, xml_type)
-                                if file_name:
-                                    self.log_message(f"🔄 Registrando XML {i} no banco de dados...")
-                                    if self.db.registrar_xml(xml_hash, cnpj, dados_xml["numero_nota"]):
-                                        novos_arquivos += 1
-                                        self.log_message(f"✅ XML {i} salvo em: {file_name} e registrado no banco com sucesso")
-                                    else:
-                                        self.log_message(f"⚠️ XML {i} salvo em arquivo, mas houve um problema ao registrar no banco de dados")
-
-                        if len(data["xmls"]) == 50:
-                            skip += 50
-                            time.sleep(2)
-                        else:
-                            tem_mais_xmls = False
-
-                        if novos_arquivos == 0:
-                            self.log_message(f"⚠️ Nenhum novo XML encontrado para CNPJ {cnpj} no dia {data_str}.")
-                    else:
-                        self.log_message(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} no dia {data_str}.")
-                        tem_mais_xmls = False
-
-                except json.JSONDecodeError:
-                    self.log_message("❌ Erro ao decodificar a resposta JSON.")
-                    tem_mais_xmls = False
-            else:
-                self.log_message(f"❌ Erro na requisição: {response.status_code} - {response.text}")
-                tem_mais_xmls = False
+        self.log_message(f"📋 Processando {len(valid_cnpjs)} CNPJs...")
+        self.run_units(unidades)
 
-            time.sleep(2)
-            
-    def fazer_requisicao_api(self, cnpj, data_str, skip=0, xml_type=1, max_retries=5, retry_delay=5):
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "XmlType": xml_type,
-            "Take": 50,
-            "Skip": skip,
-            "DataEmissaoInicio": data_str,
-            "DataEmissaoFim": data_str,
-            "CnpjEmit": cnpj,
-            "Downloadevent": False
-        }
-
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(URL, headers=headers, json=payload)
-
-                if response.status_code == 404:
-                    try:
-                        error_message = response.json()
-                        if isinstance(error_message, list) and len(error_message) > 0 and "Nenhum arquivo XML localizado" in error_message[0]:
-                            return response
-                    except:
-                        pass
-
-                if response.status_code == 200:
-                    return response
-
-                self.log_message(f"⚠️ Tentativa {attempt + 1} de {max_retries} falhou. Código: {response.status_code}")
-
-                if attempt < max_retries - 1:
-                    self.log_message(f"🔄 Aguardando {retry_delay} segundos antes de tentar novamente...")
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    self.log_message(f"❌ Todas as tentativas falharam para CNPJ {cnpj} na data {data_str}. Continuando com o próximo...")
-                    return None
-
-            except requests.exceptions.RequestException as e:
-                if attempt < max_retries - 1:
-                    self.log_message(f"⚠️ Erro de conexão na tentativa {attempt + 1} de {max_retries}: {str(e)}")
-                    self.log_message(f"🔄 Aguardando {retry_delay} segundos antes de tentar novamente...")
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    self.log_message(f"❌ Todas as tentativas falharam para CNPJ {cnpj} na data {data_str}. Continuando com o próximo...")
-                    return None
-
-        return None
-
-    def extrair_dados_xml(self, xml_content, xml_type):
-        try:
-            root = ET.fromstring(xml_content)
-            ns = {"ns": "http://www.portalfiscal.inf.br/nfe" if xml_type == 1 else "http://www.portalfiscal.inf.br/cte"}
-
-            dhEmi = root.find(".//ns:dhEmi", ns)
-            data_emissao = dhEmi.text[:10] if dhEmi is not None else "0000-00-00"
-            ano, mes, _ = data_emissao.split("-")
-
-            cnpj_emit = root.find(".//ns:emit/ns:CNPJ", ns)
-            cnpj_emit = cnpj_emit.text if cnpj_emit is not None else "00000000000000"
-
-            doc_config = DOC_TYPES[xml_type]
-            numero = root.find(f".//ns:{doc_config['number_tag']}", ns)
-            numero_doc = numero.text if numero is not None else None
-
-            tipo = root.find(f".//ns:{doc_config['type_tag']}", ns)
-            tipo_doc = "entrada" if tipo is not None and tipo.text == "0" else "saida"
-
-            return {
-                "ano": ano,
-                "mes": mes,
-                "cnpj_emit": cnpj_emit,
-                "numero_nota": numero_doc,
-                "tipo_nota": tipo_doc,
-                "doc_type": doc_config['name']
-            }
-        except Exception as e:
-            self.log_message(f"❌ Erro ao extrair dados do XML: {e}")
-            return None
+    def resume_processing(self):
+        self.log_text.clear()
+        unidades = jornada.retomar()
+        if not unidades:
+            QMessageBox.information(self, 'Retomar', 'Nenhum processamento interrompido para retomar.')
+            return
+        self.log_message(f"♻️ Retomando {len(unidades)} consultas não concluídas do processamento de {jornada.execucao}...")
+        self.run_units(unidades)
 
-    def salvar_xml(self, xml_content, dados_xml, i, xml_type):
+    def retry_failed(self):
+        self.log_text.clear()
+        unidades = jornada.reabrir_falhas()
+        if not unidades:
+            QMessageBox.information(self, 'Reprocessar', 'Nenhuma consulta com falha no último processamento.')
+            return
+        self.log_message(f"🔁 Repetindo {len(unidades)} consultas que falharam no processamento de {jornada.execucao}...")
+        self.run_units(unidades)
+
+    def set_buttons_enabled(self, habilitado):
+        self.process_button.setEnabled(habilitado)
+        self.resume_button.setEnabled(habilitado)
+        self.retry_failed_button.setEnabled(habilitado)
+        self.workers_input.setEnabled(habilitado)
+        self.pause_button.setEnabled(not habilitado)
+        self.cancel_button.setEnabled(not habilitado)
+
+    def run_units(self, unidades):
+        # Um worker por CNPJ; o pool limita quantos rodam ao mesmo tempo
+        por_cnpj = {}
+        for unidade in unidades:
+            por_cnpj.setdefault(unidade.cnpj, []).append(unidade)
+
+        self.controle = ControleExecucao()
+        metricas.zerar()
+        self.pool.setMaxThreadCount(self.workers_input.value())
+        self.progress_bar.setRange(0, len(por_cnpj))
+        self.progress_bar.setValue(0)
+        self.pause_button.setText('Pausar')
+        # Desabilitar botões durante o processamento
+        self.set_buttons_enabled(False)
+
+        for cnpj, unidades_cnpj in por_cnpj.items():
+            worker = WorkerCNPJ(cnpj, unidades_cnpj, self.xml_base_dir, self.controle)
+            worker.sinais.concluido.connect(self.worker_finished)
+            self.workers[cnpj] = worker
+            self.pool.start(worker)
+
+        if not por_cnpj:
+            self.finish_processing()
+
+    def worker_finished(self, cnpj):
+        self.workers.pop(cnpj, None)
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+        if not self.workers:
+            self.finish_processing()
+
+    def finish_processing(self):
+        if self.controle.cancelado:
+            self.log_message("\n⏹️ Processamento cancelado. Use 'Retomar Processamento' para continuar de onde parou.")
+        else:
+            self.log_message("\n✅ Processamento concluído!")
+        estatisticas = transporte.estatisticas()
+        self.log_message(f"📊 {estatisticas['requisicoes']} requisições à API - latência média {estatisticas['media']:.2f}s, "
+                         f"p95 {estatisticas['p95']:.2f}s, máxima {estatisticas['maxima']:.2f}s")
+
+        resumo = jornada.resumo()
+        self.log_message(f"📒 Consultas: {resumo[CONCLUIDA]} concluídas, {resumo[FALHOU]} com falha, "
+                         f"{resumo[PENDENTE] + resumo[EM_ANDAMENTO]} pendentes")
+        if resumo[FALHOU]:
+            self.log_message("⚠️ Use 'Reprocessar Falhas' para repetir apenas as consultas que falharam.")
+
+        for linha in metricas.linhas_resumo():
+            self.log_message(linha)
         try:
-            mes_nome = MESES.get(dados_xml["mes"], dados_xml["mes"])
-            
-            # Define o caminho base dependendo do tipo de nota
-            if dados_xml["tipo_nota"] == "entrada":
-                # Para notas de entrada, salva direto na pasta do mês
-                dir_path = os.path.join(self.xml_base_dir, dados_xml["doc_type"], 
-                                      dados_xml["tipo_nota"], dados_xml["ano"], mes_nome)
-            else:
-                # Para notas de saída, mantém a estrutura original com pasta do CNPJ
-                dir_path = os.path.join(self.xml_base_dir, dados_xml["doc_type"], 
-                                      dados_xml["tipo_nota"], dados_xml["ano"], 
-                                      mes_nome, dados_xml["cnpj_emit"])
-            
-            os.makedirs(dir_path, exist_ok=True)
-            
-            numero_nota = dados_xml["numero_nota"] or f"{i}"
-            
-            # Para notas de entrada, verifica se já existe arquivo com mesmo número
-            if dados_xml["tipo_nota"] == "entrada":
-                base_name = f"{numero_nota}.xml"
-                file_name = os.path.join(dir_path, base_name)
-                counter = 1
-                
-                # Enquanto existir um arquivo com o mesmo nome, adiciona um contador
-                while os.path.exists(file_name):
-                    base_name = f"{numero_nota}_{counter}.xml"
-                    file_name = os.path.join(dir_path, base_name)
-                    counter += 1
-            else:
-                file_name = os.path.join(dir_path, f"{numero_nota}.xml")
-        
-            with open(file_name, "w", encoding="utf-8") as file:
-                file.write(xml_content)
-        
-            return file_name
-        except Exception as e:
-            self.log_message(f"❌ Erro ao salvar XML: {e}")
-            return None
+            caminho_prometheus, caminho_json = metricas.exportar("interface")
+            self.log_message(f"📈 Métricas exportadas para {caminho_prometheus} e {caminho_json}")
+        except OSError as e:
+            self.log_message(f"❌ Erro ao exportar as métricas: {e}")
+
+        # Reabilitar botões após o processamento
+        self.set_buttons_enabled(True)
+
+    def toggle_pause(self):
+        if self.controle.pausado:
+            self.controle.continuar()
+            self.pause_button.setText('Pausar')
+            self.log_message("▶️ Processamento retomado.")
+        else:
+            self.controle.pausar()
+            self.pause_button.setText('Continuar')
+            self.log_message("⏸️ Pausando após as consultas em andamento...")
+
+    def cancel_processing(self):
+        self.controle.cancelar()
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        self.log_message("⏹️ Cancelando após as consultas em andamento...")
+
+    def closeEvent(self, event):
+        # Não deixa workers gravando depois que a janela fecha
+        if self.workers:
+            self.controle.cancelar()
+            self.pool.waitForDone()
+        event.accept()
 
     def load_cnpjs_from_excel(self):
         try:
@@ -483,4 +914,12 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = XMLProcessorGUI()
     window.show()
-    sys.exit(app.exec_())
+    if sincronizador:
+        sincronizador.iniciar()
+    codigo_saida = app.exec_()
+    escritor.fechar()
+    if sincronizador:
+        sincronizador.fechar()
+    snapshot.fechar()
+    db.fechar()
+    sys.exit(codigo_saida)
@@ -0,0 +1,95 @@
+import threading
+from datetime import datetime
+
+from query_planner import UnidadeTrabalho
+
+# Estados de uma unidade de trabalho na jornada
+PENDENTE = "pendente"
+EM_ANDAMENTO = "em_andamento"
+CONCLUIDA = "concluida"
+FALHOU = "falhou"
+
+
+class JobJournal:
+    """Jornada persistente das unidades de trabalho de uma execução.
+
+    Cada unidade planejada (e cada página ou metade de período descoberta
+    durante a execução) é gravada no banco como pendente, passa a em andamento
+    quando a busca começa e termina como concluída, quando todos os seus XMLs
+    foram gravados e registrados, ou como falha. Se o processo for interrompido,
+    `retomar()` devolve exatamente as unidades que não terminaram; as que falharam
+    podem ser repetidas depois com `reabrir_falhas()`, sem refazer as concluídas.
+
+    `origem` separa as execuções do script ("cli") e da interface ("interface").
+    """
+
+    def __init__(self, db, origem):
+        self.db = db
+        self.origem = origem
+        self.execucao = None
+        self._concluidas = set()
+        self._lock = threading.Lock()
+
+    def nova_execucao(self, unidades):
+        """Inicia uma execução com as unidades planejadas, todas pendentes."""
+        with self._lock:
+            self.execucao = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+            self._concluidas = set()
+        self.db.registrar_unidades(self.execucao, self.origem, unidades, PENDENTE)
+
+    def _abrir_ultima(self, estados):
+        execucao = self.db.ultima_execucao(self.origem)
+        if execucao is None:
+            return []
+        linhas = self.db.listar_unidades(execucao)
+        with self._lock:
+            self.execucao = execucao
+            self._concluidas = {tuple(linha[:5]) for linha in linhas if linha[5] == CONCLUIDA}
+        return [UnidadeTrabalho(*linha[:5]) for linha in linhas if linha[5] in estados]
+
+    def retomar(self):
+        """Retoma a última execução, devolvendo as unidades pendentes ou interrompidas em andamento."""
+        unidades = self._abrir_ultima((PENDENTE, EM_ANDAMENTO))
+        if not unidades:
+            with self._lock:
+                self.execucao = None
+        return unidades
+
+    def reabrir_falhas(self):
+        """Volta as unidades com falha da última execução para pendentes e as devolve."""
+        unidades = self._abrir_ultima((FALHOU,))
+        if unidades:
+            self.db.registrar_unidades(self.execucao, self.origem, unidades, PENDENTE)
+        return unidades
+
+    def ja_concluida(self, unidade):
+        with self._lock:
+            return tuple(unidade) in self._concluidas
+
+    def registrar(self, unidade, estado, erro=None):
+        """Grava o novo estado da unidade. Sem uma execução aberta, não faz nada."""
+        with self._lock:
+            execucao = self.execucao
+            if execucao is None:
+                return
+            if estado == CONCLUIDA:
+                self._concluidas.add(tuple(unidade))
+        self.db.registrar_unidades(execucao, self.origem, [unidade], estado, erro,
+                                   tentativa=estado == EM_ANDAMENTO)
+
+    def descartar(self, unidade):
+        """Remove uma unidade que deixou de ser necessária (página além do fim da consulta)."""
+        with self._lock:
+            execucao = self.execucao
+        if execucao is not None:
+            self.db.remover_unidade(execucao, unidade)
+
+    def resumo(self):
+        """Quantidade de unidades da execução atual por estado."""
+        with self._lock:
+            execucao = self.execucao
+        resumo = {PENDENTE: 0, EM_ANDAMENTO: 0, CONCLUIDA: 0, FALHOU: 0}
+        if execucao is not None:
+            for *_, estado in self.db.listar_unidades(execucao):
+                resumo[estado] = resumo.get(estado, 0) + 1
+        return resumo
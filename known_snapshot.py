@@ -0,0 +1,153 @@
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from array import array
+
+# Cabeçalho: identificador, quantidade de digests, marca d'água (maior data_processamento incluída)
+# e quantidade de registros do banco quando o snapshot foi gravado
+_MAGICO = b"SIEGSNP2"
+_CABECALHO = struct.Struct("<8sQ32sQ")
+
+
+def digest_64(chave):
+    """Digest de 64 bits da chave do documento, usado no snapshot."""
+    return int.from_bytes(hashlib.blake2b(chave.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class KnownSnapshot:
+    """Snapshot em disco dos documentos já conhecidos, para deduplicação sem consultas.
+
+    O arquivo contém um vetor ordenado de digests de 64 bits das chaves de
+    `xml_hashes`, mapeado em memória; processos na mesma máquina compartilham as
+    páginas do arquivo pelo cache do sistema operacional. A verificação é uma
+    busca binária: um resultado negativo é definitivo, um positivo é apenas
+    provável (colisão ou registro já removido do banco) e deve ser confirmado no
+    SQLite. Documentos registrados durante a execução ficam em um conjunto em
+    memória até a próxima atualização.
+    """
+
+    def __init__(self, db, caminho=None):
+        self.db = db
+        self.caminho = caminho or f"{os.path.splitext(db.db_name)[0]}_snapshot.bin"
+        self._arquivo = None
+        self._mmap = None
+        self._visao = None
+        self._digests = memoryview(array("Q"))
+        self._caminho_privado = None
+        self._novos = set()
+        self._lock = threading.Lock()
+
+    def _ler_existente(self):
+        """Lê os digests, a marca d'água e a quantidade de registros do snapshot atual, se houver um válido."""
+        try:
+            with open(self.caminho, "rb") as arquivo:
+                magico, quantidade, marca, registros = _CABECALHO.unpack(arquivo.read(_CABECALHO.size))
+                if magico != _MAGICO:
+                    return array("Q"), None, 0
+                digests = array("Q")
+                digests.frombytes(arquivo.read(quantidade * digests.itemsize))
+                return digests, marca.rstrip(b"\0").decode("ascii") or None, registros
+        except (OSError, struct.error, ValueError):
+            return array("Q"), None, 0
+
+    def _gravar(self, digests, marca, registros):
+        """Grava o snapshot em um arquivo temporário e o coloca no lugar do atual."""
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as arquivo:
+            arquivo.write(_CABECALHO.pack(_MAGICO, len(digests), (marca or "").encode("ascii"), registros))
+            digests.tofile(arquivo)
+        try:
+            os.replace(temporario, self.caminho)
+            return self.caminho
+        except PermissionError:
+            # No Windows o arquivo não pode ser substituído enquanto outro processo o mapeia;
+            # este processo usa a própria cópia até a próxima execução
+            return temporario
+
+    def carregar(self):
+        """Atualiza o snapshot com os registros novos do banco e o mapeia em memória.
+
+        Se o banco tem menos registros do que o snapshot gravado mais os registros
+        novos, algo foi removido (a limpeza de 90 dias) e o snapshot é reconstruído
+        do zero, para não manter digests de documentos que o banco já não conhece.
+        """
+        digests, marca, registros = self._ler_existente()
+        total_banco = self.db.contar_registros()
+        linhas = self.db.listar_chaves(desde=marca)
+        if marca is not None:
+            # Registros com a própria marca d'água já estavam no snapshot
+            recentes = sum(1 for _, data_processamento in linhas if data_processamento and data_processamento > marca)
+            if total_banco < registros + recentes:
+                print("🔄 Registros removidos do banco desde o último snapshot. Reconstruindo...")
+                digests, marca = array("Q"), None
+                linhas = self.db.listar_chaves()
+
+        existentes = set(digests)
+        novos = set()
+        nova_marca = marca
+        for chave, data_processamento in linhas:
+            novos.add(digest_64(chave))
+            if data_processamento and (nova_marca is None or data_processamento > nova_marca):
+                nova_marca = data_processamento
+        novos -= existentes
+
+        caminho = self.caminho
+        if novos or marca is None or registros != total_banco or not os.path.exists(self.caminho):
+            digests = array("Q", sorted(existentes | novos))
+            caminho = self._gravar(digests, nova_marca, total_banco)
+
+        self._mapear(caminho)
+        print(f"📦 Snapshot de documentos conhecidos: {len(self._digests)} registros ({len(novos)} novos).")
+        return len(self._digests)
+
+    def _mapear(self, caminho):
+        self.fechar()
+        self._arquivo = open(caminho, "rb")
+        self._caminho_privado = caminho if caminho != self.caminho else None
+        tamanho = os.fstat(self._arquivo.fileno()).st_size
+        if tamanho <= _CABECALHO.size:
+            self._digests = memoryview(array("Q"))
+            return
+        self._mmap = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        self._visao = memoryview(self._mmap)
+        self._digests = self._visao[_CABECALHO.size:].cast("Q")
+
+    def provavelmente_conhecido(self, chave):
+        """False se o documento certamente é novo; True se provavelmente já foi baixado."""
+        valor = digest_64(chave)
+        with self._lock:
+            if valor in self._novos:
+                return True
+        posicao = bisect.bisect_left(self._digests, valor)
+        return posicao < len(self._digests) and self._digests[posicao] == valor
+
+    def confirmar_conhecidos(self, chaves):
+        """Das chaves que o snapshot provavelmente conhece, retorna as que o banco confirma."""
+        return self.db.filtrar_documentos_existentes(chaves)
+
+    def adicionar(self, chaves):
+        """Inclui chaves registradas durante a execução."""
+        with self._lock:
+            self._novos.update(digest_64(chave) for chave in chaves)
+
+    def fechar(self):
+        self._digests.release()
+        self._digests = memoryview(array("Q"))
+        if self._visao is not None:
+            self._visao.release()
+            self._visao = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+        if self._caminho_privado:
+            try:
+                os.remove(self._caminho_privado)
+            except OSError:
+                pass
+            self._caminho_privado = None
@@ -0,0 +1,275 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+# Limites superiores dos baldes dos histogramas de latência, em segundos
+LIMITES_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Diretório dos arquivos exportados ao fim de cada execução (ao lado do banco de dados)
+DIRETORIO_METRICAS = "metricas"
+# Prefixo dos nomes das métricas no formato do Prometheus
+PREFIXO_PROMETHEUS = "aut_nfe"
+
+_ROTULOS = ("etapa", "operacao", "cnpj", "tipo")
+
+
+class Histograma:
+    """Contagem de medições por balde de latência, com soma e máxima."""
+
+    def __init__(self, limites=LIMITES_LATENCIA):
+        self.limites = limites
+        self.baldes = [0] * (len(limites) + 1)  # o último é o +Inf
+        self.quantidade = 0
+        self.soma = 0.0
+        self.maxima = 0.0
+
+    def observar(self, segundos):
+        indice = len(self.limites)
+        for posicao, limite in enumerate(self.limites):
+            if segundos <= limite:
+                indice = posicao
+                break
+        self.baldes[indice] += 1
+        self.quantidade += 1
+        self.soma += segundos
+        self.maxima = max(self.maxima, segundos)
+
+    def percentil(self, fracao):
+        """Limite do balde que contém o percentil (estimativa por cima); a máxima no balde +Inf."""
+        if not self.quantidade:
+            return 0.0
+        alvo = fracao * self.quantidade
+        acumulado = 0
+        for limite, contagem in zip(self.limites, self.baldes):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return min(limite, self.maxima)
+        return self.maxima
+
+    def somar(self, outro):
+        for indice, contagem in enumerate(outro.baldes):
+            self.baldes[indice] += contagem
+        self.quantidade += outro.quantidade
+        self.soma += outro.soma
+        self.maxima = max(self.maxima, outro.maxima)
+
+
+class Serie:
+    """Medições de uma combinação de etapa, operação, CNPJ e tipo de documento."""
+
+    def __init__(self):
+        self.latencia = Histograma()
+        self.itens = 0
+        self.bytes = 0
+        self.erros = 0
+
+
+class Medicao:
+    """Medição em andamento de `Metricas.medir`; quem mede informa itens, bytes e erro."""
+
+    def __init__(self):
+        self.itens = 1
+        self.bytes = 0
+        self.erro = False
+
+
+class Metricas:
+    """Latência, quantidade, bytes e erros por etapa do processamento.
+
+    As etapas medidas são a chamada à API até a chegada dos cabeçalhos (`api`,
+    com as retentativas), a leitura do corpo da resposta pela rede (`download`),
+    a decodificação e análise dos XMLs, medida no próprio processo de análise
+    (`extracao`), o caminho de cada XML até estar gravado (`salvar`, com a
+    espera na fila), a gravação em si (`gravacao` ou `spool`) e as operações do
+    banco de dados (`banco`, com o nome do método em `operacao`). Cada série é
+    separada também por CNPJ e tipo de documento quando a etapa os conhece.
+
+    Ao fim da execução, `exportar()` grava um arquivo no formato texto do
+    Prometheus (para o textfile collector do node_exporter) e um resumo em JSON.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self.inicio = time.time()
+
+    def zerar(self):
+        """Descarta as medições, começando uma nova execução."""
+        with self._lock:
+            self._series = {}
+            self.inicio = time.time()
+
+    def registrar(self, etapa, segundos, operacao="", cnpj="", tipo="", itens=1, tamanho=0, erro=False):
+        chave = (etapa, operacao, cnpj, str(tipo))
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = Serie()
+            serie.latencia.observar(segundos)
+            serie.itens += itens
+            serie.bytes += tamanho
+            if erro:
+                serie.erros += 1
+
+    @contextmanager
+    def medir(self, etapa, operacao="", cnpj="", tipo="", ignorar=()):
+        """Mede o bloco; uma exceção que saia dele conta como erro.
+
+        Exceções de `ignorar` (ex.: chamada adiada) descartam a medição.
+        """
+        medicao = Medicao()
+        inicio = time.perf_counter()
+        try:
+            yield medicao
+        except ignorar:
+            medicao = None
+            raise
+        except BaseException:
+            medicao.erro = True
+            raise
+        finally:
+            if medicao is not None:
+                self.registrar(etapa, time.perf_counter() - inicio, operacao, cnpj, tipo,
+                               medicao.itens, medicao.bytes, medicao.erro)
+
+    def cronometrar(self, etapa):
+        """Decorador que mede cada chamada da função, com o nome dela como operação."""
+        def decorar(funcao):
+            @wraps(funcao)
+            def medida(*args, **kwargs):
+                with self.medir(etapa, funcao.__name__):
+                    return funcao(*args, **kwargs)
+            return medida
+        return decorar
+
+    def ao_concluir(self, etapa, ao_concluir, cnpj="", tipo="", tamanho=0):
+        """Envolve um callback `ao_concluir(caminho, erro)`, medindo o tempo desde agora até ele ser chamado."""
+        inicio = time.perf_counter()
+
+        def concluir(caminho, erro):
+            self.registrar(etapa, time.perf_counter() - inicio, cnpj=cnpj, tipo=tipo,
+                           tamanho=tamanho, erro=erro is not None)
+            if ao_concluir is not None:
+                ao_concluir(caminho, erro)
+
+        return concluir
+
+    def _copiar_series(self):
+        with self._lock:
+            return list(self._series.items()), self.inicio
+
+    def resumo(self):
+        """Totais por etapa, somando CNPJs e tipos, e o detalhe de cada série."""
+        series, inicio = self._copiar_series()
+        etapas = {}
+        detalhes = []
+        for (etapa, operacao, cnpj, tipo), serie in sorted(series, key=lambda item: item[0]):
+            total = etapas.get(etapa)
+            if total is None:
+                total = etapas[etapa] = Serie()
+            total.latencia.somar(serie.latencia)
+            total.itens += serie.itens
+            total.bytes += serie.bytes
+            total.erros += serie.erros
+            detalhes.append(dict(zip(_ROTULOS, (etapa, operacao, cnpj, tipo)), **_descrever(serie)))
+        return {
+            "inicio": datetime.fromtimestamp(inicio).isoformat(timespec="seconds"),
+            "duracao": round(time.time() - inicio, 3),
+            "etapas": {etapa: _descrever(total) for etapa, total in etapas.items()},
+            "series": detalhes
+        }
+
+    def linhas_resumo(self):
+        """Uma linha legível por etapa, para o fim do processamento."""
+        linhas = []
+        for etapa, dados in self.resumo()["etapas"].items():
+            linhas.append(f"⏱️ {etapa}: {dados['chamadas']} chamadas, {dados['itens']} itens, "
+                          f"{dados['bytes'] / 1024 / 1024:.1f} MB, média {dados['media']:.3f}s, "
+                          f"p95 ≤ {dados['p95']:.3f}s, máxima {dados['maxima']:.3f}s, {dados['erros']} erros")
+        return linhas
+
+    def prometheus(self):
+        """Texto das métricas no formato de exposição do Prometheus."""
+        series, inicio = self._copiar_series()
+        series.sort(key=lambda item: item[0])
+        nome_latencia = f"{PREFIXO_PROMETHEUS}_duracao_segundos"
+        linhas = [f"# HELP {nome_latencia} Latência por etapa do processamento.",
+                  f"# TYPE {nome_latencia} histogram"]
+        for chave, serie in series:
+            rotulos = _rotulos(chave)
+            acumulado = 0
+            for limite, contagem in zip(serie.latencia.limites, serie.latencia.baldes):
+                acumulado += contagem
+                linhas.append(f'{nome_latencia}_bucket{{{rotulos}{"," if rotulos else ""}le="{limite}"}} {acumulado}')
+            linhas.append(f'{nome_latencia}_bucket{{{rotulos}{"," if rotulos else ""}le="+Inf"}} {serie.latencia.quantidade}')
+            linhas.append(f"{nome_latencia}_sum{{{rotulos}}} {serie.latencia.soma:.6f}")
+            linhas.append(f"{nome_latencia}_count{{{rotulos}}} {serie.latencia.quantidade}")
+
+        for nome, descricao, valor in (("itens_total", "Itens processados por etapa (XMLs, páginas, registros).", "itens"),
+                                       ("bytes_total", "Bytes processados por etapa.", "bytes"),
+                                       ("erros_total", "Chamadas com erro por etapa.", "erros")):
+            linhas.append(f"# HELP {PREFIXO_PROMETHEUS}_{nome} {descricao}")
+            linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_{nome} counter")
+            for chave, serie in series:
+                linhas.append(f"{PREFIXO_PROMETHEUS}_{nome}{{{_rotulos(chave)}}} {getattr(serie, valor)}")
+
+        linhas.append(f"# HELP {PREFIXO_PROMETHEUS}_execucao_inicio_segundos Início da execução (epoch).")
+        linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_execucao_inicio_segundos gauge")
+        linhas.append(f"{PREFIXO_PROMETHEUS}_execucao_inicio_segundos {inicio:.0f}")
+        linhas.append(f"# HELP {PREFIXO_PROMETHEUS}_execucao_duracao_segundos Duração da execução.")
+        linhas.append(f"# TYPE {PREFIXO_PROMETHEUS}_execucao_duracao_segundos gauge")
+        linhas.append(f"{PREFIXO_PROMETHEUS}_execucao_duracao_segundos {time.time() - inicio:.3f}")
+        return "\n".join(linhas) + "\n"
+
+    def exportar(self, origem, diretorio=DIRETORIO_METRICAS):
+        """Grava `<origem>.prom` (substituído a cada execução) e `<origem>_<data e hora>.json`.
+
+        Retorna os caminhos dos dois arquivos.
+        """
+        os.makedirs(diretorio, exist_ok=True)
+        caminho_prometheus = os.path.join(diretorio, f"{origem}.prom")
+        _gravar_texto(caminho_prometheus, self.prometheus())
+        caminho_json = os.path.join(diretorio, f"{origem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        _gravar_texto(caminho_json, json.dumps(self.resumo(), ensure_ascii=False, indent=2))
+        return caminho_prometheus, caminho_json
+
+
+def _descrever(serie):
+    latencia = serie.latencia
+    return {
+        "chamadas": latencia.quantidade,
+        "itens": serie.itens,
+        "bytes": serie.bytes,
+        "erros": serie.erros,
+        "total_segundos": round(latencia.soma, 6),
+        "media": round(latencia.soma / latencia.quantidade, 6) if latencia.quantidade else 0.0,
+        "p50": latencia.percentil(0.5),
+        "p95": latencia.percentil(0.95),
+        "p99": latencia.percentil(0.99),
+        "maxima": round(latencia.maxima, 6),
+        "baldes": dict(zip([str(limite) for limite in latencia.limites] + ["+Inf"], latencia.baldes))
+    }
+
+
+def _rotulos(chave):
+    # Rótulos vazios são omitidos, como o Prometheus os trata
+    return ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(_ROTULOS, chave) if valor)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _gravar_texto(caminho, texto):
+    # O coletor nunca vê um arquivo pela metade
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        arquivo.write(texto)
+    os.replace(temporario, caminho)
+
+
+# Métricas globais da execução
+metricas = Metricas()
@@ -1,22 +1,42 @@
+import argparse
 import requests
-import json
 import sys
-import base64
 import os
 import openpyxl
-import xml.etree.ElementTree as ET
 import pandas as pd
 from datetime import datetime, timedelta
-import time
+import multiprocessing
+import threading
 from db_manager import DatabaseManager
+from fetch_engine import FetchEngine
+from query_planner import TAMANHO_PAGINA, deve_dividir, descrever_periodo
+from checkpoint_store import CheckpointStore
+from job_journal import JobJournal, CONCLUIDA, FALHOU
+from rate_limiter import limitador, tempo_retry_after
+from http_transport import transporte
+from retry_policy import politica_retry, obter_circuito, CircuitoAberto
+from known_snapshot import KnownSnapshot
+from stream_reader import receber_documentos
+from parse_pool import EstagioAnalise, PROCESSOS_ANALISE
+from file_writer import LoteGravacao
+from packed_storage import MODOS_ARMAZENAMENTO
+from spool_sync import EscritorSpool, SincronizadorSpool
+from metrics import metricas
 
 # Configurações da API
 API_KEY = ""
 URL = f"https://api.sieg.com/BaixarXmlsV2?api_key=7dJmT%2f0uVPbX8mEdBrZSdw%3d%3d"
 
+# Configurações de processamento
+DIAS_CONSULTA = 5  # Quantidade de dias anteriores a consultar
+MAX_CONCORRENCIA = 4  # Requisições simultâneas à API
+MODO_ARMAZENAMENTO = "arquivos"  # "arquivos" (XMLs soltos) ou "compactado" (um .zip por mês e CNPJ)
+USAR_SPOOL = True  # Grava primeiro em disco local e envia ao servidor de arquivos em lotes
+
 # Configurações de documentos
 DOC_TYPES = {
     1: {  # NFSe
+        "nome": "NFE",
         "base_dir": rf"\\192.168.1.240\Fiscal\Nota fiscal Eletronica\SIEG\NFE",
         "namespace": "http://www.portalfiscal.inf.br/nfe",
         "numero_tag": "nNF",
@@ -24,6 +44,7 @@ DOC_TYPES = {
         "tipo_map": {"0": "entrada", "1": "saida"}
     },
     2: {  # CTe
+        "nome": "CTE",
         "base_dir": rf"\\192.168.1.240\Fiscal\Nota fiscal Eletronica\SIEG\CTE",
         "namespace": "http://www.portalfiscal.inf.br/cte",
         "numero_tag": "nCT",
@@ -39,248 +60,426 @@ MESES = {
     "09": "Setembro", "10": "Outubro", "11": "Novembro", "12": "Dezembro"
 }
 
-# Inicializa o gerenciador do banco de dados
-db = DatabaseManager()
+# Configuração de extração enviada aos processos de análise, por tipo de documento
+CONFIG_EXTRACAO = {
+    xml_type: (config["namespace"], config["numero_tag"], config["tipo_tag"])
+    for xml_type, config in DOC_TYPES.items()
+}
+
+# Componentes da execução, criados por `iniciar_execucao()`. No Windows cada processo
+# de análise importa este módulo de novo, e a importação não deve abrir o banco de
+# dados nem criar as threads de gravação
+db = None
+# Snapshot dos documentos já baixados, para deduplicação sem consultas ao banco
+snapshot = None
+# Progresso das consultas, para que cada execução busque apenas o que ainda falta
+checkpoints = None
+# Jornada das consultas, para retomar uma execução interrompida
+jornada = None
+# Processos que decodificam e analisam os XMLs recebidos
+estagio_analise = None
+# Gravação dos XMLs em segundo plano. Com o spool, os XMLs são gravados em disco local
+# e o sincronizador os envia ao servidor de arquivos
+escritor = None
+sincronizador = None
+
+# Documentos enviados para gravação e ainda não registrados no banco, para que
+# páginas seguintes não gravem o mesmo documento ou nota de novo
+trava_em_gravacao = threading.Lock()
+chaves_em_gravacao = set()
+notas_em_gravacao = set()
+
+def fazer_requisicao_api(cnpj, data_inicio, data_fim, xml_type=1, skip=0, politica=politica_retry, stream=False):
+    """Faz uma requisição à API do SIEG para obter os XMLs do período com mecanismo de retry.
 
-def fazer_requisicao_api(cnpj, data_str, xml_type=1, skip=0, max_retries=5, retry_delay=5):
-    """Faz uma requisição à API do SIEG para obter os XMLs com mecanismo de retry."""
-    headers = {"Content-Type": "application/json"}
+    Levanta `CircuitoAberto` quando a API está indisponível, para que a chamada seja adiada.
+    """
     payload = {
         "XmlType": xml_type,  # 1 = NFe, 2 = CTe
-        "Take": 50,  # Máximo 50 XMLs por requisição
+        "Take": TAMANHO_PAGINA,  # Máximo 50 XMLs por requisição
         "Skip": skip,
-        "DataEmissaoInicio": data_str,
-        "DataEmissaoFim": data_str,
+        "DataEmissaoInicio": data_inicio,
+        "DataEmissaoFim": data_fim,
         "CnpjEmit": cnpj,
         "Downloadevent": False
     }
-    
-    for attempt in range(max_retries):
+    circuito = obter_circuito(URL)
+
+    def aguardar(segundos):
+        print(f"🔄 Aguardando {segundos:.1f} segundos antes de tentar novamente...")
+
+    for attempt in politica.tentativas(ao_aguardar=aguardar, ja_aguardando=limitador.pausa_restante):
+        # Com a API fora do ar, a chamada é adiada sem gastar tentativas
+        circuito.verificar()
         try:
-            response = requests.post(URL, headers=headers, json=payload)
-            
-            # Se a resposta for 404 com a mensagem específica de "Nenhum arquivo XML localizado",
-            # retornamos imediatamente pois isso não é um erro da API
-            if response.status_code == 404:
-                try:
-                    error_message = response.json()
-                    if isinstance(error_message, list) and len(error_message) > 0 and "Nenhum arquivo XML localizado" in error_message[0]:
-                        return response
-                except:
-                    pass
-            
-            # Se a resposta for bem-sucedida (200) ou for o caso específico de "não encontrado",
-            # retornamos a resposta
-            if response.status_code == 200:
-                return response
-                
-            # Se chegamos aqui, é um erro real da API
-            print(f"⚠️ Tentativa {attempt + 1} de {max_retries} falhou. Código: {response.status_code}")
-            
-            if attempt < max_retries - 1:  # Se não for a última tentativa
-                print(f"🔄 Aguardando {retry_delay} segundos antes de tentar novamente...")
-                time.sleep(retry_delay)
-                continue
-            elif attempt == max_retries - 1:  # Se for a última tentativa
-                print(f"❌ Todas as tentativas falharam para CNPJ {cnpj} na data {data_str}. Continuando com o próximo...")
-                return None  # Retorna None para indicar falha total
-                
+            # Aguarda a liberação do limitador de taxa global
+            limitador.adquirir()
+            response = transporte.post(URL, payload, stream=stream)
         except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:  # Se não for a última tentativa
-                print(f"⚠️ Erro de conexão na tentativa {attempt + 1} de {max_retries}: {str(e)}")
-                print(f"🔄 Aguardando {retry_delay} segundos antes de tentar novamente...")
-                time.sleep(retry_delay)
-                continue
-            elif attempt == max_retries - 1:  # Se for a última tentativa
-                print(f"❌ Todas as tentativas falharam para CNPJ {cnpj} na data {data_str}. Continuando com o próximo...")
-                return None  # Retorna None para indicar falha total
-    
-    return None  # Garante que sempre retornamos None em caso de falha total
-
-def extrair_dados_xml(xml_content, xml_type=1):
-    """Extrai informações relevantes do XML da nota fiscal ou CTe."""
-    try:
-        root = ET.fromstring(xml_content)
-        doc_config = DOC_TYPES[xml_type]
-        ns = {"ns": doc_config["namespace"]}
-
-        # Extrai data de emissão
-        dhEmi = root.find(".//ns:dhEmi", ns)
-        data_emissao = dhEmi.text[:10] if dhEmi is not None else "0000-00-00"
-        ano, mes, _ = data_emissao.split("-")
-
-        # Extrai CNPJ do emitente
-        cnpj_emit = root.find(".//ns:emit/ns:CNPJ", ns)
-        cnpj_emit = cnpj_emit.text if cnpj_emit is not None else "00000000000000"
-
-        # Extrai número do documento
-        num_doc = root.find(f".//ns:{doc_config['numero_tag']}", ns)
-        numero_nota = num_doc.text if num_doc is not None else None
-
-        # Extrai tipo do documento
-        tp_doc = root.find(f".//ns:{doc_config['tipo_tag']}", ns)
-        tipo_nota = doc_config['tipo_map'].get(tp_doc.text if tp_doc is not None else "1", "saida")
-
-        return {
-            "ano": ano,
-            "mes": mes,
-            "cnpj_emit": cnpj_emit,
-            "numero_nota": numero_nota,
-            "tipo_nota": tipo_nota,
-            "xml_type": xml_type
-        }
-    except Exception as e:
-        print(f"❌ Erro ao extrair dados do XML: {e}")
+            print(f"⚠️ Erro de conexão na tentativa {attempt + 1} de {politica.max_tentativas}: {str(e)}")
+            if circuito.registrar_falha():
+                print(f"🚫 API indisponível. Suspendendo as chamadas por {circuito.tempo_recuperacao:.0f} segundos...")
+            continue
+
+        # Erros 5xx indicam instabilidade da API; qualquer outra resposta mostra que ela está no ar
+        if response.status_code >= 500:
+            if circuito.registrar_falha():
+                print(f"🚫 API indisponível. Suspendendo as chamadas por {circuito.tempo_recuperacao:.0f} segundos...")
+        elif circuito.registrar_sucesso():
+            print("✅ API disponível novamente. Retomando as chamadas...")
+
+        # Se a resposta for 404 com a mensagem específica de "Nenhum arquivo XML localizado",
+        # retornamos imediatamente pois isso não é um erro da API
+        if response.status_code == 404:
+            try:
+                error_message = response.json()
+                if isinstance(error_message, list) and len(error_message) > 0 and "Nenhum arquivo XML localizado" in error_message[0]:
+                    return response
+            except:
+                pass
+
+        # Se a resposta for bem-sucedida (200) ou for o caso específico de "não encontrado",
+        # retornamos a resposta
+        if response.status_code == 200:
+            return response
+
+        # Se a API sinalizar excesso de requisições, pausa o limitador pelo tempo pedido
+        espera = tempo_retry_after(response)
+        if response.status_code == 429 or espera is not None:
+            espera = espera if espera is not None else politica.atraso(attempt)
+            print(f"⏳ Limite da API atingido (código {response.status_code}). Pausando requisições por {espera:.0f} segundos...")
+            limitador.pausar(espera)
+            response.close()
+            continue
+
+        # Se chegamos aqui, é um erro real da API
+        print(f"⚠️ Tentativa {attempt + 1} de {politica.max_tentativas} falhou. Código: {response.status_code}")
+        response.close()
+
+    print(f"❌ Todas as tentativas falharam para CNPJ {cnpj} {descrever_periodo(data_inicio, data_fim)}. Continuando com o próximo...")
+    return None  # Retorna None para indicar falha total
+
+def montar_dados_xml(metadados, xml_type=1):
+    """Monta as informações usadas para salvar o XML a partir dos metadados extraídos."""
+    doc_config = DOC_TYPES[xml_type]
+    return {
+        "ano": metadados.ano,
+        "mes": metadados.mes,
+        "cnpj_emit": metadados.cnpj_emit,
+        "numero_nota": metadados.numero,
+        "tipo_nota": doc_config['tipo_map'].get(metadados.tipo if metadados.tipo is not None else "1", "saida"),
+        "xml_type": xml_type
+    }
+
+def salvar_xml(xml_bytes, dados_xml, i, ao_concluir=None):
+    """Envia o XML para gravação em segundo plano na estrutura de pastas adequada.
+
+    `ao_concluir(caminho, erro)` é chamado pela thread de gravação quando o arquivo
+    estiver no lugar (ou a gravação falhar).
+    """
+    doc_config = DOC_TYPES[dados_xml["xml_type"]]
+    mes_nome = MESES.get(dados_xml["mes"], dados_xml["mes"])
+
+    # Define o caminho base dependendo do tipo de nota
+    if dados_xml["tipo_nota"] == "entrada":
+        # Para notas de entrada, salva direto na pasta do mês
+        dir_path = os.path.join(doc_config["base_dir"], dados_xml["tipo_nota"], 
+                              dados_xml["ano"], mes_nome)
+    else:
+        # Para notas de saída, mantém a estrutura original com pasta do CNPJ
+        dir_path = os.path.join(doc_config["base_dir"], dados_xml["tipo_nota"], 
+                              dados_xml["ano"], mes_nome, dados_xml["cnpj_emit"])
+
+    numero_nota = dados_xml["numero_nota"] or f"{i}"
+
+    # O tempo até o arquivo estar gravado, incluindo a espera na fila, entra nas métricas
+    ao_concluir = metricas.ao_concluir("salvar", ao_concluir, dados_xml["cnpj_emit"], doc_config["nome"], len(xml_bytes))
+
+    # Para notas de entrada, um arquivo com o mesmo número recebe um contador no nome
+    escritor.enviar(dir_path, f"{numero_nota}.xml", xml_bytes,
+                    numerar=dados_xml["tipo_nota"] == "entrada", ao_concluir=ao_concluir)
+
+def buscar_pagina(unidade):
+    """Busca uma página da API e retorna os documentos recebidos (None em caso de falha).
+
+    A resposta é lida em streaming: cada XML é decodificado e identificado assim que
+    chega, e os bytes dos documentos que o banco confirma como já baixados são
+    descartados durante a leitura.
+    """
+    cnpj = unidade.cnpj
+    tipo = DOC_TYPES[unidade.xml_type]["nome"]
+    periodo = descrever_periodo(unidade.data_inicio, unidade.data_fim)
+    # Chamadas adiadas pelo circuit breaker não entram nas métricas
+    with metricas.medir("api", cnpj=cnpj, tipo=tipo, ignorar=CircuitoAberto) as medicao:
+        response = fazer_requisicao_api(cnpj, unidade.data_inicio, unidade.data_fim, unidade.xml_type, unidade.skip,
+                                        stream=True)
+        medicao.erro = response is None
+
+    # Se a resposta for None, significa que todas as tentativas falharam
+    if response is None:
         return None
 
-def salvar_xml(xml_content, dados_xml, i):
-    """Salva o XML em disco na estrutura de pastas adequada e em um diretório de backup."""
-    try:
-        doc_config = DOC_TYPES[dados_xml["xml_type"]]
-        mes_nome = MESES.get(dados_xml["mes"], dados_xml["mes"])
-        
-        # Define o caminho base dependendo do tipo de nota
-        if dados_xml["tipo_nota"] == "entrada":
-            # Para notas de entrada, salva direto na pasta do mês
-            dir_path = os.path.join(doc_config["base_dir"], dados_xml["tipo_nota"], 
-                                  dados_xml["ano"], mes_nome)
-        else:
-            # Para notas de saída, mantém a estrutura original com pasta do CNPJ
-            dir_path = os.path.join(doc_config["base_dir"], dados_xml["tipo_nota"], 
-                                  dados_xml["ano"], mes_nome, dados_xml["cnpj_emit"])
-        
-        os.makedirs(dir_path, exist_ok=True)
-        
-        numero_nota = dados_xml["numero_nota"] or f"{i}"
-        
-        # Para notas de entrada, verifica se já existe arquivo com mesmo número
-        if dados_xml["tipo_nota"] == "entrada":
-            base_name = f"{numero_nota}.xml"
-            file_name = os.path.join(dir_path, base_name)
-            counter = 1
-            
-            # Enquanto existir um arquivo com o mesmo nome, adiciona um contador
-            while os.path.exists(file_name):
-                base_name = f"{numero_nota}_{counter}.xml"
-                file_name = os.path.join(dir_path, base_name)
-                counter += 1
+    with response:
+        # 404 só chega aqui com a mensagem "Nenhum arquivo XML localizado": o período está vazio
+        if response.status_code == 404:
+            print(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} {periodo}.")
+            return []
+
+        if response.status_code != 200:
+            print(f"❌ Erro na requisição: {response.status_code} - {response.text}")
+            return None
+
+        try:
+            # A leitura do corpo entra nas métricas como "download" e a análise dos XMLs como "extracao"
+            documentos = receber_documentos(response, CONFIG_EXTRACAO[unidade.xml_type], snapshot, estagio_analise,
+                                            cnpj=cnpj, tipo=tipo)
+        except (ValueError, requests.exceptions.RequestException) as e:
+            print(f"❌ Erro ao decodificar a resposta JSON: {e}")
+            return None
+
+    if not documentos:
+        print(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} {periodo}.")
+        return []
+
+    return documentos
+
+def processar_pagina(unidade, documentos):
+    """Processa os documentos de uma página: deduplica, salva e registra os novos."""
+    cnpj, xml_type, skip = unidade.cnpj, unidade.xml_type, unidade.skip
+    periodo = descrever_periodo(unidade.data_inicio, unidade.data_fim)
+
+    # Falha na busca: o checkpoint não avança e a página é consultada de novo na próxima execução
+    if documentos is None:
+        jornada.registrar(unidade, FALHOU, "falha na requisição à API")
+        return 0
+
+    if not documentos:
+        checkpoints.pagina_concluida(unidade, 0)
+        jornada.registrar(unidade, CONCLUIDA)
+        return 0
+
+    # Página cheia em um período de vários dias: o período será dividido e consultado de novo
+    if deve_dividir(unidade, len(documentos)):
+        print(f"🔀 Muitos XMLs para CNPJ {cnpj} {periodo}. Dividindo o período...")
+        jornada.registrar(unidade, CONCLUIDA)
+        return 0
+
+    print(f"🔹 Processando resposta para CNPJ {cnpj} {periodo} (Skip: {skip})")
+
+    candidatos = []
+    chaves_vistas = set()
+    for i, xml_bytes, identidade, metadados, erro, conhecido in documentos:
+        if conhecido:
+            print(f"⚠️ XML {i} (chave {identidade.chave}) já foi baixado anteriormente. Pulando...")
+            continue
+        # Evita processar duas vezes o mesmo documento repetido na página
+        if identidade.chave in chaves_vistas:
+            continue
+        chaves_vistas.add(identidade.chave)
+        with trava_em_gravacao:
+            if identidade.chave in chaves_em_gravacao:
+                print(f"⚠️ XML {i} (chave {identidade.chave}) já está sendo gravado. Pulando...")
+                continue
+
+        # Os metadados já vêm extraídos pelo estágio de análise
+        if metadados is None:
+            print(f"❌ Erro ao extrair dados do XML: {erro}")
+            continue
+        candidatos.append((i, xml_bytes, montar_dados_xml(metadados, xml_type), identidade))
+
+    # Uma única consulta para as notas do CNPJ já baixadas
+    notas_conhecidas = db.filtrar_notas_existentes(cnpj, [dados_xml["numero_nota"] for _, _, dados_xml, _ in candidatos])
+    with trava_em_gravacao:
+        notas_conhecidas.update(numero for cnpj_nota, numero in notas_em_gravacao if cnpj_nota == cnpj)
+
+    # O registro no banco é feito em lote, depois que todos os arquivos da página forem gravados
+    def registrar_gravados(resultados):
+        registros = []
+        for (i, numero_nota, identidade), file_name, erro in resultados:
+            if erro is None:
+                registros.append((identidade.digest, cnpj, numero_nota, identidade.chave))
+                print(f"✅ XML {i} salvo em: {file_name}")
+            else:
+                print(f"❌ Erro ao salvar XML {i}: {erro}")
+        try:
+            novos_arquivos = db.registrar_xmls(registros)
+            snapshot.adicionar([chave for _, _, _, chave in registros])
+        finally:
+            with trava_em_gravacao:
+                for (_, numero_nota, identidade), _, _ in resultados:
+                    chaves_em_gravacao.discard(identidade.chave)
+                    notas_em_gravacao.discard((cnpj, numero_nota))
+        if novos_arquivos == 0:
+            print(f"⚠️ Nenhum novo XML encontrado para CNPJ {cnpj} {periodo}.")
+        # O checkpoint só avança, e a unidade só é concluída, com todos os XMLs da página gravados
+        if len(registros) == len(resultados):
+            checkpoints.pagina_concluida(unidade, len(documentos))
+            jornada.registrar(unidade, CONCLUIDA)
         else:
-            file_name = os.path.join(dir_path, f"{numero_nota}.xml")
-        
-        # Salva no diretório principal
-        with open(file_name, "w", encoding="utf-8") as file:
-            file.write(xml_content)
-        
-        return file_name
-    except Exception as e:
-        print(f"❌ Erro ao salvar XML: {e}")
-        return None
+            jornada.registrar(unidade, FALHOU, f"{len(resultados) - len(registros)} XMLs não foram gravados")
 
-def processar_xml_por_cnpj(cnpj):
-    """Processa XMLs de notas fiscais e CTes para um CNPJ específico."""
+    lote = LoteGravacao(registrar_gravados)
+    enviados = 0
+    for i, xml_bytes, dados_xml, identidade in candidatos:
+        # Verifica se a nota já foi baixada pelo CNPJ e número
+        numero_nota = dados_xml["numero_nota"]
+        if numero_nota and numero_nota in notas_conhecidas:
+            print(f"⚠️ Nota {numero_nota} do CNPJ {cnpj} já foi baixada anteriormente. Pulando...")
+            continue
+        if numero_nota:
+            notas_conhecidas.add(numero_nota)
+
+        with trava_em_gravacao:
+            chaves_em_gravacao.add(identidade.chave)
+            if numero_nota:
+                notas_em_gravacao.add((cnpj, numero_nota))
+        salvar_xml(xml_bytes, dados_xml, i, lote.ao_concluir((i, numero_nota, identidade)))
+        enviados += 1
+    lote.fechar()
+
+    return enviados
+
+def iniciar_execucao():
+    """Abre o banco de dados e prepara a deduplicação, a jornada, a análise e a gravação."""
+    global db, snapshot, checkpoints, jornada, estagio_analise, escritor, sincronizador
+    db = DatabaseManager()
+    snapshot = KnownSnapshot(db)
+    snapshot.carregar()
+    checkpoints = CheckpointStore(db)
+    jornada = JobJournal(db, "cli")
+    if USAR_SPOOL:
+        escritor = EscritorSpool()
+        sincronizador = SincronizadorSpool(MODOS_ARMAZENAMENTO[MODO_ARMAZENAMENTO]())
+        sincronizador.iniciar()
+    else:
+        escritor = MODOS_ARMAZENAMENTO[MODO_ARMAZENAMENTO]()
+    estagio_analise = EstagioAnalise(PROCESSOS_ANALISE)
+
+def periodo_consulta():
+    """Retorna o período dos últimos dias a consultar (data inicial, data final)."""
     hoje = datetime.today().date()
-    
-    # Loop para os últimos 5 dias
-    for dias_atras in range(5, 0, -1):
-        data_consulta = hoje - timedelta(days=dias_atras)
-        data_str = data_consulta.strftime("%Y-%m-%d")
-        
-        # Processa ambos os tipos de documento
-        for xml_type in [1, 2]:  # 1 = NFe, 2 = CTe
-            doc_name = "NFe" if xml_type == 1 else "CTe"
-            print(f"📅 Buscando {doc_name}s para CNPJ {cnpj} na data {data_str}")
-
-            # Inicializa variáveis para paginação
-            skip = 0
-            tem_mais_xmls = True
-            
-            while tem_mais_xmls:
-                # Faz requisição à API
-                response = fazer_requisicao_api(cnpj, data_str, xml_type, skip)
-                
-                # Se a resposta for None, significa que todas as tentativas falharam
-                if response is None:
-                    tem_mais_xmls = False
-                    continue
-                
-                if response.status_code == 200:
-                    try:
-                        data = response.json()
-                        print(f"🔹 Processando resposta para CNPJ {cnpj} do dia {data_str} (Skip: {skip})")
-
-                        if "xmls" in data and isinstance(data["xmls"], list) and len(data["xmls"]) > 0:
-                            novos_arquivos = 0
-                            for i, xml_base64 in enumerate(data["xmls"], 1):
-                                # Decodifica e extrai dados do XML primeiro
-                                xml_content = base64.b64decode(xml_base64).decode("utf-8")
-                                dados_xml = extrair_dados_xml(xml_content, xml_type)
-                                
-                                if dados_xml:
-                                    # Verifica se a nota já foi baixada pelo CNPJ e número
-                                    if db.verificar_nota_existente(cnpj, dados_xml["numero_nota"]):
-                                        print(f"⚠️ Nota {dados_xml['numero_nota']} do CNPJ {cnpj} já foi baixada anteriormente. Pulando...")
-                                        continue
-                                    
-                                    # Verifica se o XML já foi baixado (verificação adicional pelo hash)
-                                    xml_hash = hash(xml_base64)
-                                    if db.verificar_xml_existente(xml_hash):
-                                        print(f"⚠️ XML {i} já foi baixado anteriormente (hash). Pulando...")
-                                        continue
-
-                                    # Salva o XML e registra no banco
-                                    file_name = salvar_xml(xml_content, dados_xml, i)
-                                    if file_name:
-                                        if db.registrar_xml(xml_hash, cnpj, dados_xml["numero_nota"]):
-                                            novos_arquivos += 1
-                                            print(f"✅ XML {i} salvo em: {file_name}")
-
-                            # Verifica se há mais XMLs para buscar
-                            if len(data["xmls"]) == 50:  # Se retornou o máximo de XMLs, provavelmente há mais
-                                skip += 50  # Incrementa o skip para a próxima página
-                                time.sleep(2)  # Aguarda entre requisições para respeitar limite da API
-                            else:
-                                tem_mais_xmls = False  # Se retornou menos que 50, não há mais XMLs
-
-                            if novos_arquivos == 0:
-                                print(f"⚠️ Nenhum novo XML encontrado para CNPJ {cnpj} no dia {data_str}.")
-                        else:
-                            print(f"⚠️ Nenhum XML retornado pela API para CNPJ {cnpj} no dia {data_str}.")
-                            tem_mais_xmls = False
-
-                    except json.JSONDecodeError:
-                        print("❌ Erro ao decodificar a resposta JSON.")
-                        tem_mais_xmls = False
-                else:
-                    print(f"❌ Erro na requisição: {response.status_code} - {response.text}")
-                    tem_mais_xmls = False
-                
-                # Aguarda entre requisições para respeitar limite da API
-                time.sleep(2)
+    data_inicio = hoje - timedelta(days=DIAS_CONSULTA)
+    data_fim = hoje - timedelta(days=1)
+    return data_inicio.strftime("%Y-%m-%d"), data_fim.strftime("%Y-%m-%d")
+
+def criar_engine(max_concorrencia=MAX_CONCORRENCIA):
+    return FetchEngine(buscar=buscar_pagina, processar=processar_pagina,
+                       max_concorrencia=max_concorrencia, jornada=jornada)
+
+def processar_xml_por_cnpj(cnpj, max_concorrencia=MAX_CONCORRENCIA):
+    """Processa XMLs de notas fiscais e CTes para um CNPJ específico."""
+    print(f"📅 Buscando NFes e CTes para CNPJ {cnpj} {descrever_periodo(*periodo_consulta())}")
+    criar_engine(max_concorrencia).executar(gerar_unidades_trabalho([cnpj]))
+    escritor.aguardar()
+
+def gerar_unidades_trabalho(cnpjs):
+    """Gera as consultas de cada CNPJ e tipo de documento, pulando as datas já concluídas."""
+    data_inicio, data_fim = periodo_consulta()
+    return [unidade
+            for cnpj in cnpjs
+            for unidade in checkpoints.planejar(cnpj, data_inicio, data_fim, [1, 2])]  # 1 = NFe, 2 = CTe
+
+def ler_cnpjs():
+    """Lê os CNPJs válidos do arquivo Excel."""
+    df = pd.read_excel('cnpj.xlsx')
+    cnpjs = df['CNPJ'].astype(str).str.replace(r'\D', '', regex=True).tolist()
+
+    print(f"📋 Processando {len(cnpjs)} CNPJs encontrados no arquivo.")
+
+    cnpjs_validos = []
+    for cnpj in cnpjs:
+        if len(cnpj) == 14:  # Validação básica do CNPJ
+            cnpjs_validos.append(cnpj)
+        else:
+            print(f"⚠️ CNPJ inválido ignorado: {cnpj}")
+    return cnpjs_validos
 
-def processar_lista_cnpjs():
-    """Processa a lista de CNPJs do arquivo Excel."""
+def processar_lista_cnpjs(max_concorrencia=MAX_CONCORRENCIA, reprocessar_falhas=False):
+    """Processa a lista de CNPJs do arquivo Excel com requisições simultâneas.
+
+    O período atual é planejado a cada execução, pulando o que os checkpoints já
+    concluíram. Se a execução anterior foi interrompida, as consultas que não
+    terminaram e estão fora do período atual são feitas junto. Com
+    `reprocessar_falhas`, repete somente as consultas que falharam na última execução.
+    """
     try:
-        df = pd.read_excel('cnpj.xlsx')
-        cnpjs = df['CNPJ'].astype(str).str.replace(r'\D', '', regex=True).tolist()
-        
-        print(f"📋 Processando {len(cnpjs)} CNPJs encontrados no arquivo.")
-        
-        for cnpj in cnpjs:
-            if len(cnpj) == 14:  # Validação básica do CNPJ
-                print(f"\n🔄 Processando CNPJ: {cnpj}")
-                processar_xml_por_cnpj(cnpj)
-            else:
-                print(f"⚠️ CNPJ inválido ignorado: {cnpj}")
+        if reprocessar_falhas:
+            unidades = jornada.reabrir_falhas()
+            if not unidades:
+                print("✅ Nenhuma consulta com falha na última execução.")
+                return
+            print(f"🔁 Repetindo {len(unidades)} consultas que falharam na execução de {jornada.execucao}.")
+            checkpoints.acompanhar(unidades)
+        else:
+            # O período atual é sempre planejado. As consultas que sobraram de uma execução interrompida
+            # entram junto quando saem dele; dentro do período, os checkpoints já as retomam
+            data_inicio, data_fim = periodo_consulta()
+            restantes = [unidade for unidade in jornada.retomar()
+                         if unidade.data_inicio < data_inicio or unidade.data_fim > data_fim]
+            unidades = gerar_unidades_trabalho(ler_cnpjs())
+            if restantes:
+                print(f"♻️ Retomando {len(restantes)} consultas não concluídas da execução de {jornada.execucao} "
+                      f"fora do período atual.")
+                checkpoints.acompanhar(restantes)
+                unidades.extend(restantes)
+            jornada.nova_execucao(unidades)
+
+        engine = criar_engine(max_concorrencia)
+        print(f"🔄 Processando {len(unidades)} consultas com até {max_concorrencia} requisições simultâneas.")
+        paginas = engine.executar(unidades)
+        escritor.aguardar()
+        # As falhas vêm da jornada: uma página cuja busca esgotou as tentativas termina sem exceção na engine
+        resumo = jornada.resumo()
+        print(f"✅ {paginas} páginas processadas ({resumo[FALHOU]} falhas, {engine.paginas_descartadas} buscas antecipadas descartadas, "
+              f"{engine.unidades_adiadas} consultas adiadas por indisponibilidade da API).")
+        if sincronizador:
+            # As cópias idênticas só são detectadas no envio ao servidor, informado pelo sincronizador
+            print(f"💾 {escritor.gravados} XMLs gravados no spool ({escritor.falhas} falhas de gravação).")
+        else:
+            print(f"💾 {escritor.gravados} XMLs gravados, {escritor.duplicados} já existiam com o mesmo conteúdo "
+                  f"({escritor.falhas} falhas de gravação).")
+
+        if resumo[FALHOU]:
+            print(f"⚠️ {resumo[FALHOU]} consultas falharam. Execute com --reprocessar-falhas para repeti-las.")
+
+        estatisticas = transporte.estatisticas()
+        print(f"📊 {estatisticas['requisicoes']} requisições à API - latência média {estatisticas['media']:.2f}s, "
+              f"p95 {estatisticas['p95']:.2f}s, máxima {estatisticas['maxima']:.2f}s")
                 
     except Exception as e:
-        print(f"❌ Erro ao ler arquivo de CNPJs: {e}")
+        print(f"❌ Erro ao processar a lista de CNPJs: {e}")
+
+def exportar_metricas():
+    """Mostra o resumo das etapas e exporta as métricas da execução."""
+    for linha in metricas.linhas_resumo():
+        print(linha)
+    try:
+        caminho_prometheus, caminho_json = metricas.exportar("cli")
+        print(f"📈 Métricas exportadas para {caminho_prometheus} e {caminho_json}")
+    except OSError as e:
+        print(f"❌ Erro ao exportar as métricas: {e}")
 
 # Executa o processamento principal
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Baixa os XMLs de NFe e CTe dos CNPJs do arquivo cnpj.xlsx.")
+    parser.add_argument("--reprocessar-falhas", action="store_true",
+                        help="Repete apenas as consultas que falharam na última execução")
+    args = parser.parse_args()
     try:
-        processar_lista_cnpjs()
+        iniciar_execucao()
+        processar_lista_cnpjs(reprocessar_falhas=args.reprocessar_falhas)
+        estagio_analise.fechar()
+        escritor.fechar()
+        if sincronizador:
+            restantes = sincronizador.fechar()
+            print(f"🔁 {sincronizador.sincronizados} XMLs enviados ao servidor de arquivos, {sincronizador.duplicados} "
+                  f"já existiam com o mesmo conteúdo ({restantes} aguardando no spool para a próxima execução).")
         # Limpa registros mais antigos que 90 dias
         db.limpar_registros_antigos(90)
+        exportar_metricas()
+        snapshot.fechar()
+        db.fechar()
         sys.exit(0)
     except Exception as e:
         print(f"❌ Erro fatal: {e}")
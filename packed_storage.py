@@ -0,0 +1,288 @@
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+import warnings
+import zipfile
+import zlib
+
+from doc_identity import calcular_digest
+from file_writer import EscritorArquivos
+from metrics import metricas
+
+# Extensão dos contêineres; cada um substitui o diretório de mesmo nome do modo de arquivos soltos
+EXTENSAO_CONTAINER = ".zip"
+# Documentos gravados por abertura do contêiner
+TAMANHO_LOTE_CONTAINER = 500
+# Tempo máximo que um documento espera por outros do mesmo contêiner antes de ser gravado
+ESPERA_LOTE_CONTAINER = 1.0  # segundos
+
+
+class EscritorCompactado(EscritorArquivos):
+    """Grava os XMLs em contêineres zip em vez de arquivos soltos.
+
+    Cada diretório do modo de arquivos soltos vira um único arquivo `.zip` ao lado
+    do diretório pai: as notas de saída ficam em um contêiner por mês e CNPJ
+    (`saida/2025/Janeiro/<cnpj>.zip`) e as de entrada em um por mês
+    (`entrada/2025/Janeiro.zip`). Os nomes dentro do contêiner são os mesmos dos
+    arquivos soltos, incluindo os sufixos `_N`, e o diretório central do zip serve
+    de índice para o acesso a um documento sem ler os demais.
+
+    Abrir um zip em modo de acréscimo lê e regrava o diretório central inteiro,
+    então os documentos são agrupados por contêiner: cada lote abre o zip uma
+    única vez, grava todos os documentos e o fecha. Um lote sai quando junta
+    `tamanho_lote` documentos, quando o primeiro deles espera `espera_lote`
+    segundos, ou em `aguardar()` e `fechar()`.
+
+    O contêiner nunca é alterado no lugar: o lote é gravado em uma cópia
+    temporária ao lado dele, que substitui o original com `os.replace` depois
+    de fechada, como os arquivos soltos. Uma queda no meio do lote (processo
+    encerrado, conexão com o servidor perdida) deixa o contêiner anterior
+    intacto. `ao_concluir` só é chamado depois da substituição; se o lote
+    falhar, nenhum dos seus documentos é dado como gravado, e um contêiner que
+    não possa ser lido não é alterado.
+    """
+
+    def __init__(self, tamanho_lote=TAMANHO_LOTE_CONTAINER, espera_lote=ESPERA_LOTE_CONTAINER, **kwargs):
+        super().__init__(**kwargs)
+        self.tamanho_lote = tamanho_lote
+        self.espera_lote = espera_lote
+        # Documentos aguardando o lote do contêiner: contêiner -> [instante do primeiro, itens]
+        self._acumulados = {}
+        self._condicao = threading.Condition()
+        self._agrupador = None
+        self._encerrar_agrupador = False
+
+    def _iniciar(self):
+        super()._iniciar()
+        with self._condicao:
+            if self._agrupador is None:
+                self._encerrar_agrupador = False
+                self._agrupador = threading.Thread(target=self._agrupar, name="lotes-compactados", daemon=True)
+                self._agrupador.start()
+
+    def enviar(self, diretorio, nome, conteudo, numerar=False, ao_concluir=None):
+        self._iniciar()
+        container = diretorio + EXTENSAO_CONTAINER
+        lote = None
+        with self._condicao:
+            acumulado = self._acumulados.setdefault(container, [time.monotonic(), []])
+            acumulado[1].append((nome, conteudo, numerar, ao_concluir))
+            if len(acumulado[1]) >= self.tamanho_lote:
+                lote = (container, self._acumulados.pop(container)[1])
+            else:
+                self._condicao.notify()
+        if lote is not None:
+            self._fila.put(lote)
+
+    def _retirar_lotes(self, vencido):
+        """Retira os lotes cujo instante inicial satisfaz `vencido`. Chamar com a condição."""
+        containers = [container for container, (inicio, _) in self._acumulados.items() if vencido(inicio)]
+        return [(container, self._acumulados.pop(container)[1]) for container in containers]
+
+    def _agrupar(self):
+        while True:
+            with self._condicao:
+                while True:
+                    if self._encerrar_agrupador:
+                        return
+                    agora = time.monotonic()
+                    lotes = self._retirar_lotes(lambda inicio: agora - inicio >= self.espera_lote)
+                    if lotes:
+                        break
+                    inicios = [inicio for inicio, _ in self._acumulados.values()]
+                    self._condicao.wait(min(inicios) + self.espera_lote - agora if inicios else None)
+            for lote in lotes:
+                self._fila.put(lote)
+
+    def _descarregar(self):
+        """Envia para gravação todos os lotes acumulados, cheios ou não."""
+        with self._condicao:
+            lotes = self._retirar_lotes(lambda inicio: True)
+        for lote in lotes:
+            self._fila.put(lote)
+        return bool(lotes)
+
+    def _membros(self, container):
+        """Índice dos documentos do contêiner: nome (normalizado) -> (tamanho, CRC-32)."""
+        membros = self._indice.get(container)
+        if membros is None:
+            membros = {}
+            if os.path.exists(container):
+                with zipfile.ZipFile(container) as arquivo_zip:
+                    for info in arquivo_zip.infolist():
+                        membros[os.path.normcase(info.filename)] = (info.file_size, info.CRC)
+            else:
+                os.makedirs(os.path.dirname(container), exist_ok=True)
+            self._indice[container] = membros
+        return membros
+
+    def _processar(self, item):
+        container, itens = item
+        resultados = []
+        inicio = time.perf_counter()
+        try:
+            with self._trava(container):
+                membros = self._membros(container)
+                temporario = os.path.join(os.path.dirname(container),
+                                          f".{os.path.basename(container)}.{uuid.uuid4().hex}.tmp")
+                try:
+                    if os.path.exists(container):
+                        shutil.copyfile(container, temporario)
+                    with zipfile.ZipFile(temporario, "a", compression=zipfile.ZIP_DEFLATED) as arquivo_zip:
+                        for nome, conteudo, numerar, ao_concluir in itens:
+                            existente = self._copia_identica(arquivo_zip, membros, nome, conteudo, numerar)
+                            if existente is not None:
+                                resultados.append((nome, ao_concluir, os.path.join(container, existente), True))
+                                continue
+                            nome_final = self._nome_livre(membros, nome) if numerar else nome
+                            with warnings.catch_warnings():
+                                # Sem numeração, um nome repetido substitui o anterior (vale a última entrada)
+                                warnings.simplefilter("ignore", UserWarning)
+                                arquivo_zip.writestr(nome_final, conteudo)
+                            membros[os.path.normcase(nome_final)] = (len(conteudo), zlib.crc32(conteudo))
+                            resultados.append((nome, ao_concluir, os.path.join(container, nome_final), False))
+                    os.replace(temporario, container)
+                except BaseException:
+                    # O índice pode citar documentos que não chegaram ao disco: é relido na próxima vez
+                    self._indice.pop(container, None)
+                    try:
+                        os.remove(temporario)
+                    except OSError:
+                        pass
+                    raise
+        except Exception as e:
+            metricas.registrar(self.etapa_metricas, time.perf_counter() - inicio, itens=len(itens),
+                               tamanho=sum(len(conteudo) for _, conteudo, _, _ in itens), erro=True)
+            for nome, _, _, ao_concluir in itens:
+                self._concluir(nome, ao_concluir, None, e, False)
+            return
+
+        metricas.registrar(self.etapa_metricas, time.perf_counter() - inicio, itens=len(itens),
+                           tamanho=sum(len(conteudo) for _, conteudo, _, _ in itens))
+        for nome, ao_concluir, caminho, duplicado in resultados:
+            self._concluir(nome, ao_concluir, caminho, None, duplicado)
+
+    def _copia_identica(self, arquivo_zip, membros, nome, conteudo, numerar=True):
+        """Nome de um documento de mesmo número e conteúdo idêntico no contêiner aberto, ou None."""
+        crc = None
+        candidatos = self._nomes_numerados(nome) if numerar else [nome]
+        for candidato in candidatos:
+            assinatura = membros.get(os.path.normcase(candidato))
+            if assinatura is None:
+                return None
+            if assinatura[0] != len(conteudo):
+                continue
+            if crc is None:
+                crc = zlib.crc32(conteudo)
+            if assinatura[1] != crc:
+                continue
+            # Mesmo tamanho e CRC: confirma byte a byte
+            if arquivo_zip.read(candidato) == conteudo:
+                return candidato
+        return None
+
+    def ler(self, caminho):
+        container, nome = os.path.split(caminho)
+        # Não lê um contêiner enquanto um lote o regrava
+        with self._trava(container):
+            return ler_documento(container, nome)
+
+    def digests_gravados(self, caminhos):
+        """Confere o lote abrindo cada contêiner uma única vez."""
+        por_container = {}
+        for caminho in caminhos:
+            container, nome = os.path.split(caminho)
+            por_container.setdefault(container, []).append((caminho, nome))
+
+        digests = {}
+        for container, documentos in por_container.items():
+            with self._trava(container):
+                try:
+                    arquivo_zip = zipfile.ZipFile(container)
+                except Exception as e:
+                    digests.update((caminho, e) for caminho, _ in documentos)
+                    continue
+                with arquivo_zip:
+                    for caminho, nome in documentos:
+                        try:
+                            digests[caminho] = calcular_digest(arquivo_zip.read(nome))
+                        except Exception as e:
+                            digests[caminho] = e
+        return digests
+
+    def aguardar(self):
+        while True:
+            self._descarregar()
+            super().aguardar()
+            with self._condicao:
+                if not self._acumulados:
+                    return
+
+    def fechar(self):
+        with self._condicao:
+            agrupador, self._agrupador = self._agrupador, None
+            self._encerrar_agrupador = True
+            self._condicao.notify_all()
+        if agrupador is not None:
+            agrupador.join()
+        self._descarregar()
+        super().fechar()
+
+
+def ler_documento(container, nome):
+    """Lê um documento de um contêiner."""
+    with zipfile.ZipFile(container) as arquivo_zip:
+        return arquivo_zip.read(nome)
+
+
+def exportar(origem, destino):
+    """Recria a árvore de arquivos soltos a partir dos contêineres encontrados em `origem`.
+
+    Arquivos que já existem no destino são mantidos. Retorna a quantidade de XMLs extraídos.
+    """
+    extraidos = 0
+    for raiz, _, arquivos in os.walk(origem):
+        for nome_container in arquivos:
+            if not nome_container.lower().endswith(EXTENSAO_CONTAINER):
+                continue
+            container = os.path.join(raiz, nome_container)
+            diretorio = os.path.join(destino, os.path.relpath(container, origem)[:-len(EXTENSAO_CONTAINER)])
+            os.makedirs(diretorio, exist_ok=True)
+            with zipfile.ZipFile(container) as arquivo_zip:
+                # Em nomes repetidos vale a última entrada, como na gravação
+                membros = {info.filename: info for info in arquivo_zip.infolist()}
+                for nome, info in membros.items():
+                    caminho = os.path.join(diretorio, os.path.basename(nome))
+                    if os.path.exists(caminho):
+                        continue
+                    with open(caminho, "wb") as arquivo:
+                        arquivo.write(arquivo_zip.read(info))
+                    extraidos += 1
+            print(f"📂 {container} exportado para {diretorio}")
+    return extraidos
+
+
+# Modos de armazenamento disponíveis
+MODOS_ARMAZENAMENTO = {
+    "arquivos": EscritorArquivos,
+    "compactado": EscritorCompactado
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta os XMLs dos contêineres compactados para arquivos soltos.")
+    parser.add_argument("origem", help="Diretório base com os contêineres (.zip)")
+    parser.add_argument("destino", nargs="?", help="Diretório onde recriar a árvore (padrão: a própria origem)")
+    args = parser.parse_args()
+
+    try:
+        total = exportar(args.origem, args.destino or args.origem)
+        print(f"✅ {total} XMLs exportados.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"❌ Erro ao exportar: {e}")
+        sys.exit(1)
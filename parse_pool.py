@@ -0,0 +1,108 @@
+import binascii
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from doc_identity import identificar_documento
+from xml_extractor import ExtratorMetadados
+
+# XMLs enviados juntos a um processo
+TAMANHO_LOTE = 16
+# Processos de análise; 0 analisa na própria thread
+PROCESSOS_ANALISE = os.cpu_count() or 1
+
+# Resultado da análise de um XML. `metadados` é None (e `erro` traz a mensagem) se o XML for inválido
+DocumentoAnalisado = namedtuple("DocumentoAnalisado", ["conteudo", "identidade", "metadados", "erro"])
+
+# Extratores já montados em cada processo, por configuração (namespace, tag do número, tag do tipo)
+_extratores = {}
+
+
+def analisar_lote(payloads, config):
+    """Decodifica o base64, calcula a identidade e extrai os metadados de cada XML do lote.
+
+    Retorna (resultados, segundos gastos na análise). Função de módulo para poder
+    ser enviada aos processos do pool; o tempo é medido no próprio processo.
+    """
+    inicio = time.perf_counter()
+    extrator = _extratores.get(config)
+    if extrator is None:
+        extrator = _extratores[config] = ExtratorMetadados(*config)
+
+    resultados = []
+    for payload in payloads:
+        # Sem buffer de decodificação reaproveitado: a biblioteca padrão não decodifica base64
+        # para um buffer existente, e os bytes de cada XML precisam sobreviver ao lote (voltam
+        # ao processo principal e ficam com a página até serem gravados), então uma cópia por
+        # documento aconteceria de qualquer forma
+        conteudo = binascii.a2b_base64(payload)
+        identidade = identificar_documento(conteudo)
+        try:
+            resultados.append(DocumentoAnalisado(conteudo, identidade, extrator.metadados(conteudo), None))
+        except Exception as e:
+            resultados.append(DocumentoAnalisado(conteudo, identidade, None, str(e)))
+    return resultados, time.perf_counter() - inicio
+
+
+class EstagioAnalise:
+    """Estágio do pipeline que analisa os XMLs em um `ProcessPoolExecutor`.
+
+    Decodificar, fazer o parse e calcular o digest consome CPU; em processos
+    separados, esse trabalho não disputa o GIL com as threads que leem a rede.
+    Os XMLs são enviados em lotes assim que chegam, e os resultados são
+    devolvidos na ordem original. Com `processos=0` a análise é feita na
+    própria thread, sem criar processos.
+    """
+
+    def __init__(self, processos=PROCESSOS_ANALISE, tamanho_lote=TAMANHO_LOTE):
+        self.processos = processos
+        self.tamanho_lote = tamanho_lote
+        self._executor = ProcessPoolExecutor(max_workers=processos) if processos > 0 else None
+
+    def analisar(self, payloads, config, ao_medir=None):
+        """Gera um `DocumentoAnalisado` para cada payload base64, na ordem recebida.
+
+        `ao_medir(segundos, resultados)` recebe o tempo de análise de cada lote, sem a
+        espera na fila nem a leitura da rede.
+        """
+        def entregar(analisado):
+            resultados, segundos = analisado
+            if ao_medir is not None:
+                ao_medir(segundos, resultados)
+            return resultados
+
+        if self._executor is None:
+            lote = []
+            for payload in payloads:
+                lote.append(payload)
+                if len(lote) >= self.tamanho_lote:
+                    yield from entregar(analisar_lote(lote, config))
+                    lote = []
+            if lote:
+                yield from entregar(analisar_lote(lote, config))
+            return
+
+        pendentes = deque()
+        lote = []
+        try:
+            for payload in payloads:
+                lote.append(payload)
+                if len(lote) >= self.tamanho_lote:
+                    pendentes.append(self._executor.submit(analisar_lote, lote, config))
+                    lote = []
+                # Entrega os lotes já prontos, mantendo no máximo um lote em andamento por processo
+                while pendentes and (pendentes[0].done() or len(pendentes) > self.processos):
+                    yield from entregar(pendentes.popleft().result())
+            if lote:
+                pendentes.append(self._executor.submit(analisar_lote, lote, config))
+            while pendentes:
+                yield from entregar(pendentes.popleft().result())
+        finally:
+            for futuro in pendentes:
+                futuro.cancel()
+
+    def fechar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,94 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+# Quantidade máxima de XMLs retornados pela API em cada página
+TAMANHO_PAGINA = 50
+
+# Unidade de trabalho: uma página da consulta de um CNPJ em um período para um tipo de documento
+UnidadeTrabalho = namedtuple("UnidadeTrabalho", ["cnpj", "data_inicio", "data_fim", "xml_type", "skip"])
+
+
+def _para_data(data_str):
+    return date.fromisoformat(data_str)
+
+
+def dias_na_janela(data_inicio, data_fim):
+    return (_para_data(data_fim) - _para_data(data_inicio)).days + 1
+
+
+def dias_do_periodo(data_inicio, data_fim):
+    """Lista as datas do período, em ordem."""
+    inicio = _para_data(data_inicio)
+    return [(inicio + timedelta(days=n)).isoformat() for n in range(dias_na_janela(data_inicio, data_fim))]
+
+
+def planejar_unidades(cnpj, data_inicio, data_fim, xml_types, checkpoints=None, inicio_reconsulta=None):
+    """Planeja as consultas do período para cada tipo de documento.
+
+    Sem checkpoints, é uma única consulta para o período inteiro. Com eles
+    (`{xml_type: {data: (paginas, itens, ultimo_skip, concluido)}}`), as datas
+    concluídas anteriores a `inicio_reconsulta` são puladas; uma data com várias
+    páginas já lidas é consultada sozinha a partir do último skip registrado; e
+    as demais são agrupadas em períodos contínuos consultados do início.
+    """
+    unidades = []
+    for xml_type in xml_types:
+        pontos = (checkpoints or {}).get(xml_type, {})
+        trecho = []
+
+        def fechar_trecho():
+            if trecho:
+                unidades.append(UnidadeTrabalho(cnpj, trecho[0], trecho[-1], xml_type, 0))
+                trecho.clear()
+
+        for dia in dias_do_periodo(data_inicio, data_fim):
+            ponto = pontos.get(dia)
+            if ponto is None:
+                trecho.append(dia)
+                continue
+            _, _, ultimo_skip, concluido = ponto
+            if concluido and (inicio_reconsulta is None or dia < inicio_reconsulta):
+                fechar_trecho()
+            elif ultimo_skip > 0:
+                fechar_trecho()
+                unidades.append(UnidadeTrabalho(cnpj, dia, dia, xml_type, ultimo_skip))
+            else:
+                trecho.append(dia)
+        fechar_trecho()
+    return unidades
+
+
+def dividir_janela(data_inicio, data_fim):
+    """Divide o período em duas metades: [inicio, meio] e [meio + 1, fim]."""
+    inicio = _para_data(data_inicio)
+    meio = inicio + timedelta(days=(dias_na_janela(data_inicio, data_fim) - 1) // 2)
+    return [
+        (data_inicio, meio.isoformat()),
+        ((meio + timedelta(days=1)).isoformat(), data_fim)
+    ]
+
+
+def deve_dividir(unidade, quantidade):
+    """Indica se a página veio cheia em um período de vários dias e deve ser dividida."""
+    return quantidade >= TAMANHO_PAGINA and unidade.data_inicio != unidade.data_fim
+
+
+def proximas_unidades(unidade, quantidade):
+    """Retorna as unidades que precisam ser consultadas depois desta página.
+
+    Períodos com poucos XMLs terminam aqui. Quando a página de um período de
+    vários dias vem cheia, o período é dividido ao meio recursivamente; em um
+    único dia a consulta segue para a próxima página.
+    """
+    if quantidade < TAMANHO_PAGINA:
+        return []
+    if deve_dividir(unidade, quantidade):
+        return [unidade._replace(data_inicio=inicio, data_fim=fim, skip=0)
+                for inicio, fim in dividir_janela(unidade.data_inicio, unidade.data_fim)]
+    return [unidade._replace(skip=unidade.skip + TAMANHO_PAGINA)]
+
+
+def descrever_periodo(data_inicio, data_fim):
+    if data_inicio == data_fim:
+        return f"na data {data_inicio}"
+    return f"no período de {data_inicio} a {data_fim}"
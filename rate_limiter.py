@@ -0,0 +1,81 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Cota de requisições à API do SIEG
+REQUISICOES_POR_MINUTO = 30
+
+
+class TokenBucket:
+    """Limitador de taxa compartilhado entre todas as chamadas à API.
+
+    Os tokens são repostos continuamente à taxa de `requisicoes_por_minuto`;
+    cada requisição consome um token e espera quando o balde está vazio.
+    `pausar` suspende todas as chamadas, por exemplo após um HTTP 429.
+    """
+
+    def __init__(self, requisicoes_por_minuto=REQUISICOES_POR_MINUTO, capacidade=1):
+        self.taxa = requisicoes_por_minuto / 60.0  # tokens por segundo
+        self.capacidade = capacidade
+        self.tokens = float(capacidade)
+        self.ultima_reposicao = time.monotonic()
+        self.pausado_ate = 0.0
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        decorrido = agora - self.ultima_reposicao
+        self.tokens = min(self.capacidade, self.tokens + decorrido * self.taxa)
+        self.ultima_reposicao = agora
+
+    def adquirir(self):
+        """Bloqueia até haver um token disponível e o consome."""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                if agora < self.pausado_ate:
+                    espera = self.pausado_ate - agora
+                else:
+                    self._repor(agora)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    espera = (1 - self.tokens) / self.taxa
+            time.sleep(espera)
+
+    def pausar(self, segundos):
+        """Suspende a liberação de tokens pelo tempo informado.
+
+        Ao fim da pausa um token já está disponível: a próxima chamada sai no
+        instante pedido pelo Retry-After, e as demais seguem a taxa normal.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self.pausado_ate = max(self.pausado_ate, agora + segundos)
+            self.tokens = min(1.0, self.capacidade)
+            self.ultima_reposicao = self.pausado_ate
+
+    def pausa_restante(self):
+        """Segundos que ainda faltam para o fim da pausa (0 se não estiver pausado)."""
+        with self._lock:
+            return max(0.0, self.pausado_ate - time.monotonic())
+
+
+def tempo_retry_after(response):
+    """Retorna os segundos indicados no cabeçalho Retry-After, ou None se ausente."""
+    valor = response.headers.get("Retry-After")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+        return max(0.0, (data - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+# Limitador global usado por todas as chamadas à API
+limitador = TokenBucket(REQUISICOES_POR_MINUTO)
@@ -0,0 +1,144 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Configurações de retentativa
+MAX_TENTATIVAS = 5
+ATRASO_BASE = 1.0  # segundos
+ATRASO_MAXIMO = 30.0  # segundos
+PRAZO_TOTAL = 60.0  # segundos por requisição, somando todas as tentativas
+
+# Configurações do circuit breaker
+LIMITE_FALHAS = 5  # falhas consecutivas para abrir o circuito
+TEMPO_RECUPERACAO = 30.0  # segundos até testar a API novamente
+INTERVALO_SONDA = 1.0  # espera enquanto outra chamada testa a API
+PRAZO_ADIAMENTO = 15 * 60.0  # segundos que uma chamada pode ficar adiada antes de ser dada como falha
+
+
+class RetryPolicy:
+    """Backoff exponencial com jitter completo e prazo total por requisição."""
+
+    def __init__(self, max_tentativas=MAX_TENTATIVAS, atraso_base=ATRASO_BASE,
+                 atraso_maximo=ATRASO_MAXIMO, prazo_total=PRAZO_TOTAL, fator=2.0):
+        self.max_tentativas = max_tentativas
+        self.atraso_base = atraso_base
+        self.atraso_maximo = atraso_maximo
+        self.prazo_total = prazo_total
+        self.fator = fator
+
+    def atraso(self, tentativa):
+        """Tempo de espera após a tentativa informada (começando em 0)."""
+        teto = min(self.atraso_maximo, self.atraso_base * (self.fator ** tentativa))
+        return random.uniform(0, teto)
+
+    def tentativas(self, ao_aguardar=None, esperar=time.sleep, ja_aguardando=None):
+        """Gera os números das tentativas, aguardando o backoff entre elas.
+
+        Para antes de `max_tentativas` se a próxima espera ultrapassar o prazo total.
+        `ao_aguardar(segundos)` é chamado antes de cada espera, feita com `esperar(segundos)`.
+        `ja_aguardando()` informa quantos segundos a próxima chamada já vai esperar
+        por outro motivo (ex.: o limitador pausado por um Retry-After); o backoff
+        só espera o que passar disso, e a espera total é a maior das duas.
+        """
+        inicio = time.monotonic()
+        for tentativa in range(self.max_tentativas):
+            if tentativa > 0:
+                atraso = self.atraso(tentativa - 1)
+                pausa = ja_aguardando() if ja_aguardando else 0.0
+                if time.monotonic() - inicio + max(atraso, pausa) > self.prazo_total:
+                    return
+                if ao_aguardar:
+                    ao_aguardar(max(atraso, pausa))
+                if atraso > pausa:
+                    esperar(atraso - pausa)
+            yield tentativa
+
+
+class CircuitoAberto(Exception):
+    """A API está indisponível; a chamada deve ser adiada por `espera` segundos.
+
+    Quem adia a chamada desiste dela depois de `PRAZO_ADIAMENTO` segundos seguidos
+    de adiamentos, para que a execução termine mesmo com a API fora do ar.
+    """
+
+    def __init__(self, endpoint, espera):
+        super().__init__(f"Circuito aberto para {endpoint}. Nova tentativa em {espera:.0f} segundos.")
+        self.endpoint = endpoint
+        self.espera = espera
+
+
+class CircuitBreaker:
+    """Interrompe as chamadas a um endpoint após falhas consecutivas.
+
+    Fechado: as chamadas passam normalmente. Aberto: as chamadas falham na hora
+    com `CircuitoAberto`. Depois de `tempo_recuperacao` segundos uma única
+    chamada de sonda é liberada (meio aberto); se ela der certo o circuito fecha,
+    senão volta a abrir.
+    """
+
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(self, endpoint, limite_falhas=LIMITE_FALHAS, tempo_recuperacao=TEMPO_RECUPERACAO):
+        self.endpoint = endpoint
+        self.limite_falhas = limite_falhas
+        self.tempo_recuperacao = tempo_recuperacao
+        self.estado = self.FECHADO
+        self.falhas_consecutivas = 0
+        self.aberto_em = 0.0
+        self._lock = threading.Lock()
+
+    def verificar(self):
+        """Libera a chamada ou levanta `CircuitoAberto` se ela deve ser adiada."""
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return
+            agora = time.monotonic()
+            if self.estado == self.ABERTO:
+                restante = self.aberto_em + self.tempo_recuperacao - agora
+                if restante <= 0:
+                    # Libera esta chamada como sonda
+                    self.estado = self.MEIO_ABERTO
+                    return
+                raise CircuitoAberto(self.endpoint, restante)
+            # Meio aberto: outra chamada já está testando a API
+            raise CircuitoAberto(self.endpoint, INTERVALO_SONDA + random.uniform(0, INTERVALO_SONDA))
+
+    def registrar_sucesso(self):
+        """Registra uma chamada bem-sucedida; retorna True se o circuito acabou de fechar."""
+        with self._lock:
+            recuperado = self.estado != self.FECHADO
+            self.estado = self.FECHADO
+            self.falhas_consecutivas = 0
+            return recuperado
+
+    def registrar_falha(self):
+        """Registra uma chamada com falha; retorna True se o circuito acabou de abrir."""
+        with self._lock:
+            self.falhas_consecutivas += 1
+            if self.estado == self.MEIO_ABERTO or (
+                    self.estado == self.FECHADO and self.falhas_consecutivas >= self.limite_falhas):
+                self.estado = self.ABERTO
+                self.aberto_em = time.monotonic()
+                return True
+            return False
+
+
+_circuitos = {}
+_circuitos_lock = threading.Lock()
+
+
+def obter_circuito(url):
+    """Retorna o circuit breaker compartilhado do endpoint (host + caminho) da URL."""
+    partes = urlsplit(url)
+    endpoint = f"{partes.netloc}{partes.path}"
+    with _circuitos_lock:
+        if endpoint not in _circuitos:
+            _circuitos[endpoint] = CircuitBreaker(endpoint)
+        return _circuitos[endpoint]
+
+
+# Política de retentativa padrão das chamadas à API
+politica_retry = RetryPolicy()
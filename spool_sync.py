@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import uuid
+
+from doc_identity import calcular_digest
+from file_writer import EscritorArquivos, LoteGravacao
+from retry_policy import RetryPolicy
+
+# Diretório local onde os XMLs aguardam o envio ao servidor de arquivos (ao lado do banco de dados)
+DIRETORIO_SPOOL = "spool"
+# Documentos enviados ao servidor por lote
+TAMANHO_LOTE_SINCRONIZACAO = 200
+# Intervalo entre as sincronizações em segundo plano
+INTERVALO_SINCRONIZACAO = 30  # segundos
+
+# Retentativas da sincronização final, quando o servidor está momentaneamente inacessível
+POLITICA_SINCRONIZACAO = RetryPolicy(max_tentativas=6, atraso_base=2.0, atraso_maximo=60.0, prazo_total=300.0)
+
+_EXTENSAO_MANIFESTO = ".json"
+_EXTENSAO_CORROMPIDO = ".corrompido"
+
+
+class EscritorSpool(EscritorArquivos):
+    """Grava os XMLs em um diretório local, de onde são sincronizados com o servidor.
+
+    Cada documento vira um par de arquivos no spool: o XML e um manifesto JSON
+    com o diretório e o nome de destino, se o nome deve ser numerado e o digest
+    do conteúdo. O manifesto é gravado por último, de modo que só entram na
+    sincronização documentos completos. Para quem chama, a gravação termina
+    quando o documento está no disco local; o envio ao servidor fica com o
+    `SincronizadorSpool`.
+    """
+
+    etapa_metricas = "spool"
+
+    def __init__(self, diretorio_spool=DIRETORIO_SPOOL, **kwargs):
+        super().__init__(**kwargs)
+        self.diretorio_spool = diretorio_spool
+        os.makedirs(diretorio_spool, exist_ok=True)
+
+    def _gravar(self, diretorio, nome, conteudo, numerar):
+        identificador = uuid.uuid4().hex
+        caminho = os.path.join(self.diretorio_spool, f"{identificador}.xml")
+        with open(caminho, "wb") as arquivo:
+            arquivo.write(conteudo)
+
+        manifesto = {
+            "diretorio": diretorio,
+            "nome": nome,
+            "numerar": numerar,
+            "digest": calcular_digest(conteudo),
+            "tamanho": len(conteudo),
+            "tentativas": 0
+        }
+        _gravar_manifesto(os.path.join(self.diretorio_spool, identificador + _EXTENSAO_MANIFESTO), manifesto)
+        return caminho, False
+
+
+def _gravar_manifesto(caminho, manifesto):
+    temporario = f"{caminho}.tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+class SincronizadorSpool:
+    """Envia os documentos do spool ao servidor em lotes.
+
+    O envio usa o escritor de destino (arquivos soltos ou compactado), com a
+    mesma escolha de nome e detecção de cópias idênticas da gravação direta.
+    Depois de gravado o lote, os documentos são lidos de volta de uma vez (no
+    modo compactado, cada contêiner é aberto uma única vez) e o digest de cada
+    um é comparado com o do manifesto; só então os arquivos do spool são
+    removidos. Se algo falhar
+    no meio, o documento continua no spool e é enviado de novo na próxima
+    sincronização (nesta ou em outra execução); como o destino já terá uma cópia
+    idêntica, ela não é duplicada.
+    """
+
+    def __init__(self, destino, diretorio_spool=DIRETORIO_SPOOL,
+                 tamanho_lote=TAMANHO_LOTE_SINCRONIZACAO, intervalo=INTERVALO_SINCRONIZACAO):
+        self.destino = destino
+        self.diretorio_spool = diretorio_spool
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.sincronizados = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        os.makedirs(diretorio_spool, exist_ok=True)
+
+    @property
+    def duplicados(self):
+        """Documentos que o servidor já tinha com o mesmo conteúdo e não foram gravados de novo."""
+        return self.destino.duplicados
+
+    def pendentes(self):
+        """Lista os manifestos dos documentos que aguardam envio."""
+        with os.scandir(self.diretorio_spool) as entradas:
+            return sorted(entrada.path for entrada in entradas if entrada.name.endswith(_EXTENSAO_MANIFESTO))
+
+    def sincronizar(self):
+        """Envia todos os documentos pendentes, em lotes. Retorna quantos ficaram pendentes."""
+        with self._lock:
+            pendentes = self.pendentes()
+            restantes = 0
+            for inicio in range(0, len(pendentes), self.tamanho_lote):
+                restantes += self._sincronizar_lote(pendentes[inicio:inicio + self.tamanho_lote])
+            return restantes
+
+    def _sincronizar_lote(self, caminhos_manifesto):
+        lote = LoteGravacao()
+        restantes = 0
+        for caminho_manifesto in caminhos_manifesto:
+            caminho_xml = caminho_manifesto[:-len(_EXTENSAO_MANIFESTO)] + ".xml"
+            try:
+                with open(caminho_manifesto, encoding="utf-8") as arquivo:
+                    manifesto = json.load(arquivo)
+                with open(caminho_xml, "rb") as arquivo:
+                    conteudo = arquivo.read()
+            except (OSError, ValueError) as e:
+                print(f"❌ Erro ao ler {caminho_manifesto} do spool: {e}")
+                restantes += 1
+                continue
+
+            if calcular_digest(conteudo) != manifesto["digest"]:
+                # Cópia local danificada: separada para análise, não é enviada
+                print(f"❌ {caminho_xml} não confere com o manifesto. Separado como {_EXTENSAO_CORROMPIDO}.")
+                os.replace(caminho_manifesto, caminho_manifesto + _EXTENSAO_CORROMPIDO)
+                self.falhas += 1
+                continue
+
+            self.destino.enviar(manifesto["diretorio"], manifesto["nome"], conteudo, manifesto["numerar"],
+                                lote.ao_concluir((caminho_manifesto, caminho_xml, manifesto)))
+        lote.fechar()
+        # Fecha o lote no destino de uma vez (no modo compactado, um contêiner aberto uma única vez)
+        self.destino.aguardar()
+
+        resultados = lote.aguardar()
+        gravados = self.destino.digests_gravados([caminho for _, caminho, erro in resultados if erro is None])
+        for (caminho_manifesto, caminho_xml, manifesto), caminho, erro in resultados:
+            if erro is None:
+                digest = gravados[caminho]
+                if isinstance(digest, Exception):
+                    erro = digest
+                elif digest != manifesto["digest"]:
+                    erro = "conteúdo gravado não confere com o spool"
+
+            if erro is None:
+                # O manifesto sai primeiro: um XML sem manifesto é só lixo, nunca um envio repetido
+                os.remove(caminho_manifesto)
+                os.remove(caminho_xml)
+                self.sincronizados += 1
+            else:
+                manifesto["tentativas"] += 1
+                _gravar_manifesto(caminho_manifesto, manifesto)
+                print(f"⚠️ Falha ao enviar {manifesto['nome']} para {manifesto['diretorio']} "
+                      f"(tentativa {manifesto['tentativas']}): {erro}")
+                self.falhas += 1
+                restantes += 1
+        return restantes
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.sincronizar()
+            except Exception as e:
+                print(f"❌ Erro na sincronização do spool: {e}")
+
+    def iniciar(self):
+        """Começa a sincronizar periodicamente em segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._executar, name="sincronizacao-spool", daemon=True)
+            self._thread.start()
+
+    def fechar(self, politica=POLITICA_SINCRONIZACAO):
+        """Para a sincronização periódica e faz o envio final, com retentativas.
+
+        Documentos que ainda assim não puderem ser enviados ficam no spool para a próxima execução.
+        """
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        restantes = 0
+        for tentativa in politica.tentativas(
+                ao_aguardar=lambda s: print(f"⏳ {restantes} XMLs ainda no spool. Nova tentativa em {s:.0f} segundos...")):
+            try:
+                restantes = self.sincronizar()
+            except OSError as e:
+                print(f"❌ Erro na sincronização do spool: {e}")
+                restantes = len(self.pendentes())
+            if restantes == 0:
+                break
+        self.destino.fechar()
+        return restantes
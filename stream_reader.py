@@ -0,0 +1,182 @@
+import json
+import time
+from collections import namedtuple
+
+from parse_pool import EstagioAnalise
+from metrics import metricas
+
+# Tamanho dos blocos lidos do socket
+TAMANHO_BLOCO = 64 * 1024
+# Documentos que o snapshot provavelmente conhece, confirmados juntos no banco
+LOTE_CONFIRMACAO = 16
+
+_ESPACOS = b" \t\r\n"
+
+# Documento recebido em uma página. `conteudo` traz os bytes do XML, ou None quando `conhecido`
+# indica que o banco confirmou que o documento já foi baixado.
+# `metadados` é None, com a mensagem em `erro`, se o XML não pôde ser lido
+DocumentoRecebido = namedtuple("DocumentoRecebido", ["indice", "conteudo", "identidade", "metadados", "erro",
+                                                     "conhecido"])
+
+
+class RespostaIncompleta(ValueError):
+    """A resposta terminou antes do fim da lista "xmls"."""
+
+
+def iterar_xmls(blocos, chave=b'"xmls"'):
+    """Gera, um a um, os elementos da lista `chave` de uma resposta JSON recebida em blocos.
+
+    Cada elemento é devolvido em bytes (base64) assim que termina de chegar, sem
+    carregar a resposta inteira. Outras chaves do objeto são ignoradas, e uma
+    lista `null` não gera nenhum elemento.
+    """
+    buffer = bytearray()
+    posicao = 0
+    na_lista = False
+
+    for bloco in blocos:
+        buffer += bloco
+
+        if not na_lista:
+            inicio = buffer.find(chave)
+            if inicio < 0:
+                # Mantém o final do buffer, caso a chave tenha sido cortada entre blocos
+                del buffer[:max(0, len(buffer) - len(chave))]
+                continue
+            # Depois de ":" vem o "[" que abre a lista, ou null quando não há XMLs
+            del buffer[:inicio]
+            resto = bytes(buffer[len(chave):]).lstrip(_ESPACOS)
+            if not resto:
+                continue
+            if resto[:1] != b":":
+                raise ValueError(f"JSON inesperado após {chave.decode()}")
+            valor = resto[1:].lstrip(_ESPACOS)
+            if valor[:1] == b"[":
+                posicao = len(buffer) - len(valor) + 1
+                na_lista = True
+            elif len(valor) < len(b"null") and b"null".startswith(valor):
+                continue
+            elif valor.startswith(b"null"):
+                return
+            else:
+                raise ValueError(f"JSON inesperado após {chave.decode()}")
+
+        while True:
+            while posicao < len(buffer) and buffer[posicao] in _ESPACOS + b",":
+                posicao += 1
+            if posicao >= len(buffer):
+                break
+            if buffer[posicao] == ord("]"):
+                return
+            if buffer[posicao] != ord('"'):
+                raise ValueError("Elemento inesperado na lista de XMLs")
+
+            # Procura a aspa de fechamento que não esteja escapada
+            fim = posicao + 1
+            while True:
+                fim = buffer.find(b'"', fim)
+                if fim < 0:
+                    break
+                barras = 0
+                while buffer[fim - 1 - barras] == ord("\\"):
+                    barras += 1
+                if barras % 2 == 0:
+                    break
+                fim += 1
+            if fim < 0:
+                break
+
+            # Uma única cópia, direto do buffer de recepção
+            with memoryview(buffer) as visao:
+                elemento = bytes(visao[posicao + 1:fim])
+            if b"\\" in elemento:
+                # Base64 pode vir com "\/" escapado
+                elemento = json.loads(b'"' + elemento + b'"').encode("ascii")
+            posicao = fim + 1
+            yield elemento
+
+        # Descarta o que já foi consumido
+        del buffer[:posicao]
+        posicao = 0
+
+    if na_lista:
+        raise RespostaIncompleta("A resposta terminou antes do fim da lista de XMLs")
+    # Sem a lista, a resposta só vale como página vazia se o objeto JSON chegou inteiro
+    if not bytes(buffer).rstrip(_ESPACOS).endswith(b"}"):
+        raise RespostaIncompleta("A resposta terminou antes do fim do objeto JSON")
+
+
+def _ler_medindo(blocos, cnpj="", tipo=""):
+    """Repassa os blocos da resposta, medindo na etapa `download` só o tempo de espera pela rede."""
+    segundos = 0.0
+    tamanho = 0
+    erro = True
+    iterador = iter(blocos)
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                bloco = next(iterador)
+            except StopIteration:
+                erro = False
+                return
+            finally:
+                segundos += time.perf_counter() - inicio
+            tamanho += len(bloco)
+            yield bloco
+    except GeneratorExit:
+        # Quem lê parou de pedir blocos (fim da lista de XMLs): não é erro de rede
+        erro = False
+        raise
+    finally:
+        metricas.registrar("download", segundos, cnpj=cnpj, tipo=tipo, tamanho=tamanho, erro=erro)
+
+
+def receber_documentos(response, config, snapshot=None, estagio=None, tamanho_bloco=TAMANHO_BLOCO,
+                       lote_confirmacao=LOTE_CONFIRMACAO, cnpj="", tipo=""):
+    """Lê a página da resposta em streaming, decodificando e analisando cada XML.
+
+    `config` é a tupla (namespace, tag do número, tag do tipo) do tipo de documento.
+    A análise é feita pelo `estagio` (um `EstagioAnalise`) enquanto a resposta
+    ainda está chegando; sem ele, é feita na própria thread. Os documentos que
+    o snapshot provavelmente conhece são confirmados no banco em lotes de
+    `lote_confirmacao`, ainda durante a leitura, e os confirmados perdem os
+    bytes: só os documentos novos, que serão gravados, ficam em memória com a
+    página. Um falso positivo do snapshot (registro removido pela limpeza)
+    segue como documento novo. O XML é mantido nos bytes originais, sem
+    decodificação para texto.
+
+    A leitura da rede entra nas métricas como `download` e a análise de cada lote
+    como `extracao`, separadas por `cnpj` e `tipo`.
+    """
+    if estagio is None:
+        estagio = EstagioAnalise(processos=0)
+    documentos = []
+    a_confirmar = []
+
+    def confirmar():
+        conhecidas = snapshot.confirmar_conhecidos([documentos[posicao].identidade.chave for posicao in a_confirmar])
+        for posicao in a_confirmar:
+            if documentos[posicao].identidade.chave in conhecidas:
+                documentos[posicao] = documentos[posicao]._replace(conteudo=None, conhecido=True)
+        a_confirmar.clear()
+
+    def medir_analise(segundos, resultados):
+        metricas.registrar("extracao", segundos, cnpj=cnpj, tipo=tipo, itens=len(resultados),
+                           tamanho=sum(len(resultado.conteudo) for resultado in resultados))
+
+    leitura = _ler_medindo(response.iter_content(chunk_size=tamanho_bloco), cnpj, tipo)
+    try:
+        payloads = iterar_xmls(leitura)
+        for indice, analisado in enumerate(estagio.analisar(payloads, config, medir_analise), 1):
+            documentos.append(DocumentoRecebido(indice, analisado.conteudo, analisado.identidade,
+                                                analisado.metadados, analisado.erro, False))
+            if snapshot is not None and snapshot.provavelmente_conhecido(analisado.identidade.chave):
+                a_confirmar.append(len(documentos) - 1)
+                if len(a_confirmar) >= lote_confirmacao:
+                    confirmar()
+    finally:
+        leitura.close()
+    if a_confirmar:
+        confirmar()
+    return documentos
@@ -0,0 +1,81 @@
+from datetime import date
+
+import pytest
+
+from checkpoint_store import CheckpointStore
+from db_manager import DatabaseManager
+from query_planner import TAMANHO_PAGINA
+
+CNPJ = "12345678000199"
+DIA = "2025-01-10"
+HOJE = date(2025, 3, 1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = DatabaseManager(str(tmp_path / "xml_database.db"))
+    yield banco
+    banco.fechar()
+
+
+def _progresso(db):
+    return db.obter_checkpoints(CNPJ, 1, DIA, DIA).get(DIA)
+
+
+def test_progresso_avanca_so_sobre_paginas_continuas(db):
+    store = CheckpointStore(db)
+    [unidade] = store.planejar(CNPJ, DIA, DIA, [1], hoje=HOJE)
+    segunda = unidade._replace(skip=TAMANHO_PAGINA)
+    terceira = unidade._replace(skip=2 * TAMANHO_PAGINA)
+
+    # Páginas posteriores terminando antes da primeira não contam
+    store.pagina_concluida(terceira, 10)
+    store.pagina_concluida(segunda, TAMANHO_PAGINA)
+    assert _progresso(db) is None
+
+    # Com a primeira, a sequência fica contínua até a última página, que estava incompleta
+    store.pagina_concluida(unidade, TAMANHO_PAGINA)
+    assert _progresso(db) == (3, 2 * TAMANHO_PAGINA + 10, 2 * TAMANHO_PAGINA, True)
+
+
+def test_pagina_faltando_no_meio_segura_o_progresso(db):
+    store = CheckpointStore(db)
+    [unidade] = store.planejar(CNPJ, DIA, DIA, [1], hoje=HOJE)
+    store.pagina_concluida(unidade, TAMANHO_PAGINA)
+    store.pagina_concluida(unidade._replace(skip=2 * TAMANHO_PAGINA), 10)
+    assert _progresso(db) == (1, TAMANHO_PAGINA, 0, False)
+
+    # A próxima execução consulta a data de novo a partir da página que faltou
+    assert CheckpointStore(db).planejar(CNPJ, DIA, DIA, [1], hoje=HOJE) == [unidade]
+
+
+def test_data_concluida_nao_e_planejada_de_novo(db):
+    store = CheckpointStore(db)
+    [unidade] = store.planejar(CNPJ, DIA, DIA, [1], hoje=HOJE)
+    store.pagina_concluida(unidade, 7)
+    assert _progresso(db) == (1, 7, 0, True)
+    assert CheckpointStore(db).planejar(CNPJ, DIA, DIA, [1], hoje=HOJE) == []
+
+
+def test_retomada_a_partir_do_ultimo_skip(db):
+    store = CheckpointStore(db)
+    [unidade] = store.planejar(CNPJ, DIA, DIA, [1], hoje=HOJE)
+    store.pagina_concluida(unidade, TAMANHO_PAGINA)
+    store.pagina_concluida(unidade._replace(skip=TAMANHO_PAGINA), TAMANHO_PAGINA)
+
+    nova = CheckpointStore(db)
+    [retomada] = nova.planejar(CNPJ, DIA, DIA, [1], hoje=HOJE)
+    assert retomada.skip == TAMANHO_PAGINA
+    nova.pagina_concluida(retomada._replace(skip=2 * TAMANHO_PAGINA), 5)
+    assert _progresso(db) == (2, 2 * TAMANHO_PAGINA, TAMANHO_PAGINA, False)
+    nova.pagina_concluida(retomada, TAMANHO_PAGINA)
+    assert _progresso(db) == (3, 2 * TAMANHO_PAGINA + 5, 2 * TAMANHO_PAGINA, True)
+
+
+def test_periodo_de_varios_dias_nao_registra_quantidade(db):
+    store = CheckpointStore(db)
+    [unidade] = store.planejar(CNPJ, "2025-01-01", "2025-01-03", [1], hoje=HOJE)
+    store.pagina_concluida(unidade, 12)
+    pontos = db.obter_checkpoints(CNPJ, 1, "2025-01-01", "2025-01-03")
+    assert sorted(pontos) == ["2025-01-01", "2025-01-02", "2025-01-03"]
+    assert set(pontos.values()) == {(1, None, 0, True)}
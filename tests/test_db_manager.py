@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from db_manager import MIGRACOES, DatabaseManager
+
+
+@pytest.fixture
+def caminho(tmp_path):
+    return str(tmp_path / "xml_database.db")
+
+
+def _versao(caminho):
+    with sqlite3.connect(caminho) as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _indices(db):
+    return {linha[1] for linha in db.conn.execute("PRAGMA index_list(xml_hashes)")}
+
+
+def test_banco_novo_recebe_todas_as_migracoes(caminho):
+    db = DatabaseManager(caminho)
+    try:
+        colunas = {linha[1] for linha in db.conn.execute("PRAGMA table_info(xml_hashes)")}
+        assert {"chave", "hash", "cnpj", "numero_nota", "data_processamento"} <= colunas
+        assert {"idx_xml_hashes_cnpj_nota", "idx_xml_hashes_data", "idx_xml_hashes_hash"} <= _indices(db)
+        assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        db.fechar()
+    assert _versao(caminho) == MIGRACOES[-1][0]
+
+
+def test_banco_da_versao_antiga_e_migrado_mantendo_os_registros(caminho):
+    # Esquema do Robos/db_manager.py: sem numero_nota e com o hash() do Python como chave
+    with sqlite3.connect(caminho) as conn:
+        conn.execute("CREATE TABLE xml_hashes (hash TEXT PRIMARY KEY, cnpj TEXT, "
+                     "data_processamento TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("INSERT INTO xml_hashes (hash, cnpj) VALUES ('-123', '12345678000199')")
+
+    db = DatabaseManager(caminho)
+    try:
+        linhas = db.conn.execute("SELECT chave, hash, cnpj, numero_nota FROM xml_hashes").fetchall()
+        assert linhas == [("legado:-123", None, "12345678000199", None)]
+        assert db.registrar_xmls([("d" * 64, "12345678000199", "10", "3" * 44)]) == 1
+        assert db.filtrar_documentos_existentes(["3" * 44, "4" * 44]) == {"3" * 44}
+    finally:
+        db.fechar()
+    assert _versao(caminho) == MIGRACOES[-1][0]
+
+
+def test_migracoes_nao_sao_reaplicadas(caminho):
+    DatabaseManager(caminho).fechar()
+    db = DatabaseManager(caminho)
+    try:
+        db.registrar_xmls([("d" * 64, "12345678000199", "10", "3" * 44)])
+    finally:
+        db.fechar()
+    db = DatabaseManager(caminho)
+    try:
+        assert db.contar_registros() == 1
+    finally:
+        db.fechar()
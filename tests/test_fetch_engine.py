@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from db_manager import DatabaseManager
+from fetch_engine import FetchEngine
+from job_journal import CONCLUIDA, EM_ANDAMENTO, FALHOU, JobJournal, PENDENTE
+from query_planner import TAMANHO_PAGINA, UnidadeTrabalho
+from retry_policy import CircuitoAberto
+
+CNPJ = "12345678000199"
+DIA = "2025-01-10"
+
+
+@pytest.fixture
+def jornada(tmp_path):
+    banco = DatabaseManager(str(tmp_path / "xml_database.db"))
+    jornada = JobJournal(banco, "cli")
+    yield jornada
+    banco.fechar()
+
+
+def _unidade(skip):
+    return UnidadeTrabalho(CNPJ, DIA, DIA, 1, skip)
+
+
+def _engine(jornada, paginas, **kwargs):
+    """Engine com uma API falsa: `paginas` é a quantidade de XMLs de cada skip."""
+    processadas = []
+
+    def buscar(unidade):
+        return ["xml"] * paginas.get(unidade.skip, 0)
+
+    def processar(unidade, xmls):
+        processadas.append(unidade.skip)
+        jornada.registrar(unidade, CONCLUIDA)
+
+    engine = FetchEngine(buscar, processar, jornada=jornada, **kwargs)
+    return engine, processadas
+
+
+def test_paginas_antecipadas_alem_do_fim_sao_descartadas(jornada):
+    jornada.nova_execucao([_unidade(0)])
+    paginas = {0: TAMANHO_PAGINA, 50: TAMANHO_PAGINA, 100: 10}
+    engine, processadas = _engine(jornada, paginas, paginas_antecipadas=3)
+
+    assert engine.executar([_unidade(0)]) == 3
+    assert sorted(processadas) == [0, 50, 100]
+    resumo = jornada.resumo()
+    assert resumo[CONCLUIDA] == 3
+    assert resumo[PENDENTE] == 0 and resumo[EM_ANDAMENTO] == 0
+
+
+def test_busca_cancelada_antes_de_comecar_sai_da_jornada(jornada):
+    # A página 100 veio incompleta no mesmo instante em que a 150 acabou de ser agendada:
+    # a tarefa da 150 é cancelada antes de executar qualquer código
+    jornada.nova_execucao([])
+    engine, processadas = _engine(jornada, {})
+
+    async def cenario():
+        engine._preparar()
+        try:
+            engine._agendar(_unidade(150), nova=True)
+            assert jornada.resumo()[PENDENTE] == 1
+            engine._encerrar_sequencia(_unidade(100))
+            await engine._aguardar_tarefas()
+        finally:
+            engine._executor.shutdown(wait=True)
+
+    asyncio.run(cenario())
+    assert processadas == []
+    assert engine.paginas_descartadas == 1
+    assert jornada.resumo()[PENDENTE] == 0
+
+
+def test_unidade_adiada_alem_do_prazo_falha(jornada):
+    jornada.nova_execucao([_unidade(0)])
+    chamadas = []
+
+    def buscar(unidade):
+        chamadas.append(unidade.skip)
+        raise CircuitoAberto("api.sieg.com", 0.01)
+
+    engine = FetchEngine(buscar, lambda unidade, xmls: None, jornada=jornada, prazo_adiamento=0.05)
+    assert engine.executar([_unidade(0)]) == 0
+
+    assert len(chamadas) > 1
+    assert (engine.unidades_adiadas, engine.falhas) == (1, 1)
+    assert jornada.resumo()[FALHOU] == 1
@@ -0,0 +1,128 @@
+import os
+import threading
+
+import pytest
+
+from file_writer import EscritorArquivos, LoteGravacao
+
+
+@pytest.fixture
+def escritor():
+    escritor = EscritorArquivos(threads=4)
+    yield escritor
+    escritor.fechar()
+
+
+def _conteudo(caminho):
+    with open(caminho, "rb") as arquivo:
+        return arquivo.read()
+
+
+def test_grava_em_segundo_plano_sem_temporarios(escritor, tmp_path):
+    diretorio = str(tmp_path / "saida" / "2025" / "Janeiro")
+    concluidos = []
+    for numero in range(20):
+        escritor.enviar(diretorio, f"{numero}.xml", b"<nfe>%d</nfe>" % numero,
+                        ao_concluir=lambda caminho, erro: concluidos.append((caminho, erro)))
+    escritor.aguardar()
+
+    assert len(concluidos) == 20 and all(erro is None for _, erro in concluidos)
+    assert sorted(os.listdir(diretorio)) == sorted(f"{numero}.xml" for numero in range(20))
+    assert _conteudo(os.path.join(diretorio, "7.xml")) == b"<nfe>7</nfe>"
+    assert escritor.gravados == 20
+
+
+def test_sem_numerar_substitui_o_existente(escritor, tmp_path):
+    escritor.enviar(str(tmp_path), "1.xml", b"antigo")
+    escritor.aguardar()
+    escritor.enviar(str(tmp_path), "1.xml", b"novo")
+    escritor.aguardar()
+    assert os.listdir(tmp_path) == ["1.xml"]
+    assert _conteudo(tmp_path / "1.xml") == b"novo"
+
+
+def test_falha_na_gravacao_chega_ao_callback(escritor, tmp_path):
+    # Um arquivo no lugar do diretório impede a gravação
+    bloqueio = tmp_path / "bloqueio"
+    bloqueio.write_bytes(b"")
+    erros = []
+    escritor.enviar(str(bloqueio), "1.xml", b"x", ao_concluir=lambda caminho, erro: erros.append(erro))
+    escritor.aguardar()
+    assert len(erros) == 1 and erros[0] is not None
+    assert escritor.falhas == 1
+
+
+def test_lote_termina_depois_da_ultima_gravacao(escritor, tmp_path):
+    terminado = threading.Event()
+    lote = LoteGravacao(ao_terminar=lambda resultados: terminado.set())
+    for numero in range(5):
+        escritor.enviar(str(tmp_path), f"{numero}.xml", b"x", ao_concluir=lote.ao_concluir(numero))
+    lote.fechar()
+
+    resultados = lote.aguardar()
+    assert terminado.is_set()
+    assert sorted(dados for dados, _, _ in resultados) == list(range(5))
+    assert all(erro is None and os.path.exists(caminho) for _, caminho, erro in resultados)
+
+
+def test_lote_vazio_termina_ao_fechar():
+    resultados = []
+    lote = LoteGravacao(ao_terminar=resultados.append)
+    lote.fechar()
+    assert lote.aguardar() == [] and resultados == [[]]
+
+
+def test_numerar_escolhe_o_proximo_sufixo_livre(escritor, tmp_path):
+    (tmp_path / "1.xml").write_bytes(b"primeiro")
+    caminhos = []
+    for versao in (b"segundo", b"terceiro"):
+        escritor.enviar(str(tmp_path), "1.xml", versao, numerar=True,
+                        ao_concluir=lambda caminho, erro: caminhos.append(caminho))
+        escritor.aguardar()
+
+    assert [os.path.basename(caminho) for caminho in caminhos] == ["1_1.xml", "1_2.xml"]
+    assert _conteudo(tmp_path / "1.xml") == b"primeiro"
+    assert _conteudo(tmp_path / "1_2.xml") == b"terceiro"
+
+
+def test_arquivo_criado_depois_da_listagem_nao_e_substituido(escritor, tmp_path):
+    escritor.enviar(str(tmp_path), "1.xml", b"primeiro", numerar=True)
+    escritor.aguardar()
+    # Outro programa grava o próximo nome sem que o índice em memória saiba
+    (tmp_path / "1_1.xml").write_bytes(b"de outro programa")
+
+    caminhos = []
+    escritor.enviar(str(tmp_path), "1.xml", b"segundo", numerar=True,
+                    ao_concluir=lambda caminho, erro: caminhos.append(caminho))
+    escritor.aguardar()
+
+    assert os.path.basename(caminhos[0]) == "1_2.xml"
+    assert _conteudo(tmp_path / "1_1.xml") == b"de outro programa"
+    assert _conteudo(tmp_path / "1_2.xml") == b"segundo"
+
+
+def test_copia_identica_nao_e_gravada(escritor, tmp_path):
+    (tmp_path / "1.xml").write_bytes(b"primeiro")
+    (tmp_path / "1_1.xml").write_bytes(b"segundo")
+
+    caminhos = []
+    for versao in (b"segundo", b"primeiro", b"terceiro", b"terceiro"):
+        escritor.enviar(str(tmp_path), "1.xml", versao, numerar=True,
+                        ao_concluir=lambda caminho, erro: caminhos.append(os.path.basename(caminho)))
+        escritor.aguardar()
+
+    assert caminhos == ["1_1.xml", "1.xml", "1_2.xml", "1_2.xml"]
+    assert sorted(os.listdir(tmp_path)) == ["1.xml", "1_1.xml", "1_2.xml"]
+    assert (escritor.gravados, escritor.duplicados) == (1, 3)
+
+
+def test_copias_identicas_simultaneas_gravam_um_arquivo(tmp_path):
+    escritor = EscritorArquivos(threads=8)
+    try:
+        for _ in range(16):
+            escritor.enviar(str(tmp_path), "1.xml", b"mesmo conteudo", numerar=True)
+        escritor.aguardar()
+    finally:
+        escritor.fechar()
+    assert os.listdir(tmp_path) == ["1.xml"]
+    assert (escritor.gravados, escritor.duplicados) == (1, 15)
@@ -0,0 +1,69 @@
+import pytest
+
+from db_manager import DatabaseManager
+from job_journal import CONCLUIDA, EM_ANDAMENTO, FALHOU, JobJournal, PENDENTE
+from query_planner import UnidadeTrabalho
+
+CNPJ = "12345678000199"
+
+
+@pytest.fixture
+def db(tmp_path):
+    banco = DatabaseManager(str(tmp_path / "xml_database.db"))
+    yield banco
+    banco.fechar()
+
+
+def _unidade(skip, xml_type=1):
+    return UnidadeTrabalho(CNPJ, "2025-01-10", "2025-01-10", xml_type, skip)
+
+
+def test_retomar_devolve_o_que_nao_terminou(db):
+    jornada = JobJournal(db, "cli")
+    jornada.nova_execucao([_unidade(0), _unidade(0, 2)])
+    jornada.registrar(_unidade(0), CONCLUIDA)
+    jornada.registrar(_unidade(50), PENDENTE)
+    jornada.registrar(_unidade(0, 2), EM_ANDAMENTO)
+
+    # Uma nova instância, como na próxima execução do script
+    retomada = JobJournal(db, "cli")
+    assert retomada.retomar() == [_unidade(0, 2), _unidade(50)]
+    assert retomada.execucao == jornada.execucao
+    assert retomada.ja_concluida(_unidade(0))
+
+
+def test_execucao_sem_pendencias_nao_e_retomada(db):
+    jornada = JobJournal(db, "cli")
+    jornada.nova_execucao([_unidade(0)])
+    jornada.registrar(_unidade(0), CONCLUIDA)
+
+    retomada = JobJournal(db, "cli")
+    assert retomada.retomar() == []
+    assert retomada.execucao is None
+
+
+def test_reabrir_falhas(db):
+    jornada = JobJournal(db, "cli")
+    jornada.nova_execucao([_unidade(0), _unidade(50)])
+    jornada.registrar(_unidade(0), CONCLUIDA)
+    jornada.registrar(_unidade(50), FALHOU, "falha na requisição à API")
+
+    reaberta = JobJournal(db, "cli")
+    assert reaberta.reabrir_falhas() == [_unidade(50)]
+    assert reaberta.resumo() == {PENDENTE: 1, EM_ANDAMENTO: 0, CONCLUIDA: 1, FALHOU: 0}
+
+
+def test_descartar_e_origens_separadas(db):
+    cli = JobJournal(db, "cli")
+    cli.nova_execucao([_unidade(0), _unidade(50)])
+    cli.descartar(_unidade(50))
+    assert cli.resumo()[PENDENTE] == 1
+
+    # A interface não vê as execuções do script
+    assert JobJournal(db, "interface").retomar() == []
+
+
+def test_sem_execucao_aberta_nada_e_gravado(db):
+    jornada = JobJournal(db, "interface")
+    jornada.registrar(_unidade(0), PENDENTE)
+    assert db.ultima_execucao("interface") is None
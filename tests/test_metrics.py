@@ -0,0 +1,81 @@
+import base64
+import json
+
+import pytest
+
+from metrics import Histograma, Metricas, metricas
+from stream_reader import receber_documentos
+
+
+def test_percentil_pelo_limite_do_balde():
+    histograma = Histograma(limites=(0.1, 1.0))
+    for segundos in (0.05, 0.05, 0.5, 3.0):
+        histograma.observar(segundos)
+    assert histograma.baldes == [2, 1, 1]
+    assert histograma.percentil(0.5) == 0.1
+    assert histograma.percentil(0.75) == 1.0
+    # O balde +Inf devolve a máxima observada
+    assert histograma.percentil(1.0) == 3.0
+
+
+def test_medir_conta_erros_e_ignora_excecoes_adiadas():
+    medidas = Metricas()
+    with medidas.medir("api", cnpj="1", tipo="NFE") as medicao:
+        medicao.bytes = 10
+    with pytest.raises(RuntimeError):
+        with medidas.medir("api", cnpj="1", tipo="NFE"):
+            raise RuntimeError("falhou")
+    with pytest.raises(KeyError):
+        with medidas.medir("api", cnpj="1", tipo="NFE", ignorar=KeyError):
+            raise KeyError("adiada")
+
+    etapa = medidas.resumo()["etapas"]["api"]
+    assert (etapa["chamadas"], etapa["erros"], etapa["bytes"]) == (2, 1, 10)
+
+
+def test_cronometrar_usa_o_nome_da_funcao():
+    medidas = Metricas()
+
+    @medidas.cronometrar("banco")
+    def registrar_xmls():
+        return 3
+
+    assert registrar_xmls() == 3
+    assert [(serie["etapa"], serie["operacao"]) for serie in medidas.resumo()["series"]] == [("banco", "registrar_xmls")]
+
+
+def test_exportar_prometheus_e_json(tmp_path):
+    medidas = Metricas()
+    medidas.registrar("salvar", 0.02, cnpj="123", tipo="CTE", tamanho=100)
+    caminho_prometheus, caminho_json = medidas.exportar("cli", str(tmp_path))
+
+    texto = open(caminho_prometheus, encoding="utf-8").read()
+    assert 'aut_nfe_duracao_segundos_bucket{etapa="salvar",cnpj="123",tipo="CTE",le="0.025"} 1' in texto
+    assert 'aut_nfe_bytes_total{etapa="salvar",cnpj="123",tipo="CTE"} 100' in texto
+    resumo = json.load(open(caminho_json, encoding="utf-8"))
+    assert resumo["etapas"]["salvar"]["itens"] == 1
+
+
+class _RespostaFalsa:
+    def __init__(self, corpo):
+        self.corpo = corpo
+
+    def iter_content(self, chunk_size):
+        for inicio in range(0, len(self.corpo), chunk_size):
+            yield self.corpo[inicio:inicio + chunk_size]
+
+
+def test_leitura_da_rede_e_analise_em_etapas_separadas():
+    metricas.zerar()
+    xmls = [b"<NFe>" + bytes([n]) * 300 + b"</NFe>" for n in range(1, 4)]
+    corpo = b'{"xmls": [' + b", ".join(b'"' + base64.b64encode(xml) + b'"' for xml in xmls) + b"]}"
+
+    receber_documentos(_RespostaFalsa(corpo), ("urn:teste", "nNF", "tpNF"), tamanho_bloco=64, cnpj="123", tipo="NFE")
+
+    etapas = metricas.resumo()["etapas"]
+    assert etapas["download"]["chamadas"] == 1
+    assert etapas["download"]["bytes"] == len(corpo)
+    assert etapas["download"]["erros"] == 0
+    assert etapas["extracao"]["itens"] == len(xmls)
+    assert etapas["extracao"]["bytes"] == sum(len(xml) for xml in xmls)
+    metricas.zerar()
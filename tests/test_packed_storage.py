@@ -0,0 +1,89 @@
+import os
+import zipfile
+
+import pytest
+
+from packed_storage import EscritorCompactado, exportar, ler_documento
+
+
+@pytest.fixture
+def escritor():
+    escritor = EscritorCompactado(threads=2, espera_lote=0.05)
+    yield escritor
+    escritor.fechar()
+
+
+def _enviar(escritor, diretorio, nome, conteudo, numerar=True):
+    resultado = {}
+    escritor.enviar(diretorio, nome, conteudo, numerar=numerar,
+                    ao_concluir=lambda caminho, erro: resultado.update(caminho=caminho, erro=erro))
+    return resultado
+
+
+def test_lote_gravado_em_um_unico_conteiner(tmp_path, escritor):
+    diretorio = str(tmp_path / "entrada" / "2025" / "Janeiro")
+    resultados = [_enviar(escritor, diretorio, f"{n}.xml", b"<xml>%d</xml>" % n) for n in range(20)]
+    escritor.aguardar()
+
+    container = diretorio + ".zip"
+    with zipfile.ZipFile(container) as arquivo_zip:
+        assert arquivo_zip.testzip() is None
+        assert len(arquivo_zip.namelist()) == 20
+    assert all(resultado["erro"] is None for resultado in resultados)
+    assert escritor.ler(resultados[3]["caminho"]) == b"<xml>3</xml>"
+    # Nenhum temporário fica para trás
+    assert sorted(os.listdir(tmp_path / "entrada" / "2025")) == ["Janeiro.zip"]
+
+
+def test_numeracao_e_copias_identicas(tmp_path, escritor):
+    diretorio = str(tmp_path / "Janeiro")
+    primeiro = _enviar(escritor, diretorio, "10.xml", b"a")
+    escritor.aguardar()
+    outro = _enviar(escritor, diretorio, "10.xml", b"b")
+    repetido = _enviar(escritor, diretorio, "10.xml", b"a")
+    escritor.aguardar()
+
+    assert os.path.basename(primeiro["caminho"]) == "10.xml"
+    assert os.path.basename(outro["caminho"]) == "10_1.xml"
+    assert repetido["caminho"] == primeiro["caminho"]
+    assert (escritor.gravados, escritor.duplicados) == (2, 1)
+
+
+def test_queda_no_meio_do_lote_preserva_o_conteiner(tmp_path, escritor, monkeypatch):
+    diretorio = str(tmp_path / "Janeiro")
+    _enviar(escritor, diretorio, "1.xml", b"primeiro")
+    escritor.aguardar()
+    container = diretorio + ".zip"
+    antes = open(container, "rb").read()
+
+    gravar = zipfile.ZipFile.writestr
+
+    def cair(arquivo_zip, nome, conteudo, *args, **kwargs):
+        if nome == "3.xml":
+            raise OSError("conexão com o servidor perdida")
+        return gravar(arquivo_zip, nome, conteudo, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "writestr", cair)
+    resultados = [_enviar(escritor, diretorio, f"{n}.xml", b"x") for n in (2, 3)]
+    escritor.aguardar()
+
+    # Nenhum documento do lote é dado como gravado e o contêiner anterior continua inteiro
+    assert all(isinstance(resultado["erro"], OSError) for resultado in resultados)
+    assert open(container, "rb").read() == antes
+    assert ler_documento(container, "1.xml") == b"primeiro"
+    assert os.listdir(tmp_path) == ["Janeiro.zip"]
+
+    monkeypatch.setattr(zipfile.ZipFile, "writestr", gravar)
+    _enviar(escritor, diretorio, "2.xml", b"x")
+    escritor.aguardar()
+    with zipfile.ZipFile(container) as arquivo_zip:
+        assert sorted(arquivo_zip.namelist()) == ["1.xml", "2.xml"]
+
+
+def test_exportar_recria_os_arquivos_soltos(tmp_path, escritor):
+    origem = tmp_path / "origem"
+    _enviar(escritor, str(origem / "saida" / "2025" / "Janeiro" / "123"), "7.xml", b"<x/>")
+    escritor.aguardar()
+
+    assert exportar(str(origem), str(tmp_path / "destino")) == 1
+    assert (tmp_path / "destino" / "saida" / "2025" / "Janeiro" / "123" / "7.xml").read_bytes() == b"<x/>"
@@ -0,0 +1,62 @@
+from query_planner import (TAMANHO_PAGINA, UnidadeTrabalho, dias_do_periodo, dividir_janela,
+                           planejar_unidades, proximas_unidades)
+
+CNPJ = "12345678000199"
+
+
+def test_dividir_janela_em_metades():
+    assert dividir_janela("2025-01-01", "2025-01-10") == [("2025-01-01", "2025-01-05"), ("2025-01-06", "2025-01-10")]
+    assert dividir_janela("2025-01-01", "2025-01-02") == [("2025-01-01", "2025-01-01"), ("2025-01-02", "2025-01-02")]
+    assert dividir_janela("2025-02-27", "2025-03-02") == [("2025-02-27", "2025-02-28"), ("2025-03-01", "2025-03-02")]
+
+
+def test_pagina_incompleta_encerra_a_consulta():
+    unidade = UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-10", 1, 0)
+    assert proximas_unidades(unidade, TAMANHO_PAGINA - 1) == []
+
+
+def test_pagina_cheia_de_varios_dias_divide_o_periodo():
+    unidade = UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-10", 1, 0)
+    assert proximas_unidades(unidade, TAMANHO_PAGINA) == [
+        UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-05", 1, 0),
+        UnidadeTrabalho(CNPJ, "2025-01-06", "2025-01-10", 1, 0),
+    ]
+
+
+def test_pagina_cheia_de_um_dia_segue_para_a_proxima_pagina():
+    unidade = UnidadeTrabalho(CNPJ, "2025-01-03", "2025-01-03", 2, 50)
+    assert proximas_unidades(unidade, TAMANHO_PAGINA) == [UnidadeTrabalho(CNPJ, "2025-01-03", "2025-01-03", 2, 100)]
+
+
+def test_divisao_recursiva_cobre_cada_dia_uma_unica_vez():
+    pendentes = [UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-07", 1, 0)]
+    dias = []
+    while pendentes:
+        unidade = pendentes.pop()
+        if unidade.data_inicio == unidade.data_fim:
+            dias.append(unidade.data_inicio)
+            continue
+        pendentes.extend(proximas_unidades(unidade, TAMANHO_PAGINA))
+    assert sorted(dias) == dias_do_periodo("2025-01-01", "2025-01-07")
+
+
+def test_planejamento_sem_checkpoints():
+    assert planejar_unidades(CNPJ, "2025-01-01", "2025-01-05", [1, 2]) == [
+        UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-05", 1, 0),
+        UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-05", 2, 0),
+    ]
+
+
+def test_planejamento_com_checkpoints():
+    checkpoints = {1: {
+        "2025-01-02": (1, 10, 0, True),     # concluída: pulada
+        "2025-01-03": (3, 150, 100, False),  # várias páginas lidas: retomada sozinha do último skip
+        "2025-01-04": (1, 50, 0, False),     # só a primeira página: consultada do início
+        "2025-01-05": (1, 3, 0, True),       # concluída, mas dentro da janela de atraso
+    }}
+    unidades = planejar_unidades(CNPJ, "2025-01-01", "2025-01-06", [1], checkpoints, inicio_reconsulta="2025-01-05")
+    assert unidades == [
+        UnidadeTrabalho(CNPJ, "2025-01-01", "2025-01-01", 1, 0),
+        UnidadeTrabalho(CNPJ, "2025-01-03", "2025-01-03", 1, 100),
+        UnidadeTrabalho(CNPJ, "2025-01-04", "2025-01-06", 1, 0),
+    ]
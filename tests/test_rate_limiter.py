@@ -0,0 +1,64 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import TokenBucket, tempo_retry_after
+
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.esperas.append(round(segundos, 6))
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = _Relogio()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", relogio.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", relogio.sleep)
+    return relogio
+
+
+def test_requisicoes_respeitam_a_taxa(relogio):
+    balde = TokenBucket(requisicoes_por_minuto=30)
+    for _ in range(3):
+        balde.adquirir()
+    # O primeiro token já está no balde; os seguintes chegam a cada 2 segundos
+    assert relogio.esperas == [2.0, 2.0]
+
+
+def test_pausa_libera_uma_chamada_no_fim_do_retry_after(relogio):
+    balde = TokenBucket(requisicoes_por_minuto=30)
+    balde.adquirir()
+    balde.pausar(10)
+    assert balde.pausa_restante() == 10
+    balde.adquirir()
+    assert relogio.esperas == [10.0]
+    assert balde.pausa_restante() == 0
+    balde.adquirir()
+    assert relogio.esperas == [10.0, 2.0]
+
+
+def test_pausa_mais_curta_nao_encurta_a_atual(relogio):
+    balde = TokenBucket()
+    balde.pausar(30)
+    balde.pausar(5)
+    assert balde.pausa_restante() == 30
+
+
+class _Resposta:
+    def __init__(self, retry_after=None):
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+def test_tempo_retry_after():
+    assert tempo_retry_after(_Resposta()) is None
+    assert tempo_retry_after(_Resposta("12")) == 12.0
+    assert tempo_retry_after(_Resposta("Wed, 21 Oct 2015 07:28:00 GMT")) == 0.0
+    assert tempo_retry_after(_Resposta("amanhã")) is None
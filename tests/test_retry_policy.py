@@ -0,0 +1,72 @@
+import pytest
+
+import retry_policy
+from retry_policy import CircuitBreaker, CircuitoAberto, RetryPolicy
+
+
+def test_tentativas_com_backoff_entre_elas():
+    politica = RetryPolicy(max_tentativas=4, atraso_base=1.0, atraso_maximo=3.0, prazo_total=1000)
+    esperas = []
+    assert list(politica.tentativas(esperar=esperas.append)) == [0, 1, 2, 3]
+    # Jitter completo: cada espera fica entre 0 e o teto exponencial da tentativa
+    assert len(esperas) == 3
+    for espera, teto in zip(esperas, (1.0, 2.0, 3.0)):
+        assert 0 <= espera <= teto
+
+
+def test_prazo_total_interrompe_as_tentativas(monkeypatch):
+    relogio = [0.0]
+    monkeypatch.setattr(retry_policy.time, "monotonic", lambda: relogio[0])
+    politica = RetryPolicy(max_tentativas=10, prazo_total=12.0)
+    monkeypatch.setattr(politica, "atraso", lambda tentativa: 5.0)
+
+    def esperar(segundos):
+        relogio[0] += segundos
+
+    # A terceira espera passaria do prazo de 12 segundos
+    assert list(politica.tentativas(esperar=esperar)) == [0, 1, 2]
+
+
+def test_circuito_abre_apos_falhas_consecutivas():
+    circuito = CircuitBreaker("api", limite_falhas=3, tempo_recuperacao=60)
+    assert [circuito.registrar_falha() for _ in range(3)] == [False, False, True]
+    with pytest.raises(CircuitoAberto) as erro:
+        circuito.verificar()
+    assert 0 < erro.value.espera <= 60
+
+
+def test_sucesso_zera_as_falhas():
+    circuito = CircuitBreaker("api", limite_falhas=2)
+    circuito.registrar_falha()
+    assert circuito.registrar_sucesso() is False
+    assert circuito.registrar_falha() is False
+    circuito.verificar()
+
+
+def test_sonda_fecha_ou_reabre_o_circuito():
+    circuito = CircuitBreaker("api", limite_falhas=1, tempo_recuperacao=0)
+    circuito.registrar_falha()
+    # Passado o tempo de recuperação, uma única chamada é liberada como sonda
+    circuito.verificar()
+    assert circuito.estado == CircuitBreaker.MEIO_ABERTO
+    with pytest.raises(CircuitoAberto):
+        circuito.verificar()
+    # Sonda com falha: o circuito volta a abrir
+    assert circuito.registrar_falha() is True
+    circuito.verificar()
+    assert circuito.registrar_sucesso() is True
+    assert circuito.estado == CircuitBreaker.FECHADO
+
+
+def test_backoff_se_sobrepoe_a_pausa_do_limitador(monkeypatch):
+    politica = RetryPolicy(max_tentativas=3, prazo_total=1000)
+    monkeypatch.setattr(politica, "atraso", lambda tentativa: 5.0)
+    pausas = iter([10.0, 2.0])
+    esperas, avisos = [], []
+
+    tentativas = politica.tentativas(ao_aguardar=avisos.append, esperar=esperas.append,
+                                     ja_aguardando=lambda: next(pausas))
+    assert list(tentativas) == [0, 1, 2]
+    # Com o Retry-After maior que o backoff não há espera extra; com ele menor, só a diferença
+    assert esperas == [3.0]
+    assert avisos == [10.0, 5.0]
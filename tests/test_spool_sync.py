@@ -0,0 +1,75 @@
+import os
+import zipfile
+
+import pytest
+
+from file_writer import EscritorArquivos
+from packed_storage import EscritorCompactado
+from spool_sync import EscritorSpool, SincronizadorSpool
+
+
+def _gravar_no_spool(spool, documentos):
+    escritor = EscritorSpool(str(spool), threads=2)
+    for diretorio, nome, conteudo in documentos:
+        escritor.enviar(diretorio, nome, conteudo, numerar=True)
+    escritor.fechar()
+    return escritor
+
+
+@pytest.mark.parametrize("destino", [EscritorArquivos, EscritorCompactado])
+def test_sincroniza_e_esvazia_o_spool(tmp_path, destino):
+    servidor = str(tmp_path / "servidor" / "Janeiro")
+    _gravar_no_spool(tmp_path / "spool", [(servidor, f"{n}.xml", b"<xml>%d</xml>" % n) for n in range(5)])
+    sincronizador = SincronizadorSpool(destino(threads=2), str(tmp_path / "spool"))
+
+    assert sincronizador.fechar() == 0
+    assert sincronizador.sincronizados == 5
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_copias_identicas_contadas_no_envio(tmp_path):
+    servidor = str(tmp_path / "servidor" / "Janeiro")
+    os.makedirs(servidor)
+    with open(os.path.join(servidor, "1.xml"), "wb") as arquivo:
+        arquivo.write(b"igual")
+    escritor = _gravar_no_spool(tmp_path / "spool", [(servidor, "1.xml", b"igual"), (servidor, "2.xml", b"novo")])
+    # O spool não conhece o servidor: as cópias idênticas só aparecem no envio
+    assert (escritor.gravados, escritor.duplicados) == (2, 0)
+
+    sincronizador = SincronizadorSpool(EscritorArquivos(threads=2), str(tmp_path / "spool"))
+    sincronizador.fechar()
+    assert (sincronizador.sincronizados, sincronizador.duplicados) == (2, 1)
+    assert sorted(os.listdir(servidor)) == ["1.xml", "2.xml"]
+
+
+def test_conferencia_abre_cada_conteiner_uma_vez(tmp_path, monkeypatch):
+    servidor = str(tmp_path / "servidor" / "Janeiro")
+    _gravar_no_spool(tmp_path / "spool", [(servidor, f"{n}.xml", b"<xml>%d</xml>" % n) for n in range(30)])
+    destino = EscritorCompactado(threads=2)
+    monkeypatch.setattr(destino, "ler", lambda caminho: pytest.fail("documento conferido um a um"))
+    aberturas = []
+    abrir = zipfile.ZipFile.__init__
+
+    def contar(arquivo_zip, arquivo, modo="r", *args, **kwargs):
+        if modo == "r":
+            aberturas.append(arquivo)
+        abrir(arquivo_zip, arquivo, modo, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "__init__", contar)
+    sincronizador = SincronizadorSpool(destino, str(tmp_path / "spool"), tamanho_lote=30)
+
+    assert sincronizador.fechar() == 0
+    assert aberturas == [servidor + ".zip"]
+
+
+def test_xml_danificado_no_spool_nao_e_enviado(tmp_path):
+    servidor = str(tmp_path / "servidor" / "Janeiro")
+    _gravar_no_spool(tmp_path / "spool", [(servidor, "1.xml", b"original")])
+    xml = next(nome for nome in os.listdir(tmp_path / "spool") if nome.endswith(".xml"))
+    (tmp_path / "spool" / xml).write_bytes(b"danificado")
+
+    sincronizador = SincronizadorSpool(EscritorArquivos(threads=2), str(tmp_path / "spool"))
+    assert sincronizador.fechar() == 0
+    assert (sincronizador.sincronizados, sincronizador.falhas) == (0, 1)
+    assert any(nome.endswith(".corrompido") for nome in os.listdir(tmp_path / "spool"))
+    assert not os.path.exists(servidor)
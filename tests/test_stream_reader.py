@@ -0,0 +1,130 @@
+import base64
+
+import pytest
+
+from doc_identity import identificar_documento
+from stream_reader import RespostaIncompleta, iterar_xmls, receber_documentos
+
+
+def _em_blocos(dados, tamanho):
+    return [dados[i:i + tamanho] for i in range(0, len(dados), tamanho)]
+
+
+def _resposta(elementos, antes=b'{"total": 2, ', depois=b', "erros": ["x"]}'):
+    lista = b", ".join(b'"' + elemento + b'"' for elemento in elementos)
+    return antes + b'"xmls" : [' + lista + b"]" + depois
+
+
+XMLS = [base64.b64encode(b"<NFe>" + bytes([n]) * 300 + b"</NFe>") for n in range(1, 4)]
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 5, 7, 64, 4096])
+def test_elementos_cortados_entre_blocos(tamanho):
+    resposta = _resposta(XMLS)
+    assert list(iterar_xmls(_em_blocos(resposta, tamanho))) == XMLS
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 3, 5, 64])
+def test_barras_escapadas_cortadas_entre_blocos(tamanho):
+    # Base64 com "/" escapado como "\/", como alguns serializadores enviam
+    elementos = [b"ab/cd/+/==", b"////", b"x/"]
+    escapados = [elemento.replace(b"/", b"\\/") for elemento in elementos]
+    resposta = _resposta(escapados)
+    assert list(iterar_xmls(_em_blocos(resposta, tamanho))) == elementos
+
+
+@pytest.mark.parametrize("tamanho", [1, 3, 64])
+def test_aspa_escapada_nao_fecha_o_elemento(tamanho):
+    resposta = _resposta([b'a\\"b', b"c\\\\"])
+    assert list(iterar_xmls(_em_blocos(resposta, tamanho))) == [b'a"b', b"c\\"]
+
+
+def test_chave_cortada_entre_blocos():
+    resposta = b'{"outra": "' + b"y" * 100 + b'", "xmls": ["QQ=="]}'
+    corte = resposta.index(b'"xmls"') + 3
+    assert list(iterar_xmls([resposta[:corte], resposta[corte:]])) == [b"QQ=="]
+
+
+def test_lista_vazia():
+    assert list(iterar_xmls([b'{"xmls": []}'])) == []
+
+
+@pytest.mark.parametrize("tamanho", [1, 2, 64])
+def test_lista_nula(tamanho):
+    resposta = b'{"xmls": null, "erros": ["Nenhum arquivo"]}'
+    assert list(iterar_xmls(_em_blocos(resposta, tamanho))) == []
+
+
+def test_resposta_sem_a_chave():
+    assert list(iterar_xmls([b'{"erros": ["x"]}\n'])) == []
+
+
+@pytest.mark.parametrize("resposta", [b"", b'{"erros": ["x"', b'{"xmls": nu'])
+def test_resposta_truncada_sem_a_lista(resposta):
+    with pytest.raises(RespostaIncompleta):
+        list(iterar_xmls(_em_blocos(resposta, 4)))
+
+
+@pytest.mark.parametrize("corte", [-2, -3, -10, 20, 5])
+def test_resposta_truncada(corte):
+    # Termina antes do "]" que fecha a lista, inclusive antes de ela começar (o "}" final não importa)
+    resposta = _resposta(XMLS, depois=b"}")
+    with pytest.raises(RespostaIncompleta):
+        list(iterar_xmls(_em_blocos(resposta[:corte], 16)))
+
+
+def test_resposta_truncada_entrega_os_elementos_completos_antes_do_erro():
+    resposta = _resposta(XMLS, depois=b"}")
+    corte = resposta.index(XMLS[2]) + 10
+    recebidos = []
+    with pytest.raises(RespostaIncompleta):
+        for elemento in iterar_xmls(_em_blocos(resposta[:corte], 16)):
+            recebidos.append(elemento)
+    assert recebidos == XMLS[:2]
+
+
+@pytest.mark.parametrize("resposta", [b'{"xmls": 5}', b'{"xmls" "x"}', b'{"xmls": [1]}'])
+def test_json_inesperado(resposta):
+    with pytest.raises(ValueError):
+        list(iterar_xmls([resposta]))
+
+
+class _RespostaFalsa:
+    def __init__(self, corpo):
+        self.corpo = corpo
+
+    def iter_content(self, chunk_size):
+        return iter(_em_blocos(self.corpo, chunk_size))
+
+
+class _SnapshotFalso:
+    """Conhece `provaveis`; o banco confirma apenas `confirmadas`."""
+
+    def __init__(self, provaveis, confirmadas):
+        self.provaveis = provaveis
+        self.confirmadas = confirmadas
+        self.consultas = []
+
+    def provavelmente_conhecido(self, chave):
+        return chave in self.provaveis
+
+    def confirmar_conhecidos(self, chaves):
+        self.consultas.append(list(chaves))
+        return {chave for chave in chaves if chave in self.confirmadas}
+
+
+def test_documentos_confirmados_no_banco_perdem_os_bytes():
+    xmls = [b"<NFe>" + bytes([n]) * 300 + b"</NFe>" for n in range(1, 6)]
+    chaves = [identificar_documento(xml).chave for xml in xmls]
+    # O documento 2 é um falso positivo do snapshot: o banco não o conhece
+    snapshot = _SnapshotFalso(provaveis={chaves[0], chaves[1], chaves[3]}, confirmadas={chaves[0], chaves[3]})
+    resposta = _RespostaFalsa(_resposta([base64.b64encode(xml) for xml in xmls]))
+
+    documentos = receber_documentos(resposta, ("urn:teste", "nNF", "tpNF"), snapshot,
+                                    tamanho_bloco=7, lote_confirmacao=2)
+
+    assert [doc.indice for doc in documentos] == [1, 2, 3, 4, 5]
+    assert [doc.conhecido for doc in documentos] == [True, False, False, True, False]
+    assert [doc.conteudo for doc in documentos] == [None, xmls[1], xmls[2], None, xmls[4]]
+    # A confirmação é feita em lotes, enquanto a resposta chega
+    assert snapshot.consultas == [chaves[:2], chaves[3:4]]
@@ -0,0 +1,75 @@
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+# Tamanho dos trechos entregues ao parser incremental
+TAMANHO_TRECHO = 8 * 1024
+
+# Metadados compactos de um documento, já com os valores padrão aplicados.
+# `tipo` é o código do XML ("0", "1") ou None; a tradução fica com quem usa
+MetadadosDocumento = namedtuple("MetadadosDocumento", ["ano", "mes", "cnpj_emit", "numero", "tipo"])
+
+
+class ExtratorMetadados:
+    """Extrai em uma única passada os campos usados para organizar um XML.
+
+    Os nomes qualificados das tags são montados uma vez, a partir da configuração
+    do tipo de documento. O XML é entregue aos poucos a um parser incremental e
+    a leitura para assim que todos os campos foram encontrados; como `ide` e
+    `emit` vêm antes dos itens (`det`), a lista de produtos nem chega a ser lida.
+    Cada campo recebe a primeira ocorrência no documento, como em `find(".//...")`.
+    """
+
+    def __init__(self, namespace, numero_tag, tipo_tag):
+        ns = f"{{{namespace}}}"
+        # Tag qualificada -> campo, para os campos buscados em qualquer nível
+        self._campos = {
+            f"{ns}dhEmi": "dh_emi",
+            f"{ns}{numero_tag}": "numero",
+            f"{ns}{tipo_tag}": "tipo",
+        }
+        # CNPJ do emitente: apenas o filho direto de emit
+        self._tag_emit = f"{ns}emit"
+        self._tag_cnpj = f"{ns}CNPJ"
+        self._total_campos = len(self._campos) + 1
+
+    def extrair(self, conteudo):
+        """Retorna {"dh_emi", "cnpj_emit", "numero", "tipo"} com o texto de cada campo (ou None).
+
+        `conteudo` pode ser bytes, memoryview ou str. Os bytes são lidos sem cópia, e a
+        codificação é a declarada no próprio XML. Levanta `ET.ParseError` se o XML for
+        inválido antes de todos os campos serem encontrados.
+        """
+        if isinstance(conteudo, (bytes, bytearray)):
+            conteudo = memoryview(conteudo)
+        encontrados = {"dh_emi": None, "cnpj_emit": None, "numero": None, "tipo": None}
+        vistos = set()
+        parser = ET.XMLPullParser(events=("start", "end"))
+        pilha = []
+
+        for inicio in range(0, len(conteudo), TAMANHO_TRECHO):
+            parser.feed(conteudo[inicio:inicio + TAMANHO_TRECHO])
+            for evento, elemento in parser.read_events():
+                if evento == "start":
+                    pilha.append(elemento.tag)
+                    continue
+
+                tag = pilha.pop()
+                campo = self._campos.get(tag)
+                if campo is None and tag == self._tag_cnpj and pilha and pilha[-1] == self._tag_emit:
+                    campo = "cnpj_emit"
+                if campo is not None and campo not in vistos:
+                    vistos.add(campo)
+                    encontrados[campo] = elemento.text
+                    if len(vistos) == self._total_campos:
+                        return encontrados
+
+        parser.close()
+        return encontrados
+
+    def metadados(self, conteudo):
+        """Extrai os campos e devolve um `MetadadosDocumento`."""
+        campos = self.extrair(conteudo)
+        data_emissao = campos["dh_emi"][:10] if campos["dh_emi"] is not None else "0000-00-00"
+        ano, mes, _ = data_emissao.split("-")
+        cnpj_emit = campos["cnpj_emit"] if campos["cnpj_emit"] is not None else "00000000000000"
+        return MetadadosDocumento(ano, mes, cnpj_emit, campos["numero"], campos["tipo"])